@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""Deterministic synthetic datasets for the benchmarks (same seed -> same files).
+
+  perf.db                  trades (+ OPEN/CLOSE rows in events) across engines
+  state/events.jsonl       webhook events, same shape as /tv writes them
+  state/risk_config.json   sizing config for the bench engines
+  candles.json             Bitget-style candle rows (served by the bench stub)
+
+Usage:
+  python3 bench/datagen.py --out /tmp/bench-100k --trades 100000
+  python3 bench/datagen.py --out /tmp/bench-1m --trades 1000000 --events 200000
+"""
+import os
+import sys
+import json
+import math
+import random
+import sqlite3
+import argparse
+import pathlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+ENGINES = ("COINM_SHORT", "USDTM_LONG", "GOLD_CFD_LONG", "SCALP_TEST")
+SYMBOLS = {
+    "COINM_SHORT": ("BTCUSD", 40000.0),
+    "USDTM_LONG": ("ETHUSDT", 2500.0),
+    "GOLD_CFD_LONG": ("XAUUSD", 2000.0),
+    "SCALP_TEST": ("SOLUSDT", 100.0),
+}
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+OPEN_RATIO = 0.01  # last trades of each engine stay OPEN
+CHUNK = 20000
+DATA_VERSION = 3  # bump when the generated data or perf.db schema changes (invalidates cached sets)
+
+
+def _walk(rng: random.Random, px: float) -> float:
+    return max(px * 0.2, px * (1.0 + rng.gauss(0.0, 0.004)))
+
+
+def gen_perf_db(path: pathlib.Path, n: int, seed: int = 1) -> Dict[str, Any]:
+    """n trades spread over ENGINES, ~1 min apart, with an OPEN and a CLOSE event each."""
+    if path.exists():
+        path.unlink()
+    os.environ["PERF_DB_PATH"] = str(path)
+    sys.path.append(str(ROOT / "perf"))
+    import perf_app
+    perf_app.DB_PATH = str(path)
+    perf_app.init_db()
+
+    rng = random.Random(seed)
+    px = {e: SYMBOLS[e][1] for e in ENGINES}
+    n_open = int(n * OPEN_RATIO)
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=OFF")
+    trades: List[tuple] = []
+    events: List[tuple] = []
+    closed = 0
+
+    def flush():
+        con.executemany(
+            "INSERT INTO trades(trade_id,engine,symbol,side,entry_ts,entry,stop,qty,risk_usd,exit_ts,exit,status,pnl_real,r_real)"
+            " VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?)", trades)
+        con.executemany(
+            "INSERT INTO events(id,ts,type,engine,symbol,trade_id,payload) VALUES(?,?,?,?,?,?,?)", events)
+        con.commit()
+        trades.clear()
+        events.clear()
+
+    for i in range(n):
+        e = ENGINES[i % len(ENGINES)] if rng.random() < 0.7 else rng.choice(ENGINES)
+        sym = SYMBOLS[e][0]
+        px[e] = entry = round(_walk(rng, px[e]), 2)
+        side = "SHORT" if e == "COINM_SHORT" or rng.random() < 0.3 else "LONG"
+        dist = entry * rng.uniform(0.002, 0.01)
+        stop = round(entry + dist if side == "SHORT" else entry - dist, 2)
+        risk = rng.choice((25.0, 50.0, 100.0))
+        qty = round(risk / abs(entry - stop), 6)
+        risk = round(qty * abs(entry - stop), 6)
+        entry_dt = T0 + timedelta(minutes=i, seconds=rng.randint(0, 59))
+        tid = f"T_BENCH_{i:08d}"
+        events.append((f"E_{i:08d}o", entry_dt.isoformat(), "OPEN", e, sym, tid,
+                       json.dumps({"type": "OPEN", "engine": e, "symbol": sym, "side": side, "entry": entry,
+                                   "stop": stop, "qty": qty, "risk_usd": risk, "trade_id": tid})))
+        if i >= n - n_open:
+            trades.append((tid, e, sym, side, entry_dt.isoformat(), entry, stop, qty, risk, None, None, "OPEN", 0.0, 0.0))
+        else:
+            # outcome in R: stop-outs, small scratches and a fat right tail
+            u = rng.random()
+            r = -1.0 if u < 0.45 else (rng.uniform(-0.3, 0.5) if u < 0.65 else rng.expovariate(0.6))
+            move = r * abs(entry - stop)
+            exit_px = round(entry + move if side == "LONG" else entry - move, 2)
+            pnl = (exit_px - entry) * qty if side == "LONG" else (entry - exit_px) * qty
+            r_real = pnl / risk if risk else 0.0
+            # holding times overlap, so exit_ts order differs from entry order
+            exit_dt = entry_dt + timedelta(minutes=rng.expovariate(1 / 90.0))
+            trades.append((tid, e, sym, side, entry_dt.isoformat(), entry, stop, qty, risk,
+                           exit_dt.isoformat(), exit_px, "CLOSED", pnl, r_real))
+            events.append((f"E_{i:08d}c", exit_dt.isoformat(), "CLOSE", e, sym, tid,
+                           json.dumps({"type": "CLOSE", "trade_id": tid, "exit": exit_px})))
+            closed += 1
+        if len(trades) >= CHUNK:
+            flush()
+    flush()
+    con.close()
+    # trades were bulk-inserted behind perf_app's back: derive its tables once
+    with perf_app.tx() as c:
+        perf_app.rebuild_derived(c)
+    c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return {"trades": n, "closed": closed, "open": n - closed, "engines": list(ENGINES)}
+
+
+def gen_events(state_dir: pathlib.Path, n: int, seed: int = 2, end: Optional[datetime] = None) -> Dict[str, Any]:
+    """n webhook events 5 s apart ending at `end`, in state_dir/events.jsonl (no idx: the log rebuilds it)."""
+    state_dir.mkdir(parents=True, exist_ok=True)
+    for f in ("events.jsonl", "events.idx"):
+        (state_dir / f).unlink(missing_ok=True)
+    rng = random.Random(seed)
+    px = {e: SYMBOLS[e][1] for e in ENGINES}
+    end = end or T0 + timedelta(seconds=5 * n)
+    start = end - timedelta(seconds=5 * n)
+    with (state_dir / "events.jsonl").open("w", encoding="utf-8") as f:
+        for i in range(n):
+            e = rng.choice(ENGINES)
+            px[e] = price = round(_walk(rng, px[e]), 2)
+            signal = "SELL" if e == "COINM_SHORT" or rng.random() < 0.4 else "BUY"
+            dist = round(price * rng.uniform(0.002, 0.01), 2)
+            sl = price + dist if signal == "SELL" else price - dist
+            tp = price - 2 * dist if signal == "SELL" else price + 2 * dist
+            qty = round(100.0 / dist, 3)
+            evt = {
+                "key": None, "engine": e, "signal": signal, "symbol": SYMBOLS[e][0],
+                "tf": rng.choice(("5", "15", "60")), "price": price, "tp": round(tp, 2), "sl": round(sl, 2),
+                "reason": "bench", "_ts": (start + timedelta(seconds=5 * i)).isoformat(), "_ip": "127.0.0.1",
+                "qty": qty, "risk_usd": 100.0, "risk_real_usd": round(qty * dist, 6),
+            }
+            f.write(json.dumps(evt, ensure_ascii=False) + "\n")
+    return {"events": n, "end": end.isoformat()}
+
+
+def gen_risk_config(state_dir: pathlib.Path) -> None:
+    cfg = {
+        "accounts": {e: {"equity_usd": 10000, "risk_pct": 1, "min_qty": 0.001, "qty_step": 0.001} for e in ENGINES},
+        "gold_cfd": {"units_are_oz": True},
+    }
+    cfg["accounts"]["GOLD_CFD_LONG"].update({"min_units": 0.1, "units_step": 0.1})
+    state_dir.mkdir(parents=True, exist_ok=True)
+    (state_dir / "risk_config.json").write_text(json.dumps(cfg, indent=2), encoding="utf-8")
+
+
+def gen_candles(path: pathlib.Path, n: int, tf_sec: int = 60, seed: int = 3, price: float = 40000.0) -> Dict[str, Any]:
+    """n candles, oldest first, in Bitget row format (strings): ts, o, h, l, c, baseVol, quoteVol."""
+    rng = random.Random(seed)
+    t0 = int(T0.timestamp() * 1000)
+    rows: List[List[str]] = []
+    c = price
+    for i in range(n):
+        o = c
+        c = _walk(rng, o)
+        h = max(o, c) * (1 + abs(rng.gauss(0, 0.001)))
+        lo = min(o, c) * (1 - abs(rng.gauss(0, 0.001)))
+        vol = rng.lognormvariate(math.log(50), 0.8)
+        rows.append([str(t0 + i * tf_sec * 1000), f"{o:.2f}", f"{h:.2f}", f"{lo:.2f}", f"{c:.2f}",
+                     f"{vol:.4f}", f"{vol * c:.2f}"])
+    path.write_text(json.dumps(rows), encoding="utf-8")
+    return {"candles": n, "tf_sec": tf_sec}
+
+
+def generate(out: pathlib.Path, trades: int, events: int, candles: int, seed: int = 1, anchor: str = "") -> Dict[str, Any]:
+    """Build every dataset under out/ and write out/manifest.json (skipped if already identical).
+
+    anchor: ISO end time of the events log ("" = fixed epoch, "now" = generation time, so
+    /api/metrics windows see recent events; only the `_ts` values depend on it)."""
+    want = {"version": DATA_VERSION, "trades": trades, "events": events, "candles": candles, "seed": seed, "anchor": anchor}
+    mf = out / "manifest.json"
+    try:
+        have = json.loads(mf.read_text(encoding="utf-8"))
+        if {k: have.get(k) for k in want} == want:
+            return have
+    except (OSError, ValueError):
+        pass
+    out.mkdir(parents=True, exist_ok=True)
+    mf.unlink(missing_ok=True)
+    info: Dict[str, Any] = dict(want)
+    info["perf"] = gen_perf_db(out / "perf.db", trades, seed)
+    end = None
+    if anchor == "now":
+        end = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    elif anchor:
+        end = datetime.fromisoformat(anchor.replace("Z", "+00:00"))
+    info["events_log"] = gen_events(out / "state", events, seed + 1, end)
+    gen_risk_config(out / "state")
+    info["candles_file"] = gen_candles(out / "candles.json", candles, seed=seed + 2)
+    mf.write_text(json.dumps(info, indent=2), encoding="utf-8")
+    return info
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate deterministic benchmark datasets")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--trades", type=int, default=10000)
+    ap.add_argument("--events", type=int, help="default: same as --trades")
+    ap.add_argument("--candles", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--anchor", default="", help='end time of the events log: ISO, "now", or empty for a fixed epoch')
+    args = ap.parse_args()
+    info = generate(pathlib.Path(args.out), args.trades,
+                    args.events if args.events is not None else args.trades, args.candles, args.seed, args.anchor)
+    print(json.dumps(info, indent=2))
+
+
+if __name__ == "__main__":
+    main()
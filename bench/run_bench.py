@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""Benchmark suite: hot functions of webhook_server / perf_app on synthetic data.
+
+For each dataset size (datagen.py, cached under --data-dir) a worker process runs
+on a private copy of the data (TRADING_BASE_DIR / PERF_DB_PATH point into a temp
+dir, nothing touches /opt/trading) with a local stub service standing in for
+perf, Telegram and Bitget. Results go to --out as JSON and are compared with
+--baseline when it exists: a case is flagged when its p50 is more than
+--tolerance slower (and the gap is above --min-delta-ms).
+
+Examples:
+  python3 bench/run_bench.py                          # 10k + 100k, compare with bench/baseline.json
+  python3 bench/run_bench.py --sizes 1M --only kpis,equity_series,perf_trades
+  python3 bench/run_bench.py --save-baseline          # store this run as the baseline
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import contextlib
+import socket
+import argparse
+import pathlib
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit, parse_qs
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.append(str(BENCH_DIR))
+import datagen
+
+BENCH_KEY = "bench"
+
+
+# -------------------- Stub services --------------------
+class Stub:
+    """One local HTTP server for everything the services call out to:
+    POST /perf/event, POST /bot<token>/sendMessage, GET /api/v2/mix/market/candles."""
+
+    def __init__(self, candles: List[List[str]]):
+        self.candles = candles
+        self.counts = {"perf": 0, "telegram": 0, "candles": 0}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real upstreams
+
+            def log_message(self, *a):
+                pass
+
+            def _reply(self, obj: Any, code: int = 200) -> None:
+                body = json.dumps(obj).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path.startswith("/perf/event"):
+                    stub.hit("perf")
+                    return self._reply({"ok": True, "event_id": "E_stub", "trade_id": "T_stub"})
+                if self.path.endswith("/sendMessage"):
+                    stub.hit("telegram")
+                    return self._reply({"ok": True, "result": {}})
+                self._reply({"detail": "not found"}, 404)
+
+            def do_GET(self):
+                u = urlsplit(self.path)
+                if u.path == "/api/v2/mix/market/candles":
+                    stub.hit("candles")
+                    limit = int((parse_qs(u.query).get("limit") or ["200"])[0])
+                    return self._reply({"code": "00000", "msg": "success", "data": stub.candles[-limit:]})
+                self._reply({"detail": "not found"}, 404)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, name="bench-stub", daemon=True).start()
+
+    def hit(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def wait(self, name: str, n: int, timeout: float) -> bool:
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            if self.counts[name] >= n:
+                return True
+            time.sleep(0.002)
+        return False
+
+
+# -------------------- Timing --------------------
+def _pct(xs: List[float], p: float) -> float:
+    return xs[min(len(xs) - 1, int(p * len(xs)))]
+
+def summarize(samples_s: List[float], ops: int = 1) -> Dict[str, Any]:
+    xs = sorted(samples_s)
+    p50 = _pct(xs, 0.5) * 1000.0
+    out = {
+        "n": len(xs),
+        "ops": ops,
+        "ms_min": round(xs[0] * 1000.0, 4),
+        "ms_p50": round(p50, 4),
+        "ms_p90": round(_pct(xs, 0.9) * 1000.0, 4),
+        "ms_p99": round(_pct(xs, 0.99) * 1000.0, 4),
+        "ms_max": round(xs[-1] * 1000.0, 4),
+    }
+    if ops > 1:
+        out["us_per_op_p50"] = round(p50 * 1000.0 / ops, 4)
+    return out
+
+def bench(fn: Callable[[], Any], reps: int, budget_s: float, ops: int = 1, warmup: int = 1) -> Dict[str, Any]:
+    """Run fn up to `reps` times (at least 3) within ~budget_s after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    end = time.perf_counter() + budget_s
+    while len(samples) < reps and (len(samples) < 3 or time.perf_counter() < end):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, ops)
+
+
+# -------------------- Worker (one dataset) --------------------
+def run_worker(data: pathlib.Path, args) -> Dict[str, Any]:
+    work = pathlib.Path(tempfile.mkdtemp(prefix="magik-bench-"))
+    try:
+        shutil.copy2(data / "perf.db", work / "perf.db")
+        shutil.copytree(data / "state", work / "state")
+        return _run_cases(work, data, args)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+def _run_cases(work: pathlib.Path, data: pathlib.Path, args) -> Dict[str, Any]:
+    manifest = json.loads((data / "manifest.json").read_text(encoding="utf-8"))
+    stub = Stub(json.loads((data / "candles.json").read_text(encoding="utf-8")))
+
+    # env is read at import time by both services
+    os.environ.update({
+        "TRADING_BASE_DIR": str(work),
+        "PERF_DB_PATH": str(work / "perf.db"),
+        "PERF_URL": stub.url + "/perf/event",
+        "PERF_INPROCESS": "0",
+        "PERF_OUTBOX_POLL_S": "0.05",
+        "TV_WEBHOOK_KEY": BENCH_KEY,
+        "TV_RATE_ENGINE": "0", "TV_RATE_SYMBOL": "0", "TV_RATE_IP": "0", "TV_MAX_INFLIGHT": "0",
+        "EVENTS_ROTATE": "none",
+        "TELEGRAM_ENABLED": "1", "TELEGRAM_BOT_TOKEN": BENCH_KEY, "TELEGRAM_CHAT_ID": "1", "TELEGRAM_RATE_PER_S": "1000",
+        "TIMING_SLOW_MS": "0",
+    })
+    sys.path[:0] = [str(ROOT), str(ROOT / "shared"), str(ROOT / "perf"), str(ROOT / "tools")]
+    import telegram_notify
+    telegram_notify.TELEGRAM_API = stub.url
+    import webhook_server as ws
+    import perf_app as pa
+    import bitget_feed
+    bitget_feed.BASE = stub.url
+    from fastapi.testclient import TestClient
+
+    stack = contextlib.ExitStack()
+    with stack:
+        return _cases(ws, pa, bitget_feed, TestClient, stub, manifest, stack, args)
+
+def _cases(ws, pa, bitget_feed, TestClient, stub: Stub, manifest: Dict[str, Any], stack: contextlib.ExitStack, args) -> Dict[str, Any]:
+    only = set(args.only.split(",")) if args.only else None
+    reps, budget = args.reps, args.budget_s
+    res: Dict[str, Any] = {"dataset": {k: manifest.get(k) for k in ("trades", "events", "candles", "seed")}}
+
+    def case(name: str, fn: Callable[[], Any], ops: int = 1, n: Optional[int] = None, warmup: int = 1) -> None:
+        if only and name.split(".")[0] not in only and name not in only:
+            return
+        t0 = time.perf_counter()
+        res[name] = bench(fn, n or reps, budget, ops=ops, warmup=warmup)
+        print(f"  {name:<28} p50 {res[name]['ms_p50']:>10.3f} ms  ({time.perf_counter() - t0:.1f}s)", file=sys.stderr, flush=True)
+
+    # ---- perf_app (reads only). Startup runs (init_db, request threads and their pooled
+    # connections live for the whole run) but not the monitors loop: its periodic
+    # kpis() would run concurrently with the timed cases. ----
+    pa.monitors_loop = lambda: None
+    perf = stack.enter_context(TestClient(pa.app))
+    case("kpis", pa.kpis)
+    case("equity_series", lambda: pa.equity_series(include_open_live=False))
+    series = pa.equity_series(include_open_live=False)
+    case("max_drawdown", lambda: pa.max_drawdown(series))
+    case("perf_summary", lambda: perf.get("/perf/summary").raise_for_status())
+    case("perf_equity", lambda: perf.get("/perf/equity").raise_for_status())
+    case("perf_trades.limit50", lambda: perf.get("/perf/trades?limit=50").raise_for_status())
+    case("perf_trades.limit500", lambda: perf.get("/perf/trades?limit=500").raise_for_status())
+    case("perf_trades.engine_closed", lambda: perf.get("/perf/trades?limit=500&engine=USDTM_LONG&status=CLOSED").raise_for_status())
+    case("perf_open", lambda: perf.get("/perf/open").raise_for_status())
+
+    # ---- perf ingestion (writes go to the private copy): OPEN + CLOSE pairs ----
+    seq = iter(range(10 ** 9))
+
+    def ingest_pairs(k: int) -> None:
+        for _ in range(k):
+            tid = f"T_BENCH_ING_{os.getpid()}_{next(seq)}"
+            perf.post("/perf/event", json={"type": "OPEN", "trade_id": tid, "engine": "USDTM_LONG", "symbol": "ETHUSDT",
+                                           "side": "LONG", "entry": 2500.0, "stop": 2490.0, "qty": 1.0, "risk_usd": 10.0}).raise_for_status()
+            perf.post("/perf/event", json={"type": "CLOSE", "trade_id": tid, "exit": 2505.0}).raise_for_status()
+
+    case("perf_ingest", lambda: ingest_pairs(50), ops=100)
+    pool = stack.enter_context(ThreadPoolExecutor(args.ingest_threads))
+    case("perf_ingest_concurrent", lambda: list(pool.map(ingest_pairs, [25] * args.ingest_threads)),
+         ops=50 * args.ingest_threads)
+
+    # ---- webhook_server (startup: ring refill, idempotency, outbox worker) ----
+    n_events = int(manifest.get("events") or 0)
+    with TestClient(ws.app) as tv:
+        engines = list(datagen.ENGINES)
+        case("risk_quote", lambda: [ws.risk_quote(engines[i & 3], 2500.0 + i, 2490.0 + i, 0.0) for i in range(1000)], ops=1000)
+        k = 10000
+        eng_col = [engines[i & 3] for i in range(k)]
+        px_col = [2500.0 + (i % 97) for i in range(k)]
+        sl_col = [p - 5.0 - (i % 13) for i, p in enumerate(px_col)]
+        case("risk_quote_batch", lambda: ws.risk_quote_batch(eng_col, px_col, sl_col), ops=k)
+
+        case("read_events.ring50", lambda: ws.read_events(50))
+        case("read_events.ring5000", lambda: ws.read_events(ws.EVENTS_RING.maxlen))
+        deep = min(max(n_events, 1), 50000)
+        case("read_events.tail_file", lambda: ws.read_events(deep) if deep > ws.EVENTS_RING.maxlen else ws.EVENT_LOG.tail(deep))
+        case("read_events.from_start", lambda: ws.read_events_from(0, 1000))
+        case("read_events.from_middle", lambda: ws.read_events_from(n_events // 2, 1000))
+        case("metrics.ring", lambda: ws.metrics(window_min=60, limit=50))
+        case("metrics.ring_full", lambda: ws.metrics(window_min=1440, limit=ws.EVENTS_RING.maxlen))
+        case("metrics.beyond_ring", lambda: ws.metrics(window_min=60, limit=deep))
+        case("api_dashboard", lambda: tv.get("/api/dashboard").raise_for_status())
+        case("bitget_candles1000", lambda: bitget_feed.fetch_candles_usdt_futures("BTCUSDT", 60, limit=1000))
+
+        if not only or "tv" in only:
+            # /tv end to end: request latency, then until the stub perf got every OPEN
+            n = args.tv_n
+            before = stub.counts["perf"]
+            lat: List[float] = []
+            t_start = time.perf_counter()
+            for i in range(n):
+                p = 2500.0 + (i % 50)
+                body = {"key": BENCH_KEY, "engine": "USDTM_LONG", "signal": "BUY", "symbol": "ETHUSDT", "tf": "5",
+                        "price": p, "sl": p - 10.0, "tp": p + 20.0, "reason": "bench", "alert_id": f"bench-{os.getpid()}-{i}"}
+                t0 = time.perf_counter()
+                r = tv.post("/tv", json=body)
+                lat.append(time.perf_counter() - t0)
+                if r.status_code != 200:
+                    raise RuntimeError(f"/tv returned {r.status_code}: {r.text[:200]}")
+            t_acked = time.perf_counter()
+            delivered = stub.wait("perf", before + n, timeout=max(30.0, n * 0.05))
+            t_done = time.perf_counter()
+            res["tv"] = summarize(lat)
+            res["tv"]["req_per_s"] = round(n / (t_acked - t_start), 1)
+            res["tv_e2e"] = {
+                "n": n,
+                "delivered": stub.counts["perf"] - before,
+                "complete": delivered,
+                "ms_total": round((t_done - t_start) * 1000.0, 3),
+                "ms_drain_after_last_ack": round((t_done - t_acked) * 1000.0, 3),
+                "ms_per_signal": round((t_done - t_start) * 1000.0 / n, 4),  # ack + delivery
+            }
+            print(f"  {'tv':<28} p50 {res['tv']['ms_p50']:>10.3f} ms  ({res['tv']['req_per_s']} req/s)", file=sys.stderr, flush=True)
+    res["stub"] = dict(stub.counts)
+    return res
+
+
+# -------------------- Compare --------------------
+def compare(cur: Dict[str, Any], base: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[Dict[str, Any]]:
+    rows = []
+    for size, cases in cur.get("sizes", {}).items():
+        bcases = (base.get("sizes") or {}).get(size) or {}
+        for name, st in cases.items():
+            b = bcases.get(name)
+            key = "ms_p50" if isinstance(st, dict) and "ms_p50" in st else "ms_per_signal"
+            if not isinstance(st, dict) or not isinstance(b, dict) or key not in st or key not in b:
+                continue
+            old, new = float(b[key]), float(st[key])
+            ratio = new / old if old > 0 else float("inf")
+            rows.append({
+                "size": size, "case": name, "base_ms": old, "ms": new, "ratio": round(ratio, 3),
+                "regression": ratio > 1.0 + tolerance and new - old > min_delta_ms,
+                "improvement": ratio < 1.0 / (1.0 + tolerance) and old - new > min_delta_ms,
+            })
+    return rows
+
+def print_compare(rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    print(f"\n{'size':>8}  {'case':<28} {'base ms':>11} {'ms':>11} {'ratio':>7}", file=sys.stderr)
+    for r in rows:
+        flag = "  REGRESSION" if r["regression"] else ("  faster" if r["improvement"] else "")
+        print(f"{r['size']:>8}  {r['case']:<28} {r['base_ms']:>11.3f} {r['ms']:>11.3f} {r['ratio']:>7.2f}{flag}", file=sys.stderr)
+
+
+# -------------------- Main --------------------
+def parse_size(s: str) -> int:
+    s = s.strip().lower()
+    mult = {"k": 1000, "m": 1000000}.get(s[-1:], 1)
+    return int(float(s[:-1] if mult > 1 else s) * mult)
+
+def git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmarks for webhook_server / perf_app")
+    ap.add_argument("--sizes", default="10k,100k", help="dataset sizes in trades (e.g. 10k,100k,1M)")
+    ap.add_argument("--events", help="events per dataset (default: same as trades, capped at 500k)")
+    ap.add_argument("--data-dir", default=os.environ.get("BENCH_DATA_DIR", os.path.join(tempfile.gettempdir(), "magik-bench-data")))
+    ap.add_argument("--out", default=str(BENCH_DIR / "results" / "latest.json"))
+    ap.add_argument("--baseline", default=str(BENCH_DIR / "baseline.json"))
+    ap.add_argument("--save-baseline", action="store_true", help="also write this run to --baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="p50 slowdown flagged as regression (0.25 = +25%%)")
+    ap.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore smaller absolute p50 differences")
+    ap.add_argument("--reps", type=int, default=30)
+    ap.add_argument("--budget-s", type=float, default=3.0, help="time budget per case (at least 3 reps)")
+    ap.add_argument("--tv-n", type=int, default=300, help="/tv requests in the end-to-end case")
+    ap.add_argument("--ingest-threads", type=int, default=8, help="client threads in perf_ingest_concurrent")
+    ap.add_argument("--only", help="comma-separated case names or prefixes (kpis,perf_trades,tv,...)")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    ap.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        res = run_worker(pathlib.Path(args.worker), args)
+        pathlib.Path(args.result_file).write_text(json.dumps(res), encoding="utf-8")
+        return
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    out: Dict[str, Any] = {
+        "meta": {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "git": git_rev(),
+            "host": socket.gethostname(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("worker", "result_file")},
+        },
+        "sizes": {},
+    }
+    for n in sizes:
+        n_events = int(args.events) if args.events else min(n, 500000)
+        data = pathlib.Path(args.data_dir) / f"t{n}-e{n_events}"
+        print(f"== dataset {n} trades / {n_events} events ({data})", file=sys.stderr, flush=True)
+        t0 = time.perf_counter()
+        datagen.generate(data, n, n_events, 1000)
+        print(f"  data ready in {time.perf_counter() - t0:.1f}s", file=sys.stderr, flush=True)
+
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tf:
+            rf = tf.name
+        try:
+            cmd = [sys.executable, str(pathlib.Path(__file__).resolve()), "--worker", str(data), "--result-file", rf,
+                   "--reps", str(args.reps), "--budget-s", str(args.budget_s), "--tv-n", str(args.tv_n), "--ingest-threads", str(args.ingest_threads)]
+            if args.only:
+                cmd += ["--only", args.only]
+            subprocess.run(cmd, check=True)
+            out["sizes"][str(n)] = json.loads(pathlib.Path(rf).read_text(encoding="utf-8"))
+        finally:
+            os.unlink(rf)
+
+    base_path = pathlib.Path(args.baseline)
+    rows: List[Dict[str, Any]] = []
+    if base_path.exists() and not args.save_baseline:
+        base = json.loads(base_path.read_text(encoding="utf-8"))
+        rows = compare(out, base, args.tolerance, args.min_delta_ms)
+        out["compare"] = {"baseline": str(base_path), "baseline_git": (base.get("meta") or {}).get("git"), "rows": rows}
+        print_compare(rows)
+
+    out_path = pathlib.Path(args.out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(out, indent=2), encoding="utf-8")
+    print(f"\nresults: {out_path}", file=sys.stderr)
+    if args.save_baseline:
+        base_path.write_text(json.dumps(out, indent=2), encoding="utf-8")
+        print(f"baseline saved: {base_path}", file=sys.stderr)
+
+    regressions = [r for r in rows if r["regression"]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) vs baseline", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
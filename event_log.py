@@ -0,0 +1,513 @@
+"""Segmented append-only JSONL event log (webhook events).
+
+Layout under the state dir:
+  events.jsonl                      active segment (appended by webhook_server)
+  events.idx                        line start offsets of the active segment (8 bytes BE each)
+  events/manifest.json              sealed segments, oldest first
+  events/events-<first_ts>.jsonl.gz sealed segments (gzip/lzma, or plain)
+
+The active segment is sealed daily (EVENTS_ROTATE=daily) and/or when it reaches
+EVENTS_SEGMENT_MAX_MB, then compressed in the background. Readers walk the
+active segment backwards from EOF, then sealed segments newest-first, and stop
+as soon as they have what they need.
+
+Several processes may open the same log: the manifest is revalidated against
+the file (stat) on read and re-read under an exclusive flock on
+events/.manifest.lock before every change, so one process never writes back a
+stale copy over another's sealed segment. A seal records its entry as
+manifest["pending"] before renaming the active segment; whichever process next
+takes the lock completes or discards it, so a crash mid-seal loses nothing.
+
+Line numbers are global: manifest["next_line"] is the number of lines sealed so
+far, so line N of the log stays line N after rotation (and after retention
+deletes old segments, which simply become unreachable).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import gzip
+import json
+import lzma
+import os
+import pathlib
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+TAIL_BLOCK = int(os.getenv("EVENTS_TAIL_BLOCK", "65536"))
+_IDX_W = 8
+
+_OPENERS = {"gz": gzip.open, "xz": lzma.open}
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _write_json_atomic(path: pathlib.Path, obj: Any) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(json.dumps(obj, ensure_ascii=False, indent=1))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def iter_lines_reverse(path: pathlib.Path, block: int = TAIL_BLOCK) -> Iterator[bytes]:
+    """Non-empty lines of path, newest first, reading backwards from EOF in blocks."""
+    try:
+        f = path.open("rb")
+    except OSError:
+        return
+    with f:
+        pos = f.seek(0, os.SEEK_END)
+        buf = b""
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+            parts = buf.split(b"\n")
+            # parts[0] may be a partial line unless we reached BOF
+            buf = parts[0]
+            for ln in reversed(parts[1:]):
+                if ln.strip():
+                    yield ln
+        if buf.strip():
+            yield buf
+
+
+def tail_lines(path: pathlib.Path, n: int, block: int = TAIL_BLOCK) -> List[bytes]:
+    """Last n non-empty lines of path (oldest first).
+    Cost is proportional to the bytes of those n lines, not to the file size."""
+    if n <= 0:
+        return []
+    out: List[bytes] = []
+    for ln in iter_lines_reverse(path, block):
+        out.append(ln)
+        if len(out) >= n:
+            break
+    out.reverse()
+    return out
+
+
+def decode_lines(lines: List[bytes]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for ln in lines:
+        try:
+            out.append(json.loads(ln))
+        except Exception:
+            continue
+    return out
+
+
+class EventLog:
+    def __init__(
+        self,
+        state_dir: pathlib.Path,
+        name: str = "events",
+        rotate: str = "daily",
+        max_bytes: int = 0,
+        compress: str = "gz",
+        retention_days: int = 0,
+        retention_bytes: int = 0,
+    ):
+        self.active = state_dir / f"{name}.jsonl"
+        self.idx = state_dir / f"{name}.idx"
+        self.seg_dir = state_dir / name
+        self.manifest_path = self.seg_dir / "manifest.json"
+        self.name = name
+        self.rotate = rotate
+        self.max_bytes = max_bytes
+        self.compress = compress if compress in _OPENERS else ""
+        self.retention_days = retention_days
+        self.retention_bytes = retention_bytes
+        self._lock = threading.RLock()
+        self._idx_lock = threading.Lock()
+        self._compress_lock = threading.Lock()  # one compressor at a time (startup + every seal)
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._manifest_sig: Optional[tuple] = None
+        self._flock_fd: Optional[int] = None
+        self._flock_depth = 0
+        # rotation fast path: the day the active segment belongs to and its size,
+        # kept in memory so maybe_rotate() only takes the manifest lock when due
+        self._active_day: Optional[str] = None
+        self._active_size: Optional[int] = None
+
+    # ---------- manifest ----------
+    def _stat_manifest(self) -> Optional[tuple]:
+        try:
+            st = self.manifest_path.stat()
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @contextlib.contextmanager
+    def _manifest_tx(self):
+        """Exclusive (threads + processes) manifest update: yields a freshly read manifest."""
+        with self._lock:
+            if self._flock_depth == 0:
+                self.seg_dir.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.seg_dir / ".manifest.lock", os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self._flock_fd = fd
+                self._manifest = None  # another process may have changed it
+            self._flock_depth += 1
+            try:
+                m = self._load_manifest()
+                if m.get("pending"):
+                    self._finish_seal(m)
+                yield m
+            finally:
+                self._flock_depth -= 1
+                if self._flock_depth == 0:
+                    fd, self._flock_fd = self._flock_fd, None
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    os.close(fd)
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        if self._manifest is not None and self._flock_depth == 0 and self._stat_manifest() != self._manifest_sig:
+            self._manifest = None
+        if self._manifest is None:
+            sig = self._stat_manifest()
+            m: Dict[str, Any] = {}
+            try:
+                m = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+            except Exception:
+                m = {}
+            if not isinstance(m, dict):
+                m = {}
+            m.setdefault("segments", [])
+            m.setdefault("next_line", sum(int(s.get("lines", 0)) for s in m["segments"]))
+            m.setdefault("active_day", None)
+            self._manifest = m
+            self._manifest_sig = sig
+        return self._manifest
+
+    def _save_manifest(self) -> None:
+        self.seg_dir.mkdir(parents=True, exist_ok=True)
+        _write_json_atomic(self.manifest_path, self._manifest)
+        self._manifest_sig = self._stat_manifest()
+
+    def segments(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            m = self._load_manifest()
+            return [dict(s) for s in m["segments"]]
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            m = self._load_manifest()
+            segs = [dict(s) for s in m["segments"]]
+            base = int(m["next_line"])
+            day = m["active_day"]
+        try:
+            active_bytes = self.active.stat().st_size
+        except OSError:
+            active_bytes = 0
+        return {
+            "active": {"file": self.active.name, "day": day, "bytes": active_bytes, "start_line": base},
+            "segments": segs,
+            "sealed_bytes": sum(int(s.get("bytes", 0)) for s in segs),
+        }
+
+    # ---------- active segment index ----------
+    def index_sync(self) -> int:
+        """Bring the idx up to date with the active segment and return its line count.
+        Only the unindexed tail is scanned (full rebuild if the idx is missing or does
+        not match the file, e.g. after truncation or rotation)."""
+        with self._idx_lock:
+            return self._index_sync()
+
+    def _index_sync(self) -> int:
+        try:
+            size = self.active.stat().st_size
+        except OSError:
+            size = 0
+        self._active_size = size
+        try:
+            with self.idx.open("ab+") as idx, self.active.open("ab+") as ev:
+                idx_len = idx.seek(0, os.SEEK_END) // _IDX_W
+                start = 0
+                if idx_len:
+                    idx.seek((idx_len - 1) * _IDX_W)
+                    last = int.from_bytes(idx.read(_IDX_W), "big")
+                    ev.seek(last)
+                    tail = ev.readline()
+                    if last < size and tail.endswith(b"\n"):
+                        start = last + len(tail)
+                    else:
+                        # idx does not match the file (truncated/replaced): rebuild
+                        idx_len = 0
+                if idx_len == 0:
+                    idx.truncate(0)
+                    start = 0
+                ev.seek(start)
+                offs = bytearray()
+                off = start
+                for ln in ev:
+                    if not ln.endswith(b"\n"):
+                        break
+                    offs += off.to_bytes(_IDX_W, "big")
+                    off += len(ln)
+                if offs:
+                    idx.seek(0, os.SEEK_END)
+                    idx.write(offs)
+                return idx_len + len(offs) // _IDX_W
+        except OSError:
+            return 0
+
+    # ---------- rotation ----------
+    def _first_day(self) -> Optional[str]:
+        try:
+            with self.active.open("rb") as f:
+                first = f.readline()
+            ts = json.loads(first).get("_ts") or ""
+            return datetime.fromisoformat(ts.replace("Z", "+00:00")).astimezone(timezone.utc).strftime("%Y-%m-%d")
+        except Exception:
+            return None
+
+    def maybe_rotate(self) -> bool:
+        """Seal the active segment if the rotation policy says so (called by the single writer).
+        Cheap when nothing is due: the manifest lock is only taken on a new day or
+        once the active segment may have reached max_bytes."""
+        today = _utc_now().strftime("%Y-%m-%d")
+        size = self._active_size
+        if self._active_day == today and size is not None and (self.max_bytes <= 0 or size < self.max_bytes):
+            return False
+        with self._manifest_tx() as m:
+            try:
+                size = self.active.stat().st_size
+            except OSError:
+                size = 0
+            self._active_size = size
+            if size == 0:
+                if m["active_day"] != today:
+                    m["active_day"] = today
+                    self._save_manifest()
+                self._active_day = today
+                return False
+            if m["active_day"] is None:
+                m["active_day"] = self._first_day() or today
+                self._save_manifest()
+            due = (self.rotate == "daily" and m["active_day"] != today) or (
+                self.max_bytes > 0 and size >= self.max_bytes
+            )
+            if not due:
+                self._active_day = m["active_day"]
+                return False
+            self.seal()
+            return True
+
+    def seal(self) -> Optional[Dict[str, Any]]:
+        """Move the active segment into events/ and start a new one.
+        The entry is saved as manifest["pending"] before the rename and moved into
+        segments after it, so a crash in between is settled by the next
+        _manifest_tx() (see _finish_seal) instead of orphaning the segment."""
+        with self._manifest_tx() as m:
+            lines = self.index_sync()
+            if lines == 0:
+                return None
+            first = decode_lines([self._active_first_line()])
+            last = decode_lines(tail_lines(self.active, 1))
+            first_ts = (first[0].get("_ts") if first else None) or _utc_now().isoformat()
+            stamp = first_ts[:19].replace("-", "").replace(":", "")
+            self.seg_dir.mkdir(parents=True, exist_ok=True)
+            fname = f"{self.name}-{stamp}Z-{m['next_line']}.jsonl"
+            dest = self.seg_dir / fname
+            entry = {
+                "file": fname,
+                "start_line": int(m["next_line"]),
+                "lines": lines,
+                "first_ts": first[0].get("_ts") if first else None,
+                "last_ts": last[0].get("_ts") if last else None,
+                "bytes": self.active.stat().st_size,
+                "sealed_at": _utc_now().isoformat(),
+            }
+            m["pending"] = entry
+            self._save_manifest()
+            with self._idx_lock:
+                os.replace(self.active, dest)
+                try:
+                    self.idx.unlink()
+                except OSError:
+                    pass
+                self._active_size = 0
+            self._finish_seal(m)
+        if self.compress:
+            self.compress_async()
+        return entry
+
+    def _finish_seal(self, m: Dict[str, Any]) -> None:
+        """Commit manifest["pending"] if its rename happened, drop it otherwise."""
+        entry = m.pop("pending")
+        if (self.seg_dir / entry["file"]).exists():
+            m["segments"].append(entry)
+            m["next_line"] = int(m["next_line"]) + int(entry["lines"])
+            m["active_day"] = _utc_now().strftime("%Y-%m-%d")
+            self._active_day = None
+            self._apply_retention()
+        self._save_manifest()
+
+    def compress_async(self) -> None:
+        """compress_pending() on a background thread (serialized with any running one)."""
+        threading.Thread(target=self.compress_pending, name=f"{self.name}-compress", daemon=True).start()
+
+    def _active_first_line(self) -> bytes:
+        try:
+            with self.active.open("rb") as f:
+                return f.readline()
+        except OSError:
+            return b""
+
+    def _apply_retention(self) -> None:
+        m = self._load_manifest()
+        segs = m["segments"]
+        if self.retention_days > 0:
+            cutoff = _utc_now().timestamp() - self.retention_days * 86400
+            while segs:
+                try:
+                    last = datetime.fromisoformat((segs[0].get("last_ts") or segs[0]["sealed_at"]).replace("Z", "+00:00"))
+                except Exception:
+                    break
+                if last.timestamp() >= cutoff:
+                    break
+                self._drop(segs.pop(0))
+        if self.retention_bytes > 0:
+            while len(segs) > 1 and sum(int(s.get("bytes", 0)) for s in segs) > self.retention_bytes:
+                self._drop(segs.pop(0))
+
+    def _drop(self, seg: Dict[str, Any]) -> None:
+        try:
+            (self.seg_dir / seg["file"]).unlink()
+        except OSError:
+            pass
+
+    def compress_pending(self) -> int:
+        """Compress sealed segments that are still plain .jsonl (also used for crash recovery)."""
+        if not self.compress:
+            return 0
+        with self._compress_lock:
+            return self._compress_pending()
+
+    def _compress_pending(self) -> int:
+        done = 0
+        for seg in self.segments():
+            if not seg["file"].endswith(".jsonl"):
+                continue
+            src = self.seg_dir / seg["file"]
+            dst_name = f"{seg['file']}.{self.compress}"
+            tmp = self.seg_dir / f".{dst_name}.{os.getpid()}.tmp"
+            try:
+                with src.open("rb") as fin, _OPENERS[self.compress](tmp, "wb") as fout:
+                    while True:
+                        chunk = fin.read(1 << 20)
+                        if not chunk:
+                            break
+                        fout.write(chunk)
+                os.replace(tmp, self.seg_dir / dst_name)
+            except OSError:
+                continue
+            with self._manifest_tx() as m:
+                for s in m["segments"]:
+                    if s["file"] == seg["file"]:
+                        s["file"] = dst_name
+                        s["bytes"] = (self.seg_dir / dst_name).stat().st_size
+                self._save_manifest()
+            try:
+                src.unlink()
+            except OSError:
+                pass
+            done += 1
+        return done
+
+    # ---------- readers ----------
+    def _open_segment(self, seg: Dict[str, Any]):
+        name = seg["file"]
+        for cand in (name, f"{name}.{self.compress}" if self.compress else None):
+            if not cand:
+                continue
+            p = self.seg_dir / cand
+            ext = cand.rsplit(".", 1)[-1]
+            try:
+                return _OPENERS[ext](p, "rb") if ext in _OPENERS else p.open("rb")
+            except OSError:
+                continue
+        return None
+
+    def _segment_lines(self, seg: Dict[str, Any]) -> List[bytes]:
+        f = self._open_segment(seg)
+        if f is None:
+            return []
+        with f:
+            return [ln for ln in f.read().split(b"\n") if ln.strip()]
+
+    def iter_newest_first(self) -> Iterator[Dict[str, Any]]:
+        """Events newest-first: active segment from EOF, then sealed segments.
+        Sealed segments are only opened (and decompressed) when the caller gets that far."""
+        segs = self.segments()
+        for ln in iter_lines_reverse(self.active):
+            yield from decode_lines([ln])
+        for seg in reversed(segs):
+            for ln in reversed(self._segment_lines(seg)):
+                yield from decode_lines([ln])
+
+    def iter_oldest_first(self) -> Iterator[Dict[str, Any]]:
+        """Events in write order: sealed segments, then the active segment (streamed).
+        Read-only: unlike read_from() it never touches the idx."""
+        for seg in self.segments():
+            for ln in self._segment_lines(seg):
+                yield from decode_lines([ln])
+        try:
+            with self.active.open("rb") as f:
+                for ln in f:
+                    if ln.strip():
+                        yield from decode_lines([ln])
+        except OSError:
+            return
+
+    def tail(self, n: int) -> List[Dict[str, Any]]:
+        """Last n events (oldest first), across segments if the active one is short."""
+        if n <= 0:
+            return []
+        out: List[Dict[str, Any]] = []
+        for e in self.iter_newest_first():
+            out.append(e)
+            if len(out) >= n:
+                break
+        out.reverse()
+        return out
+
+    def read_from(self, start: int, limit: int = 50) -> List[Dict[str, Any]]:
+        """Events from global line `start` onwards (active lines are reached via the idx)."""
+        if limit <= 0 or start < 0:
+            return []
+        with self._lock:
+            m = self._load_manifest()
+            base = int(m["next_line"])
+            segs = [dict(s) for s in m["segments"]]
+
+        out: List[Dict[str, Any]] = []
+        for seg in segs:
+            s0 = int(seg["start_line"])
+            s1 = s0 + int(seg["lines"])
+            if start >= s1:
+                continue
+            lines = self._segment_lines(seg)
+            out += decode_lines(lines[max(0, start - s0):][: limit - len(out)])
+            if len(out) >= limit:
+                return out
+        local = max(0, start - base)
+        count = self.index_sync()
+        if local >= count:
+            return out
+        try:
+            with self.idx.open("rb") as idx, self.active.open("rb") as ev:
+                idx.seek(local * _IDX_W)
+                ev.seek(int.from_bytes(idx.read(_IDX_W), "big"))
+                lines = [ev.readline() for _ in range(min(limit - len(out), count - local))]
+            out += decode_lines([ln for ln in lines if ln.strip()])
+        except OSError:
+            pass
+        return out
@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
-import os, json, time, sqlite3, uuid
+import os, sys, json, time, sqlite3, uuid, threading, contextlib, queue
+import concurrent.futures
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable, Tuple
 
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, FastAPI, HTTPException, Query
+from fastapi.responses import HTMLResponse, Response
+from pydantic import BaseModel, Field, ValidationError
 
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(APP_DIR), "shared"))
+from prom import Registry, PromMiddleware, CONTENT_TYPE as PROM_CONTENT_TYPE
+from telegram_notify import notifier_from_env
 DB_PATH = os.getenv("PERF_DB_PATH", os.path.join(APP_DIR, "perf.db"))
 
 # ---- Telegram (optional) ----
@@ -20,6 +24,21 @@ ENGINE_DD_ALERT_PCT = float(os.getenv("PERF_ENGINE_DD_ALERT_PCT", "7.0"))  # % e
 EQUITY0 = float(os.getenv("PERF_EQUITY0", "10000"))  # simulated start equity
 
 app = FastAPI(title="perf", version="1.0")
+# /perf/* routes + startup live on a router so webhook_server can mount them
+# in-process (PERF_INPROCESS=1); this app is the standalone (port 8010) mode.
+router = APIRouter()
+
+# ---- Prometheus (/metrics) ----
+# in-memory only: open trades/risk are loaded once from the DB at startup,
+# then kept up to date by OPEN/CLOSE; DD/equity are refreshed by monitors_loop.
+PROM = Registry("perf_")
+app.add_middleware(PromMiddleware, registry=PROM)
+PROM_EVENTS = PROM.counter("events_total", "Perf events received by type", ("type",))
+PROM_RETRIES = PROM.counter("sqlite_retries_total", "with_retry() retries on 'database is locked'", ("op",))
+PROM_OPEN_TRADES = PROM.gauge("open_trades", "Open trades per engine", ("engine",))
+PROM_OPEN_RISK = PROM.gauge("open_risk_usd", "Open risk (USD) per engine", ("engine",))
+PROM_EQUITY = PROM.gauge("equity_last", "Last realized equity (refreshed by monitors_loop)")
+PROM_DD_PCT = PROM.gauge("max_dd_pct", "Global max drawdown % (refreshed by monitors_loop)")
 
 # ---------------- Models ----------------
 class PerfEvent(BaseModel):
@@ -38,52 +57,151 @@ class PerfEvent(BaseModel):
     meta: Optional[Dict[str, Any]] = None
 
 # ---------------- DB ----------------
-def db() -> sqlite3.Connection:
+# Long-lived connections, one per thread and per mode, configured once (PRAGMAs at
+# open only); sqlite3's per-connection statement cache then reuses the prepared
+# statements of the hot queries. "rw": writes (the writer thread below; tx() for
+# schema/maintenance). "ro": GET endpoints + analytics, PRAGMA query_only. A thread's connections are closed
+# when the thread exits.
+DB_CACHED_STATEMENTS = int(os.getenv("PERF_DB_CACHED_STATEMENTS", "256"))
+
+_pool_local = threading.local()
+_pool_lock = threading.Lock()
+_pool_stats: Dict[str, Dict[str, int]] = {
+    m: {"open": 0, "opened": 0, "closed": 0, "acquired": 0} for m in ("rw", "ro")
+}
+
+class _PooledConn:
+    __slots__ = ("con", "path", "mode")
+
+    def __init__(self, con: sqlite3.Connection, path: str, mode: str):
+        self.con, self.path, self.mode = con, path, mode
+
+    def __del__(self):
+        try:
+            self.con.close()
+        except Exception:
+            pass
+        with _pool_lock:
+            _pool_stats[self.mode]["open"] -= 1
+            _pool_stats[self.mode]["closed"] += 1
+
+def _connect(mode: str) -> sqlite3.Connection:
     # sqlite: enable WAL + wait for locks a bit (UI can poll while writes happen)
-    con = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    con = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False, cached_statements=DB_CACHED_STATEMENTS)
     con.row_factory = sqlite3.Row
-    cur = con.cursor()
-    # Pragmas are per-connection (safe to call each time)
-    cur.execute("PRAGMA journal_mode=WAL")
-    cur.execute("PRAGMA synchronous=NORMAL")
-    cur.execute("PRAGMA busy_timeout=5000")
-    cur.execute("PRAGMA foreign_keys=ON")
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA busy_timeout=5000")
+    con.execute("PRAGMA foreign_keys=ON")
+    if mode == "ro":
+        con.execute("PRAGMA query_only=ON")
     return con
 
-def init_db():
+def _pooled(mode: str) -> sqlite3.Connection:
+    pc = getattr(_pool_local, mode, None)
+    if pc is None or pc.path != DB_PATH:
+        pc = _PooledConn(_connect(mode), DB_PATH, mode)
+        setattr(_pool_local, mode, pc)  # replaces (and closes) a connection to an old DB_PATH
+        with _pool_lock:
+            _pool_stats[mode]["open"] += 1
+            _pool_stats[mode]["opened"] += 1
+    with _pool_lock:
+        _pool_stats[mode]["acquired"] += 1
+    return pc.con
+
+def db() -> sqlite3.Connection:
+    """Read-write connection of the calling thread (pooled: never close it)."""
+    return _pooled("rw")
+
+def rdb() -> sqlite3.Connection:
+    """Read-only (query_only) connection of the calling thread (pooled: never close it)."""
+    return _pooled("ro")
+
+@contextlib.contextmanager
+def tx():
+    """Transaction on the thread's rw connection: commit on success, rollback on error."""
     con = db()
-    cur = con.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS events (
-      id TEXT PRIMARY KEY,
-      ts TEXT NOT NULL,
-      type TEXT NOT NULL,
-      engine TEXT,
-      symbol TEXT,
-      trade_id TEXT,
-      payload TEXT NOT NULL
-    )""")
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS trades (
-      trade_id TEXT PRIMARY KEY,
-      engine TEXT NOT NULL,
-      symbol TEXT NOT NULL,
-      side TEXT NOT NULL,
-      entry_ts TEXT NOT NULL,
-      entry REAL NOT NULL,
-      stop REAL NOT NULL,
-      qty REAL NOT NULL,
-      risk_usd REAL NOT NULL,
-      exit_ts TEXT,
-      exit REAL,
-      status TEXT NOT NULL DEFAULT 'OPEN',
-      pnl_real REAL NOT NULL DEFAULT 0.0,
-      r_real REAL NOT NULL DEFAULT 0.0
-    )""")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_engine ON trades(engine)")
-    con.commit()
-    con.close()
+    try:
+        yield con
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+
+def pool_stats() -> Dict[str, Any]:
+    with _pool_lock:
+        out: Dict[str, Any] = {m: dict(st) for m, st in _pool_stats.items()}
+    out["db_path"] = DB_PATH
+    out["cached_statements"] = DB_CACHED_STATEMENTS
+    return out
+
+PROM.gauge("db_connections", "Pooled SQLite connections per mode (rw/ro)", ("mode", "kind")).set_function(
+    lambda: {(m, k): v for m, st in pool_stats().items() if isinstance(st, dict) for k, v in st.items()}
+)
+
+def init_db():
+    with tx() as con:
+        cur = con.cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+          id TEXT PRIMARY KEY,
+          ts TEXT NOT NULL,
+          type TEXT NOT NULL,
+          engine TEXT,
+          symbol TEXT,
+          trade_id TEXT,
+          payload TEXT NOT NULL
+        )""")
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS trades (
+          trade_id TEXT PRIMARY KEY,
+          engine TEXT NOT NULL,
+          symbol TEXT NOT NULL,
+          side TEXT NOT NULL,
+          entry_ts TEXT NOT NULL,
+          entry REAL NOT NULL,
+          stop REAL NOT NULL,
+          qty REAL NOT NULL,
+          risk_usd REAL NOT NULL,
+          exit_ts TEXT,
+          exit REAL,
+          status TEXT NOT NULL DEFAULT 'OPEN',
+          pnl_real REAL NOT NULL DEFAULT 0.0,
+          r_real REAL NOT NULL DEFAULT 0.0
+        )""")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_engine ON trades(engine)")
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS aggregates (
+          engine TEXT PRIMARY KEY,
+          total INTEGER NOT NULL DEFAULT 0,
+          closed INTEGER NOT NULL DEFAULT 0,
+          open INTEGER NOT NULL DEFAULT 0,
+          wins INTEGER NOT NULL DEFAULT 0,
+          sum_pnl REAL NOT NULL DEFAULT 0.0,
+          sum_r REAL NOT NULL DEFAULT 0.0,
+          open_risk REAL NOT NULL DEFAULT 0.0
+        )""")
+        # first start on an existing perf.db: build from the trades table once
+        if cur.execute("SELECT 1 FROM aggregates WHERE engine=?", (AGG_ALL,)).fetchone() is None:
+            rebuild_aggregates(con)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS equity (
+          scope TEXT NOT NULL,
+          exit_ts TEXT NOT NULL,
+          trade_id TEXT NOT NULL,
+          pnl REAL NOT NULL,
+          equity REAL NOT NULL,
+          peak REAL NOT NULL,
+          dd REAL NOT NULL,
+          dd_pct REAL NOT NULL,
+          max_dd REAL NOT NULL,
+          max_dd_pct REAL NOT NULL,
+          PRIMARY KEY(scope, exit_ts, trade_id)
+        ) WITHOUT ROWID""")
+        if (cur.execute("SELECT 1 FROM equity LIMIT 1").fetchone() is None
+                and cur.execute("SELECT 1 FROM trades WHERE status='CLOSED' LIMIT 1").fetchone() is not None):
+            rebuild_equity(con)
 
 def now_iso():
     return datetime.now(timezone.utc).astimezone().isoformat()
@@ -100,28 +218,139 @@ def with_retry(fn, retries: int = 8, base_sleep: float = 0.05):
             last = e
             msg = str(e).lower()
             if "database is locked" in msg or "locked" in msg:
+                PROM_RETRIES.inc(op=getattr(fn, "__qualname__", "?").split(".")[0])
                 time.sleep(base_sleep * (i + 1))
                 continue
             raise
     raise last
 
-def insert_event(ev: PerfEvent):
-    def _do():
+# ---------------- Writer ----------------
+# Every write to perf.db goes through one thread: callers submit a job (a function
+# of the connection) and get a Future. The writer takes everything pending (plus
+# what arrives within PERF_WRITE_FLUSH_MS, 0 = no extra wait: jobs queued during a
+# commit form the next batch), runs each job in its own SAVEPOINT of one
+# transaction and commits once for the whole batch. A job is one event insert + its trade mutation
+# (atomic); a job that raises (400/404/409) is rolled back alone. "database is
+# locked" (another process) retries the whole batch through with_retry.
+PERF_WRITE_FLUSH_MS = float(os.getenv("PERF_WRITE_FLUSH_MS", "0"))
+PERF_WRITE_MAX_BATCH = int(os.getenv("PERF_WRITE_MAX_BATCH", "500"))
+
+WriteJob = Callable[[sqlite3.Connection], Any]
+
+def _is_locked(e: BaseException) -> bool:
+    return isinstance(e, sqlite3.OperationalError) and "locked" in str(e).lower()
+
+class PerfWriter:
+    def __init__(self, interval_s: float, max_batch: int):
+        self.interval_s = max(0.0, interval_s)
+        self.max_batch = max(1, max_batch)
+        self.stats: Dict[str, Any] = {"batches": 0, "jobs": 0, "failed_jobs": 0, "last_batch": 0, "max_batch": 0, "errors": 0, "last_error": None}
+        self._q: "queue.Queue[Optional[Tuple[WriteJob, concurrent.futures.Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, job: WriteJob) -> concurrent.futures.Future:
+        """Queue job(con); the future resolves with its result once the batch is committed."""
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        self._ensure_started()
+        self._q.put((job, fut))
+        return fut
+
+    def call(self, job: WriteJob) -> Any:
+        return self.submit(job).result()
+
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="perf-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._q.put(None)
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            first = self._q.get()
+            if first is None:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.interval_s
+            while len(batch) < self.max_batch:
+                try:
+                    timeout = deadline - time.monotonic()
+                    nxt = self._q.get(timeout=timeout) if timeout > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _apply(self, batch: List[Tuple[WriteJob, concurrent.futures.Future]]) -> List[Tuple[bool, Any]]:
         con = db()
-        cur = con.cursor()
-        eid = "E_" + uuid.uuid4().hex[:16]
-        ts = ev.ts or now_iso()
-        payload = ev.model_dump()
-        cur.execute(
-            "INSERT INTO events(id, ts, type, engine, symbol, trade_id, payload) VALUES(?,?,?,?,?,?,?)",
-            (eid, ts, ev.type, ev.engine, ev.symbol, ev.trade_id, json.dumps(payload, ensure_ascii=False))
-        )
-        con.commit()
-        con.close()
-        return eid, ts
-    return with_retry(_do)
+        out: List[Tuple[bool, Any]] = []
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            for job, _ in batch:
+                con.execute("SAVEPOINT job")
+                try:
+                    out.append((True, job(con)))
+                except Exception as e:
+                    if _is_locked(e):
+                        raise
+                    con.execute("ROLLBACK TO job")
+                    out.append((False, e))
+                con.execute("RELEASE job")
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        return out
 
-def create_trade_from_open(ev: PerfEvent) -> str:
+    def _flush(self, batch: List[Tuple[WriteJob, concurrent.futures.Future]]) -> None:
+        try:
+            results = with_retry(lambda: self._apply(batch))
+        except BaseException as e:
+            self.stats["errors"] += 1
+            self.stats["last_error"] = repr(e)
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        self.stats["batches"] += 1
+        self.stats["jobs"] += len(batch)
+        self.stats["last_batch"] = len(batch)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        for (_, fut), (ok, val) in zip(batch, results):
+            if ok:
+                fut.set_result(val)
+            else:
+                self.stats["failed_jobs"] += 1
+                fut.set_exception(val)
+
+WRITER = PerfWriter(PERF_WRITE_FLUSH_MS / 1000.0, PERF_WRITE_MAX_BATCH)
+PROM.gauge("writer_queue_depth", "Jobs waiting for the perf writer").set_function(WRITER.depth)
+PROM.counter("writer_batches_total", "Transactions committed by the perf writer").set_function(lambda: WRITER.stats["batches"])
+PROM.counter("writer_jobs_total", "Jobs committed by the perf writer").set_function(lambda: WRITER.stats["jobs"])
+
+# ---- write steps (run on the writer thread, inside the batch transaction) ----
+def insert_event(con: sqlite3.Connection, ev: PerfEvent, eid: str, ts: str) -> None:
+    con.execute(
+        "INSERT INTO events(id, ts, type, engine, symbol, trade_id, payload) VALUES(?,?,?,?,?,?,?)",
+        (eid, ts, ev.type, ev.engine, ev.symbol, ev.trade_id, json.dumps(ev.model_dump(), ensure_ascii=False))
+    )
+
+def check_open(ev: PerfEvent) -> None:
     if not all([
         ev.engine, ev.symbol, ev.side,
         ev.entry is not None, ev.stop is not None,
@@ -129,73 +358,56 @@ def create_trade_from_open(ev: PerfEvent) -> str:
     ]):
         raise HTTPException(400, "OPEN requires engine,symbol,side,entry,stop,qty,risk_usd")
 
-    trade_id = ev.trade_id or f"T_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{ev.engine}_{uuid.uuid4().hex[:6]}"
-    ts = ev.ts or now_iso()
-
-    def _do():
-        con = db()
-        cur = con.cursor()
-
-        # idempotent OPEN: if already exists and still OPEN, just return it
-        existing = cur.execute("SELECT status FROM trades WHERE trade_id=?", (trade_id,)).fetchone()
-        if existing:
-            st = existing["status"]
-            con.close()
-            if st == "OPEN":
-                return trade_id
-            raise HTTPException(409, f"trade_id already exists with status={st}")
-
-        cur.execute(
-            """
-            INSERT INTO trades(trade_id,engine,symbol,side,entry_ts,entry,stop,qty,risk_usd,status)
-            VALUES(?,?,?,?,?,?,?,?,?,'OPEN')
-            """,
-            (trade_id, ev.engine, ev.symbol, ev.side, ts, float(ev.entry), float(ev.stop), float(ev.qty), float(ev.risk_usd)),
-        )
-        con.commit()
-        con.close()
-        return trade_id
-
-    return with_retry(_do)
-
-
-def close_trade(ev: PerfEvent):
+def create_trade_from_open(con: sqlite3.Connection, ev: PerfEvent, trade_id: str, ts: str) -> bool:
+    """Insert the OPEN trade. False if it already exists and is still OPEN (idempotent)."""
+    existing = con.execute("SELECT status FROM trades WHERE trade_id=?", (trade_id,)).fetchone()
+    if existing:
+        st = existing["status"]
+        if st == "OPEN":
+            return False
+        raise HTTPException(409, f"trade_id already exists with status={st}")
+
+    con.execute(
+        """
+        INSERT INTO trades(trade_id,engine,symbol,side,entry_ts,entry,stop,qty,risk_usd,status)
+        VALUES(?,?,?,?,?,?,?,?,?,'OPEN')
+        """,
+        (trade_id, ev.engine, ev.symbol, ev.side, ts, float(ev.entry), float(ev.stop), float(ev.qty), float(ev.risk_usd)),
+    )
+    agg_open(con, ev.engine, float(ev.risk_usd))
+    return True
+
+def check_close(ev: PerfEvent) -> None:
     if not ev.trade_id or ev.exit is None:
         raise HTTPException(400, "CLOSE requires trade_id and exit")
 
-    def _do():
-        con = db()
-        cur = con.cursor()
-        tr = cur.execute("SELECT * FROM trades WHERE trade_id=?", (ev.trade_id,)).fetchone()
-        if not tr:
-            con.close()
-            raise HTTPException(404, "trade_id not found")
-        if tr["status"] != "OPEN":
-            con.close()
-            raise HTTPException(409, "trade already closed")
-
-        entry = float(tr["entry"])
-        qty = float(tr["qty"])
-        risk_usd = float(tr["risk_usd"])
-        side = tr["side"]
-
-        exit_px = float(ev.exit)
-        pnl = (exit_px - entry) * qty if side == "LONG" else (entry - exit_px) * qty
-        r = pnl / risk_usd if risk_usd != 0 else 0.0
-
-        cur.execute(
-            """
-            UPDATE trades
-            SET exit_ts=?, exit=?, status=?, pnl_real=?, r_real=?
-            WHERE trade_id=?
-            """,
-            (ev.ts or now_iso(), exit_px, "CLOSED", pnl, r, ev.trade_id),
-        )
-        con.commit()
-        con.close()
-        return {"ok": True, "trade_id": ev.trade_id, "pnl_real": pnl, "r_real": r}
-
-    return with_retry(_do)
+def close_trade(con: sqlite3.Connection, ev: PerfEvent, ts: str) -> Dict[str, Any]:
+    tr = con.execute("SELECT * FROM trades WHERE trade_id=?", (ev.trade_id,)).fetchone()
+    if not tr:
+        raise HTTPException(404, "trade_id not found")
+    if tr["status"] != "OPEN":
+        raise HTTPException(409, "trade already closed")
+
+    entry = float(tr["entry"])
+    qty = float(tr["qty"])
+    risk_usd = float(tr["risk_usd"])
+    side = tr["side"]
+
+    exit_px = float(ev.exit)
+    pnl = (exit_px - entry) * qty if side == "LONG" else (entry - exit_px) * qty
+    r = pnl / risk_usd if risk_usd != 0 else 0.0
+
+    con.execute(
+        """
+        UPDATE trades
+        SET exit_ts=?, exit=?, status=?, pnl_real=?, r_real=?
+        WHERE trade_id=?
+        """,
+        (ts, exit_px, "CLOSED", pnl, r, ev.trade_id),
+    )
+    agg_close(con, tr["engine"], pnl, r, risk_usd)
+    equity_add(con, tr["engine"], ts, ev.trade_id, pnl)
+    return {"ok": True, "trade_id": ev.trade_id, "pnl_real": pnl, "r_real": r, "engine": tr["engine"], "risk_usd": risk_usd}
 
 
 def update_mark(ev: PerfEvent):
@@ -203,10 +415,7 @@ def update_mark(ev: PerfEvent):
         raise HTTPException(400, "UPDATE requires trade_id and mark")
 
     def _do():
-        con = db()
-        cur = con.cursor()
-        tr = cur.execute("SELECT status FROM trades WHERE trade_id=?", (ev.trade_id,)).fetchone()
-        con.close()
+        tr = rdb().execute("SELECT status FROM trades WHERE trade_id=?", (ev.trade_id,)).fetchone()
         if not tr:
             raise HTTPException(404, "trade_id not found")
         # Mark is informational; we keep it via the event log only.
@@ -214,34 +423,187 @@ def update_mark(ev: PerfEvent):
 
     return with_retry(_do)
 
+# ---------------- Aggregates ----------------
+# One row per engine + AGG_ALL (global): counts, wins, sum pnl / R, open risk.
+# Updated by the OPEN/CLOSE write steps inside the same transaction, so
+# /perf/summary reads O(engines) rows whatever the history size.
+# rebuild_aggregates() recomputes them from trades (tools/perf_rebuild.py).
+AGG_ALL = "*"
+
+def agg_open(con: sqlite3.Connection, engine: str, risk_usd: float) -> None:
+    con.executemany(
+        """
+        INSERT INTO aggregates(engine, total, open, open_risk) VALUES(?, 1, 1, ?)
+        ON CONFLICT(engine) DO UPDATE SET total=total+1, open=open+1, open_risk=open_risk+excluded.open_risk
+        """,
+        [(engine, risk_usd), (AGG_ALL, risk_usd)],
+    )
+
+def agg_close(con: sqlite3.Connection, engine: str, pnl: float, r: float, risk_usd: float) -> None:
+    con.executemany(
+        """
+        UPDATE aggregates
+        SET open=open-1, closed=closed+1, wins=wins+?, sum_pnl=sum_pnl+?, sum_r=sum_r+?, open_risk=open_risk-?
+        WHERE engine=?
+        """,
+        [(1 if pnl > 0 else 0, pnl, r, risk_usd, e) for e in (engine, AGG_ALL)],
+    )
+
+_AGG_SELECT = """
+    COUNT(*),
+    COALESCE(SUM(status='CLOSED'), 0),
+    COALESCE(SUM(status='OPEN'), 0),
+    COALESCE(SUM(status='CLOSED' AND pnl_real > 0), 0),
+    COALESCE(SUM(CASE WHEN status='CLOSED' THEN pnl_real END), 0.0),
+    COALESCE(SUM(CASE WHEN status='CLOSED' THEN r_real END), 0.0),
+    COALESCE(SUM(CASE WHEN status='OPEN' THEN risk_usd END), 0.0)
+    FROM trades"""
+
+def rebuild_aggregates(con: sqlite3.Connection) -> int:
+    """Recompute the aggregates table from trades (caller owns the transaction)."""
+    cols = "engine, total, closed, open, wins, sum_pnl, sum_r, open_risk"
+    con.execute("DELETE FROM aggregates")
+    con.execute(f"INSERT INTO aggregates({cols}) SELECT engine, {_AGG_SELECT} GROUP BY engine")
+    con.execute(f"INSERT INTO aggregates({cols}) SELECT ?, {_AGG_SELECT}", (AGG_ALL,))
+    return con.execute("SELECT COUNT(*) FROM aggregates").fetchone()[0]
+
+def rebuild_derived(con: sqlite3.Connection) -> Dict[str, int]:
+    """Recompute every table derived from trades (caller owns the transaction)."""
+    return {"aggregates_rows": rebuild_aggregates(con), "equity_rows": rebuild_equity(con)}
+
+def read_aggregates() -> Dict[str, sqlite3.Row]:
+    return {r["engine"]: r for r in rdb().execute("SELECT * FROM aggregates ORDER BY engine")}
+
+# ---------------- Equity curve ----------------
+# One row per CLOSED trade and scope (AGG_ALL + its engine), ordered by
+# (exit_ts, trade_id): cumulative equity, running peak, drawdown and the max
+# drawdown so far. Each scope starts at EQUITY0. A CLOSE that lands before
+# existing rows (out-of-order exit_ts) recomputes only the rows after it.
+PROM_EQUITY_RECOMPUTED = PROM.counter("equity_recomputed_rows_total", "Equity rows recomputed by out-of-order closes")
+
+_EQ0 = (EQUITY0, EQUITY0, 0.0, 0.0)  # equity, peak, max_dd, max_dd_pct before the first close
+
+def _eq_step(prev: Tuple[float, float, float, float], pnl: float) -> Tuple[float, float, float, float, float, float]:
+    equity, peak, max_dd, max_dd_pct = prev
+    equity += pnl
+    peak = max(peak, equity)
+    dd = peak - equity
+    dd_pct = (dd / peak * 100.0) if peak > 0 else 0.0
+    if dd > max_dd:
+        max_dd, max_dd_pct = dd, dd_pct
+    return equity, peak, dd, dd_pct, max_dd, max_dd_pct
+
+def equity_add(con: sqlite3.Connection, engine: str, exit_ts: str, trade_id: str, pnl: float) -> int:
+    """Insert a closed trade into the engine and global curves; returns the rows recomputed after it."""
+    recomputed = 0
+    for scope in (engine, AGG_ALL):
+        prev = con.execute(
+            """
+            SELECT equity, peak, max_dd, max_dd_pct FROM equity
+            WHERE scope=? AND (exit_ts, trade_id) < (?, ?)
+            ORDER BY exit_ts DESC, trade_id DESC LIMIT 1
+            """,
+            (scope, exit_ts, trade_id),
+        ).fetchone()
+        row = _eq_step(tuple(prev) if prev else _EQ0, pnl)
+        con.execute(
+            "INSERT INTO equity(scope, exit_ts, trade_id, pnl, equity, peak, dd, dd_pct, max_dd, max_dd_pct)"
+            " VALUES(?,?,?,?,?,?,?,?,?,?)",
+            (scope, exit_ts, trade_id, pnl, *row),
+        )
+        after = con.execute(
+            """
+            SELECT exit_ts, trade_id, pnl FROM equity
+            WHERE scope=? AND (exit_ts, trade_id) > (?, ?)
+            ORDER BY exit_ts, trade_id
+            """,
+            (scope, exit_ts, trade_id),
+        ).fetchall()
+        if not after:
+            continue
+        updates = []
+        state = (row[0], row[1], row[4], row[5])
+        for a in after:
+            r = _eq_step(state, float(a["pnl"]))
+            state = (r[0], r[1], r[4], r[5])
+            updates.append((*r, scope, a["exit_ts"], a["trade_id"]))
+        con.executemany(
+            "UPDATE equity SET equity=?, peak=?, dd=?, dd_pct=?, max_dd=?, max_dd_pct=?"
+            " WHERE scope=? AND exit_ts=? AND trade_id=?",
+            updates,
+        )
+        recomputed += len(updates)
+    if recomputed:
+        PROM_EQUITY_RECOMPUTED.inc(recomputed)
+    return recomputed
+
+def rebuild_equity(con: sqlite3.Connection) -> int:
+    """Recompute the equity table from trades (caller owns the transaction)."""
+    con.execute("DELETE FROM equity")
+    state: Dict[str, Tuple[float, float, float, float]] = {}
+    batch: List[tuple] = []
+    n = 0
+    cur = con.execute(
+        "SELECT engine, exit_ts, trade_id, pnl_real FROM trades WHERE status='CLOSED' ORDER BY exit_ts, trade_id"
+    )
+    for t in cur:
+        pnl = float(t["pnl_real"])
+        for scope in (t["engine"], AGG_ALL):
+            r = _eq_step(state.get(scope, _EQ0), pnl)
+            state[scope] = (r[0], r[1], r[4], r[5])
+            batch.append((scope, t["exit_ts"], t["trade_id"], pnl, *r))
+        if len(batch) >= 10000:
+            n += len(batch)
+            con.executemany("INSERT INTO equity VALUES(?,?,?,?,?,?,?,?,?,?)", batch)
+            batch.clear()
+    n += len(batch)
+    con.executemany("INSERT INTO equity VALUES(?,?,?,?,?,?,?,?,?,?)", batch)
+    return n
+
+def equity_last(scope: str = AGG_ALL) -> Optional[sqlite3.Row]:
+    return rdb().execute(
+        "SELECT * FROM equity WHERE scope=? ORDER BY exit_ts DESC, trade_id DESC LIMIT 1", (scope,)
+    ).fetchone()
+
+def equity_dd(scope: str = AGG_ALL) -> Dict[str, float]:
+    last = equity_last(scope)
+    if last is None:
+        return {"equity_last": EQUITY0, "dd": 0.0, "dd_pct": 0.0, "max_dd": 0.0, "max_dd_pct": 0.0}
+    return {
+        "equity_last": float(last["equity"]),
+        "dd": float(last["dd"]),
+        "dd_pct": float(last["dd_pct"]),
+        "max_dd": float(last["max_dd"]),
+        "max_dd_pct": float(last["max_dd_pct"]),
+    }
+
 # ---------------- Analytics ----------------
 
 def get_last_event_ts() -> Optional[str]:
-    con = db()
-    row = con.execute("SELECT ts FROM events ORDER BY ts DESC LIMIT 1").fetchone()
-    con.close()
+    row = rdb().execute("SELECT ts FROM events ORDER BY ts DESC LIMIT 1").fetchone()
     return row["ts"] if row else None
 
 def parse_iso(ts: str) -> datetime:
     return datetime.fromisoformat(ts.replace("Z", "+00:00"))
 
-def equity_series(include_open_live: bool = False, marks: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
-    # Equity based on CLOSED trades only (default)
-    con = db()
-    rows = con.execute("SELECT exit_ts, pnl_real FROM trades WHERE status='CLOSED' ORDER BY exit_ts").fetchall()
-    con.close()
+def equity_series(include_open_live: bool = False, marks: Optional[Dict[str, float]] = None,
+                  engine: Optional[str] = None) -> List[Dict[str, Any]]:
+    # Equity based on CLOSED trades only (default), read from the equity table
+    rows = rdb().execute(
+        "SELECT exit_ts, equity FROM equity WHERE scope=? ORDER BY exit_ts, trade_id",
+        (engine or AGG_ALL,),
+    ).fetchall()
 
     eq = EQUITY0
     series = [{"ts": None, "equity": eq}]
     for r in rows:
-        eq += float(r["pnl_real"])
+        eq = float(r["equity"])
         series.append({"ts": r["exit_ts"], "equity": eq})
 
     if include_open_live and marks:
         # add current open PnL as a last point
-        con = db()
-        open_rows = con.execute("SELECT trade_id, side, entry, qty FROM trades WHERE status='OPEN'").fetchall()
-        con.close()
+        sql = "SELECT trade_id, side, entry, qty FROM trades WHERE status='OPEN'"
+        open_rows = (rdb().execute(sql + " AND engine=?", (engine,)) if engine else rdb().execute(sql)).fetchall()
         live = 0.0
         for tr in open_rows:
             tid = tr["trade_id"]
@@ -269,55 +631,48 @@ def max_drawdown(series: List[Dict[str, Any]]) -> Dict[str, float]:
     return {"max_dd": max_dd, "max_dd_pct": max_dd_pct}
 
 def kpis() -> Dict[str, Any]:
-    con = db()
-    trades = con.execute("SELECT * FROM trades").fetchall()
-    con.close()
-
-    total = len(trades)
-    closed = [t for t in trades if t["status"] == "CLOSED"]
-    open_tr = [t for t in trades if t["status"] == "OPEN"]
-
-    wins = [t for t in closed if float(t["pnl_real"]) > 0]
-    winrate = (len(wins) / len(closed) * 100.0) if closed else 0.0
-    avg_r = (sum(float(t["r_real"]) for t in closed) / len(closed)) if closed else 0.0
-    pnl = sum(float(t["pnl_real"]) for t in closed)
+    aggs = read_aggregates()
+    g = aggs.get(AGG_ALL)
+    total = int(g["total"]) if g else 0
+    closed = int(g["closed"]) if g else 0
+    pnl = float(g["sum_pnl"]) if g else 0.0
 
-    open_risk = {}
-    for t in open_tr:
-        open_risk[t["engine"]] = open_risk.get(t["engine"], 0.0) + float(t["risk_usd"])
+    winrate = (int(g["wins"]) / closed * 100.0) if closed else 0.0
+    avg_r = (float(g["sum_r"]) / closed) if closed else 0.0
 
-    eq = equity_series(include_open_live=False)
-    dd = max_drawdown(eq)
+    dd = equity_dd(AGG_ALL)
 
     # engine KPIs
     engines = {}
-    for t in trades:
-        e = t["engine"]
-        engines.setdefault(e, {"total":0, "closed":0, "wins":0, "pnl":0.0, "avg_r":0.0, "rs":[], "open_risk":0.0})
-        engines[e]["total"] += 1
-        if t["status"] == "OPEN":
-            engines[e]["open_risk"] += float(t["risk_usd"])
-        else:
-            engines[e]["closed"] += 1
-            engines[e]["pnl"] += float(t["pnl_real"])
-            engines[e]["rs"].append(float(t["r_real"]))
-            if float(t["pnl_real"]) > 0:
-                engines[e]["wins"] += 1
-
-    for e, d in engines.items():
-        d["winrate"] = (d["wins"]/d["closed"]*100.0) if d["closed"] else 0.0
-        d["avg_r"] = (sum(d["rs"])/len(d["rs"])) if d["rs"] else 0.0
-        d.pop("rs", None)
+    open_risk = {}
+    for e, a in aggs.items():
+        if e == AGG_ALL or not a["total"]:
+            continue
+        edd = equity_dd(e)
+        risk = float(a["open_risk"]) if a["open"] else 0.0  # no float residue once all are closed
+        if a["open"]:
+            open_risk[e] = risk
+        engines[e] = {
+            "total": int(a["total"]),
+            "closed": int(a["closed"]),
+            "wins": int(a["wins"]),
+            "pnl": float(a["sum_pnl"]),
+            "avg_r": (float(a["sum_r"]) / a["closed"]) if a["closed"] else 0.0,
+            "open_risk": risk,
+            "winrate": (a["wins"] / a["closed"] * 100.0) if a["closed"] else 0.0,
+            "max_dd": edd["max_dd"],
+            "max_dd_pct": edd["max_dd_pct"],
+        }
 
     return {
         "equity0": EQUITY0,
         "total_trades": total,
-        "closed_trades": len(closed),
-        "open_trades": len(open_tr),
+        "closed_trades": closed,
+        "open_trades": int(g["open"]) if g else 0,
         "winrate_pct": winrate,
         "avg_r": avg_r,
         "pnl_realized": pnl,
-        "equity_last": eq[-1]["equity"],
+        "equity_last": dd["equity_last"],
         "max_dd": dd["max_dd"],
         "max_dd_pct": dd["max_dd_pct"],
         "open_risk_by_engine": open_risk,
@@ -326,20 +681,16 @@ def kpis() -> Dict[str, Any]:
     }
 
 # ---------------- Telegram sender ----------------
+# shared notifier: queued + rate-limited in its own thread, never blocks the caller
+TELEGRAM = notifier_from_env(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID)
+
 def telegram_send(text: str):
-    if not (TELEGRAM_TOKEN and TELEGRAM_CHAT_ID):
-        return
-    import urllib.request, urllib.parse
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    data = urllib.parse.urlencode({"chat_id": TELEGRAM_CHAT_ID, "text": text}).encode()
-    try:
-        urllib.request.urlopen(url, data=data, timeout=10).read()
-    except Exception:
-        pass
+    TELEGRAM.notify(text)
 
 # ---------------- Background monitors ----------------
 _last_no_activity_sent = 0.0
 _last_dd_sent = 0.0
+_last_engine_dd_sent: Dict[str, float] = {}
 
 def monitors_loop():
     global _last_no_activity_sent, _last_dd_sent
@@ -357,67 +708,128 @@ def monitors_loop():
         # drawdown
         info = kpis()
         dd_pct = float(info["max_dd_pct"])
+        PROM_EQUITY.set(float(info["equity_last"]))
+        PROM_DD_PCT.set(dd_pct)
         if dd_pct > DD_ALERT_PCT and (time.time() - _last_dd_sent) > 900:
             telegram_send(f"🧯 PERF: global DD {dd_pct:.2f}% > {DD_ALERT_PCT:.2f}%")
             _last_dd_sent = time.time()
+        for e, st in info["engines"].items():
+            e_pct = float(st["max_dd_pct"])
+            if e_pct > ENGINE_DD_ALERT_PCT and (time.time() - _last_engine_dd_sent.get(e, 0.0)) > 900:
+                telegram_send(f"🧯 PERF: {e} DD {e_pct:.2f}% > {ENGINE_DD_ALERT_PCT:.2f}%")
+                _last_engine_dd_sent[e] = time.time()
+
+def prom_load_open():
+    rows = rdb().execute(
+        "SELECT engine, COUNT(*) AS n, COALESCE(SUM(risk_usd), 0) AS risk FROM trades WHERE status='OPEN' GROUP BY engine"
+    ).fetchall()
+    for r in rows:
+        PROM_OPEN_TRADES.set(r["n"], engine=r["engine"])
+        PROM_OPEN_RISK.set(float(r["risk"]), engine=r["engine"])
 
-@app.on_event("startup")
+# include_router() copies the router's startup handlers into the app *and*
+# merges its lifespan: the hook can fire twice, only the first call runs.
+_started = False
+_started_lock = threading.Lock()
+
+@router.on_event("startup")
 def startup():
+    global _started
+    with _started_lock:
+        if _started:
+            return
+        _started = True
     init_db()
-    import threading
+    prom_load_open()
     t = threading.Thread(target=monitors_loop, daemon=True)
     t.start()
 
+@router.on_event("shutdown")
+def shutdown():
+    WRITER.stop()
+
 # ---------------- Routes ----------------
-@app.post("/perf/event")
+@router.post("/perf/event")
 def perf_event(ev: PerfEvent):
     ev.type = ev.type.upper().strip()
     if ev.type not in ("OPEN","CLOSE","UPDATE"):
         raise HTTPException(400, "type must be OPEN|CLOSE|UPDATE")
+    PROM_EVENTS.inc(type=ev.type)
+    if ev.type == "OPEN":
+        check_open(ev)
+    elif ev.type == "CLOSE":
+        check_close(ev)
 
-    # store event first
-    eid, ts = insert_event(ev)
+    eid = "E_" + uuid.uuid4().hex[:16]
+    ts = ev.ts or now_iso()
+    trade_id = ev.trade_id
+    if ev.type == "OPEN" and not trade_id:
+        trade_id = f"T_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{ev.engine}_{uuid.uuid4().hex[:6]}"
+
+    # event row + trade mutation: one job, one transaction (group-committed)
+    def job(con: sqlite3.Connection):
+        insert_event(con, ev, eid, ts)
+        if ev.type == "OPEN":
+            return create_trade_from_open(con, ev, trade_id, ts)
+        if ev.type == "CLOSE":
+            return close_trade(con, ev, ts)
+        return None
+
+    res = WRITER.call(job)
 
     if ev.type == "OPEN":
-        trade_id = create_trade_from_open(ev)
+        if res:
+            PROM_OPEN_TRADES.inc(engine=ev.engine)
+            PROM_OPEN_RISK.inc(float(ev.risk_usd), engine=ev.engine)
         return {"ok": True, "event_id": eid, "trade_id": trade_id, "ts": ts}
 
     if ev.type == "CLOSE":
-        close_trade(ev)
+        PROM_OPEN_TRADES.dec(engine=res["engine"])
+        PROM_OPEN_RISK.dec(res["risk_usd"], engine=res["engine"])
         return {"ok": True, "event_id": eid, "trade_id": ev.trade_id, "ts": ts}
 
     # UPDATE: stored only for now
     return {"ok": True, "event_id": eid, "ts": ts}
 
-@app.get("/perf/summary")
+def ingest(data: Dict[str, Any]) -> Dict[str, Any]:
+    """In-process equivalent of POST /perf/event (same validation, same errors)."""
+    try:
+        ev = PerfEvent.model_validate(data)
+    except ValidationError as e:
+        raise HTTPException(422, str(e)[:500])
+    return perf_event(ev)
+
+@app.get("/metrics")
+def prom_metrics():
+    return Response(PROM.render(), media_type=PROM_CONTENT_TYPE)
+
+@router.get("/perf/summary")
 def perf_summary():
     return kpis()
 
-@app.get("/perf/equity")
-def perf_equity():
-    series = equity_series(include_open_live=False)
-    return {"series": series, "dd": max_drawdown(series)}
+@router.get("/perf/equity")
+def perf_equity(engine: str | None = None):
+    dd = equity_dd(engine or AGG_ALL)
+    return {"engine": engine, "series": equity_series(include_open_live=False, engine=engine),
+            "dd": {"max_dd": dd["max_dd"], "max_dd_pct": dd["max_dd_pct"]}}
 
-@app.get("/perf/open")
+@router.get("/perf/open")
 def perf_open_trades():
-    con = db()
-    rows = con.execute("""
+    rows = rdb().execute("""
         SELECT trade_id, engine, symbol, side, status, entry_ts, entry, stop, qty, risk_usd
         FROM trades
         WHERE status='OPEN'
         ORDER BY entry_ts DESC
     """).fetchall()
-    con.close()
     return {"open": [dict(r) for r in rows]}
 
-@app.get("/perf/trades")
+@router.get("/perf/trades")
 def perf_trades(
     limit: int = Query(50, ge=1, le=500),
     engine: str | None = None,
     status: str | None = None,   # OPEN / CLOSED
     symbol: str | None = None,
 ):
-    con = db()
     where = []
     params = {}
 
@@ -433,7 +845,7 @@ def perf_trades(
 
     where_sql = ("WHERE " + " AND ".join(where)) if where else ""
 
-    rows = con.execute(f"""
+    rows = rdb().execute(f"""
         SELECT trade_id, status, engine, symbol, side,
                entry, stop, exit,
                qty, risk_usd,
@@ -444,11 +856,13 @@ def perf_trades(
         ORDER BY entry_ts DESC
         LIMIT :limit
     """, {**params, "limit": limit}).fetchall()
-
-    con.close()
     return {"trades": [dict(r) for r in rows], "limit": limit, "filters": params}
 
-@app.get("/perf/ui", response_class=HTMLResponse)
+@router.get("/perf/pool")
+def perf_pool():
+    return {**pool_stats(), "writer": {**WRITER.stats, "queue": WRITER.depth(), "flush_ms": PERF_WRITE_FLUSH_MS}}
+
+@router.get("/perf/ui", response_class=HTMLResponse)
 def perf_ui():
     return """<!doctype html>
 <html>
@@ -980,3 +1394,5 @@ setInterval(()=>{ if(document.getElementById('autorefresh').checked) refreshAll(
 </body>
 </html>
 """
+
+app.include_router(router)
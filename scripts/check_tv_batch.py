@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Offline check: a /tv/batch backfill is admitted in full under the default limits,
+and the per-symbol batch limit still answers 429 per item once its bucket is empty.
+
+Runs webhook_server in-process (TestClient) against a throwaway TRADING_BASE_DIR,
+so nothing touches /opt/trading. Exit 1 on failure.
+
+  python3 scripts/check_tv_batch.py
+"""
+import os
+import sys
+import json
+import pathlib
+import tempfile
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+N = 40  # > every default per-engine / per-symbol burst
+
+
+def main():
+    base = tempfile.mkdtemp(prefix="check_tv_batch_")
+    os.environ["TRADING_BASE_DIR"] = base
+    os.environ["TV_WEBHOOK_KEY"] = "check"
+    os.environ["PERF_INPROCESS"] = "0"
+    os.environ["TELEGRAM_ENABLED"] = "0"
+    state = pathlib.Path(base) / "state"
+    state.mkdir()
+    (state / "risk_config.json").write_text(json.dumps(
+        {"accounts": {"TV_TEST": {"equity_usd": 10000, "risk_pct": 1, "min_qty": 0.001, "qty_step": 0.001}}}
+    ), encoding="utf-8")
+
+    from fastapi.testclient import TestClient
+    import webhook_server
+
+    def items(symbol, n, t0):
+        return [
+            {"engine": "TV_TEST", "signal": "BUY", "symbol": symbol, "tf": "5",
+             "price": 40000.0 + i, "sl": 39800.0 + i, "tp": 40400.0 + i, "bar_time": t0 + i * 300000}
+            for i in range(n)
+        ]
+
+    with TestClient(webhook_server.app) as c:
+        r = c.post("/tv/batch", json={"key": "check", "items": items("BTCUSDT", N, 1700000000000)})
+        out = r.json()
+        bad = [x for x in out.get("results", []) if not x.get("ok")]
+        ok = r.status_code == 200 and out.get("accepted") == N and not bad
+        print(json.dumps({"check": "backfill", "ok": ok, "status": r.status_code, "accepted": out.get("accepted"), "rejected": bad[:3]}))
+
+        # tiny symbol bucket: 5 items pass, the rest get a per-item 429
+        webhook_server.ADMISSION.batch_buckets["symbol"] = webhook_server.TokenBuckets("0.001:5", 100)
+        r = c.post("/tv/batch", json={"key": "check", "items": items("ETHUSDT", 8, 1800000000000)})
+        st = [x.get("status", 200) for x in r.json().get("results", [])]
+        limited = r.status_code == 200 and st == [200] * 5 + [429] * 3
+        print(json.dumps({"check": "symbol_limit", "ok": limited, "status": r.status_code, "item_status": st}))
+    if not (ok and limited):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,10 +22,17 @@ mkdir -p tmp
   python3 -m py_compile webhook_server.py
   python3 -m py_compile perf/perf_app.py
   python3 -m py_compile adapters/webhook_to_perf.py
+  python3 -m py_compile shared/prom.py
+  python3 -m py_compile shared/http_client.py
+  python3 -m py_compile tools/replay_events.py
   python3 -m py_compile strategy_logic.py
   echo "OK py_compile"
   echo
 
+  echo "== /tv/batch admission (offline) =="
+  python3 scripts/check_tv_batch.py
+  echo
+
   echo "== smoke =="
 ./scripts/smoke.sh
 SMOKE_RC=$?
@@ -0,0 +1,164 @@
+"""Shared outbound HTTP layer (httpx).
+
+One sync client per process and one async client per event loop, reused by
+every caller: keep-alive connection pools per host, HTTP/2 when the `h2`
+package is installed (HTTP_CLIENT_HTTP2=0 to disable), the same default
+timeouts everywhere, and per-host counters (host_stats()).
+"""
+import os
+import time
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+HTTPStatusError = httpx.HTTPStatusError
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_CLIENT_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CLIENT_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_CLIENT_KEEPALIVE_EXPIRY", "60"))
+USER_AGENT = os.getenv("HTTP_CLIENT_USER_AGENT", "magikgmo/1.0")
+
+try:
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "1").strip() not in ("0", "false", "no")
+except ImportError:
+    HTTP2 = False
+
+_lock = threading.Lock()
+_client: Optional[httpx.Client] = None
+_async_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _host_stats(host: str) -> Dict[str, float]:
+    st = _stats.get(host)
+    if st is None:
+        st = _stats.setdefault(host, {
+            "requests": 0, "errors": 0, "2xx": 0, "3xx": 0, "4xx": 0, "5xx": 0,
+            "seconds_total": 0.0, "seconds_max": 0.0,
+        })
+    return st
+
+
+def _record(host: str, status: Optional[int], elapsed: float) -> None:
+    with _lock:
+        st = _host_stats(host)
+        st["requests"] += 1
+        if status is None:
+            st["errors"] += 1
+        else:
+            st[f"{min(5, max(2, status // 100))}xx"] += 1
+        st["seconds_total"] += elapsed
+        st["seconds_max"] = max(st["seconds_max"], elapsed)
+
+
+def _on_request(request: httpx.Request) -> None:
+    request.extensions["t0"] = time.perf_counter()
+
+
+def _on_response(response: httpx.Response) -> None:
+    t0 = response.request.extensions.get("t0")
+    _record(response.request.url.host, response.status_code, time.perf_counter() - t0 if t0 else 0.0)
+
+
+async def _aon_request(request: httpx.Request) -> None:
+    _on_request(request)
+
+
+async def _aon_response(response: httpx.Response) -> None:
+    _on_response(response)
+
+
+def _client_kwargs() -> Dict[str, Any]:
+    return {
+        "http2": HTTP2,
+        "timeout": httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "headers": {"User-Agent": USER_AGENT},
+    }
+
+
+def client() -> httpx.Client:
+    """Process-wide sync client (httpx.Client is thread-safe)."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.Client(
+                    event_hooks={"request": [_on_request], "response": [_on_response]},
+                    **_client_kwargs(),
+                )
+    return _client
+
+
+def async_client() -> httpx.AsyncClient:
+    """Async client of the running event loop (created on first use)."""
+    loop = asyncio.get_running_loop()
+    c = _async_clients.get(loop)
+    if c is None or c.is_closed:
+        c = _async_clients[loop] = httpx.AsyncClient(
+            event_hooks={"request": [_aon_request], "response": [_aon_response]},
+            **_client_kwargs(),
+        )
+    return c
+
+
+def request(method: str, url: str, **kw: Any) -> httpx.Response:
+    t0 = time.perf_counter()
+    try:
+        return client().request(method, url, **kw)
+    except httpx.HTTPError:
+        _record(urlsplit(url).hostname or "", None, time.perf_counter() - t0)
+        raise
+
+
+async def arequest(method: str, url: str, **kw: Any) -> httpx.Response:
+    t0 = time.perf_counter()
+    try:
+        return await async_client().request(method, url, **kw)
+    except httpx.HTTPError:
+        _record(urlsplit(url).hostname or "", None, time.perf_counter() - t0)
+        raise
+
+
+def get_json(url: str, params: Optional[Dict[str, Any]] = None, **kw: Any) -> Any:
+    """GET url, raise on HTTP error status, return the decoded JSON body."""
+    r = request("GET", url, params=params, **kw)
+    r.raise_for_status()
+    return r.json()
+
+
+def post_json(url: str, payload: Any, **kw: Any) -> Any:
+    """POST payload as JSON, raise on HTTP error status, return the decoded body ({} if empty)."""
+    r = request("POST", url, json=payload, **kw)
+    r.raise_for_status()
+    return r.json() if r.content else {}
+
+
+def host_stats() -> Dict[str, Dict[str, float]]:
+    with _lock:
+        return {h: dict(st) for h, st in _stats.items()}
+
+
+def close() -> None:
+    global _client
+    with _lock:
+        c, _client = _client, None
+    if c is not None:
+        c.close()
+
+
+async def aclose() -> None:
+    """Close the async client of the running loop."""
+    c = _async_clients.pop(asyncio.get_running_loop(), None)
+    if c is not None:
+        await c.aclose()
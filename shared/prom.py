@@ -0,0 +1,211 @@
+"""Minimal Prometheus text exposition (format 0.0.4), no client library needed.
+
+Counters/gauges/histograms live in memory; /metrics only renders them.
+Gauges and counters can also be bound to a callable (`set_function`) that must
+return an in-memory value (queue size, a stats dict kept by a worker...), never
+run a query. A counter's callable must only ever grow.
+"""
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if v == -math.inf:
+        return "-Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_esc(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        self._v: Dict[LabelValues, float] = {}
+        self._fn: Optional[Callable[[], object]] = None
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+    def set_function(self, fn: Callable[[], object]) -> None:
+        """fn() -> number (no labels) or {label value(s): number}."""
+        self._fn = fn
+
+    def _items(self) -> List[Tuple[LabelValues, float]]:
+        if self._fn is None:
+            with self._lock:
+                return sorted(self._v.items())
+        try:
+            got = self._fn()
+        except Exception:
+            got = None
+        if isinstance(got, dict):
+            return sorted(((k if isinstance(k, tuple) else (k,)), float(v)) for k, v in got.items())
+        if got is None:
+            return []
+        return [((), float(got))]
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in self._items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._v[k] = self._v.get(k, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._v.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._v[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._v[k] = self._v.get(k, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self._v.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._v: Dict[LabelValues, List[float]] = {}  # [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels: str) -> None:
+        k = self._key(labels)
+        with self._lock:
+            row = self._v.get(k)
+            if row is None:
+                row = self._v[k] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._v.items())
+        out = self.header()
+        for k, row in items:
+            acc = 0.0
+            for i, b in enumerate(self.buckets):
+                acc += row[i]
+                le = 'le="%s"' % _fmt(b)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {_fmt(acc)}")
+            acc += row[len(self.buckets)]
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {_fmt(acc)}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_fmt(row[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {_fmt(acc)}")
+        return out
+
+
+class Registry:
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: List[_Metric] = []
+
+    def _add(self, m: _Metric) -> _Metric:
+        for old in self._metrics:
+            if old.name == m.name:
+                return old  # same name registered twice (e.g. middleware stack rebuilt)
+        self._metrics.append(m)
+        return m
+
+    def counter(self, name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self.prefix + name, doc, labels))  # type: ignore[return-value]
+
+    def gauge(self, name: str, doc: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(self.prefix + name, doc, labels))  # type: ignore[return-value]
+
+    def histogram(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, doc, labels, buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+class PromMiddleware:
+    """ASGI middleware: <prefix>http_requests_total{method,route,status} and
+    <prefix>http_request_duration_seconds{route}. The route label is the route
+    template (FastAPI sets scope["route"]), unmatched paths count as "other"."""
+
+    def __init__(self, app, registry: Registry, skip: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.skip = set(skip)
+        self.requests = registry.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+        self.latency = registry.histogram("http_request_duration_seconds", "HTTP request latency (to response start)", ("route",))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.skip:
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status = {"code": 500, "seen": False}
+
+        async def _send(message):
+            if message["type"] == "http.response.start" and not status["seen"]:
+                status["code"] = message["status"]
+                status["seen"] = True
+                route = getattr(scope.get("route"), "path", None) or "other"
+                self.latency.observe(time.perf_counter() - t0, route=route)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send=_send)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "other"
+            if not status["seen"]:
+                self.latency.observe(time.perf_counter() - t0, route=route)
+            self.requests.inc(method=scope.get("method", ""), route=route, status=str(status["code"]))
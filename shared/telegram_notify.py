@@ -1,6 +1,19 @@
 import os
-import requests
+import time
 import html
+import queue
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+import http_client
+
+TELEGRAM_API = "https://api.telegram.org"
+TELEGRAM_MAX_LEN = 4000  # API limit is 4096
+
+
 def send_telegram(message: str):
     token = os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("TELEGRAM_TOKEN")
     chat_id = os.getenv("TELEGRAM_CHAT_ID")
@@ -8,12 +21,212 @@ def send_telegram(message: str):
     if not token or not chat_id:
         raise RuntimeError("Telegram env vars not set")
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+    url = f"{TELEGRAM_API}/bot{token}/sendMessage"
     payload = {
         "chat_id": chat_id,
         "text": html.escape(message),
         "parse_mode": "HTML",
         "disable_web_page_preview": True,
     }
-    r = requests.post(url, json=payload, timeout=10)
+    r = http_client.request("POST", url, json=payload, timeout=10)
     r.raise_for_status()
+
+
+class TelegramNotifier:
+    """Fire-and-forget Telegram sender for the services (webhook, perf).
+
+    notify() only puts the message on a bounded queue and returns; a daemon
+    thread does the network part:
+    - messages arriving within `coalesce_s` for the same chat go out as one digest,
+    - identical texts for a chat within `dedup_s` are sent once,
+    - a token bucket per chat (`rate_per_s`, `burst`) keeps under Telegram's limits,
+    - 429 (honouring retry_after), 5xx and network errors are retried with backoff.
+    When the queue is full new messages are dropped (counted), callers never block.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        chat_id: str,
+        queue_max: int = 1000,
+        coalesce_s: float = 2.0,
+        dedup_s: float = 60.0,
+        rate_per_s: float = 1.0,
+        burst: float = 3.0,
+        max_attempts: int = 5,
+        timeout: float = 10.0,
+    ):
+        self.token = (token or "").strip()
+        self.chat_id = str(chat_id or "").strip()
+        self.coalesce_s = max(0.0, coalesce_s)
+        self.dedup_s = dedup_s
+        self.rate_per_s = max(0.01, rate_per_s)
+        self.burst = max(1.0, burst)
+        self.max_attempts = max(1, max_attempts)
+        self.timeout = timeout
+        self.stats: Dict[str, Any] = {
+            "queued": 0, "sent": 0, "messages": 0, "dropped": 0, "deduped": 0,
+            "retries": 0, "failed": 0, "last_error": None, "last_sent_at": None,
+        }
+        self._q: "queue.Queue[Optional[Tuple[str, str]]]" = queue.Queue(max(1, queue_max))
+        self._recent: Dict[str, float] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # chat -> (tokens, at)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token and self.chat_id)
+
+    def notify(self, text: str, chat_id: Optional[str] = None) -> bool:
+        """Queue text for chat_id (default chat). False if disabled or the queue is full."""
+        chat = str(chat_id or self.chat_id)
+        if not (self.token and chat and text):
+            return False
+        self._ensure_started()
+        try:
+            self._q.put_nowait((chat, text))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flush what is queued (best effort within timeout) and stop the thread."""
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._q.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+                self._thread.start()
+
+    # ---- worker ----
+    def _run(self) -> None:
+        while True:
+            first = self._q.get()
+            if first is None:
+                return
+            pending: Dict[str, List[str]] = {}
+            stop = False
+            item: Optional[Tuple[str, str]] = first
+            deadline = time.monotonic() + self.coalesce_s
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                self._add(pending, *item)
+                try:
+                    timeout = deadline - time.monotonic()
+                    item = self._q.get(timeout=timeout) if timeout > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+            for chat, texts in pending.items():
+                for digest in self._digests(texts):
+                    self._wait_token(chat)
+                    self._send(chat, digest)
+                self.stats["messages"] += len(texts)
+            if stop:
+                return
+
+    def _add(self, pending: Dict[str, List[str]], chat: str, text: str) -> None:
+        now = time.monotonic()
+        if self.dedup_s > 0:
+            if len(self._recent) > 10000:
+                self._recent = {k: t for k, t in self._recent.items() if now - t < self.dedup_s}
+            key = chat + ":" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+            seen = self._recent.get(key)
+            if seen is not None and now - seen < self.dedup_s:
+                self.stats["deduped"] += 1
+                return
+            self._recent[key] = now
+        pending.setdefault(chat, []).append(text)
+
+    @staticmethod
+    def _digests(texts: List[str]) -> List[str]:
+        if len(texts) == 1:
+            return [texts[0][:TELEGRAM_MAX_LEN]]
+        out: List[str] = []
+        cur = f"🧾 {len(texts)} messages"
+        for t in texts:
+            t = t[:TELEGRAM_MAX_LEN - 40]
+            if len(cur) + 2 + len(t) > TELEGRAM_MAX_LEN:
+                out.append(cur)
+                cur = "🧾 (suite)"
+            cur += "\n\n" + t
+        out.append(cur)
+        return out
+
+    def _wait_token(self, chat: str) -> None:
+        now = time.monotonic()
+        tokens, at = self._buckets.get(chat, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - at) * self.rate_per_s)
+        if tokens < 1.0:
+            time.sleep((1.0 - tokens) / self.rate_per_s)
+            now = time.monotonic()
+            tokens = 1.0
+        self._buckets[chat] = (tokens - 1.0, now)
+
+    def _post(self, chat: str, text: str) -> httpx.Response:
+        return http_client.request(
+            "POST",
+            f"{TELEGRAM_API}/bot{self.token}/sendMessage",
+            json={"chat_id": chat, "text": text, "disable_web_page_preview": True},
+            timeout=self.timeout,
+        )
+
+    def _send(self, chat: str, text: str) -> bool:
+        delay = 1.0
+        for attempt in range(1, self.max_attempts + 1):
+            retry_after: Optional[float] = None
+            try:
+                r = self._post(chat, text)
+                if r.status_code < 300:
+                    self.stats["sent"] += 1
+                    self.stats["last_sent_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+                    return True
+                err = f"HTTP {r.status_code}: {r.text[:200]}"
+                if r.status_code == 429:
+                    try:
+                        retry_after = float(r.json().get("parameters", {}).get("retry_after"))
+                    except Exception:
+                        retry_after = None
+                elif r.status_code < 500:
+                    self.stats["failed"] += 1
+                    self.stats["last_error"] = err
+                    return False
+            except Exception as e:
+                err = repr(e)
+            self.stats["last_error"] = err
+            if attempt == self.max_attempts:
+                break
+            self.stats["retries"] += 1
+            time.sleep(retry_after if retry_after is not None else delay)
+            delay = min(delay * 2, 60.0)
+        self.stats["failed"] += 1
+        return False
+
+
+def notifier_from_env(token: Optional[str] = None, chat_id: Optional[str] = None) -> TelegramNotifier:
+    """TelegramNotifier configured from TELEGRAM_* env vars (token/chat can be overridden)."""
+    return TelegramNotifier(
+        token if token is not None else (os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("TELEGRAM_TOKEN") or ""),
+        chat_id if chat_id is not None else (os.getenv("TELEGRAM_CHAT_ID") or ""),
+        queue_max=int(os.getenv("TELEGRAM_QUEUE_MAX", "1000")),
+        coalesce_s=float(os.getenv("TELEGRAM_COALESCE_S", "2")),
+        dedup_s=float(os.getenv("TELEGRAM_DEDUP_S", "60")),
+        rate_per_s=float(os.getenv("TELEGRAM_RATE_PER_S", "1")),
+        burst=float(os.getenv("TELEGRAM_BURST", "3")),
+        max_attempts=int(os.getenv("TELEGRAM_MAX_ATTEMPTS", "5")),
+    )
@@ -1,11 +1,13 @@
 import json
 import time
-import urllib.parse
 import os
-import urllib.request
+import sys
 from dataclasses import dataclass
 from typing import List, Dict, Any
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared"))
+import http_client
+
 BASE = "https://api.bitget.com"
 
 @dataclass
@@ -19,13 +21,13 @@ class Candle:
     quote: float
 
 def _get(path: str, params: Dict[str, str] | None = None) -> Dict[str, Any]:
-    qs = ""
-    if params:
-        qs = "?" + urllib.parse.urlencode(params)
-    url = BASE + path + qs
-    req = urllib.request.Request(url, headers={"User-Agent":"tv-perf-bitget/1.0"})
-    with urllib.request.urlopen(req, timeout=int(os.environ.get('BITGET_TIMEOUT','8'))) as r:
-        return json.loads(r.read().decode("utf-8"))
+    # pooled keep-alive client: the runner polls every few seconds on the same host
+    return http_client.get_json(
+        BASE + path,
+        params=params,
+        headers={"User-Agent": "tv-perf-bitget/1.0"},
+        timeout=float(os.environ.get('BITGET_TIMEOUT', '8')),
+    )
 
 def fetch_candles_usdt_futures(symbol: str, granularity_sec: int, limit: int = 200) -> List[Candle]:
     params = {
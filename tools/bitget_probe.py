@@ -1,15 +1,12 @@
-import time, json, urllib.parse, urllib.request
+import os, sys, time, json
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared"))
+import http_client
 
 BASE = "https://api.bitget.com"
 
 def get(path, params=None):
-    qs = ""
-    if params:
-        qs = "?" + urllib.parse.urlencode(params)
-    url = BASE + path + qs
-    req = urllib.request.Request(url, headers={"User-Agent":"tv-perf-probe/1.0"})
-    with urllib.request.urlopen(req, timeout=20) as r:
-        return json.loads(r.read().decode("utf-8"))
+    return http_client.get_json(BASE + path, params=params, headers={"User-Agent": "tv-perf-probe/1.0"}, timeout=20)
 
 def main():
     # 1) time
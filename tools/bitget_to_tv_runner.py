@@ -1,4 +1,4 @@
-import os, json, time, urllib.request, urllib.error
+import os, json, time
 from datetime import datetime, timezone
 from pathlib import Path
 import sys
@@ -6,8 +6,11 @@ import sys
 # garantir import depuis /opt/trading/tools (bitget_feed.py est là)
 if "/opt/trading/tools" not in sys.path:
     sys.path.insert(0, "/opt/trading/tools")
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "shared"))
 
 from bitget_feed import fetch_candles_usdt_futures
+import http_client
 
 
 def _utc_now_iso() -> str:
@@ -31,15 +34,8 @@ def _save_json(path: str, obj) -> None:
 
 
 def _post_json(url: str, payload: dict, timeout: int = 15) -> dict:
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(payload).encode("utf-8"),
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    with urllib.request.urlopen(req, timeout=timeout) as r:
-        raw = r.read().decode("utf-8", errors="replace")
-        return json.loads(raw) if raw else {}
+    # same keep-alive connection to /tv on every bar
+    return http_client.post_json(url, payload, timeout=timeout)
 
 
 def main():
@@ -116,6 +112,7 @@ def main():
                 "sl": sl,
                 "tp": None,
                 "reason": f"bitget bar-close ts={bar_ts}",
+                "bar_time": bar_ts,  # idempotency: /tv dedups retries of the same bar
                 "_ts": _utc_now_iso(),
             }
 
@@ -136,9 +133,9 @@ def main():
                 _save_json(state_f, {"last_ts_ms": last_ts, "updated_at": _utc_now_iso()})
                 if one_shot:
                     return
-            except urllib.error.HTTPError as e:
-                body = e.read().decode("utf-8", errors="replace")
-                print(f"[{datetime.now().isoformat()}] TV HTTPError {e.code}: {body}")
+            except http_client.HTTPStatusError as e:
+                body = e.response.text
+                print(f"[{datetime.now().isoformat()}] TV HTTPError {e.response.status_code}: {body}")
 
             time.sleep(poll_s)
 
@@ -1,22 +1,17 @@
 import json
 import os
-import urllib.request
+import sys
 from datetime import datetime, timezone
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared"))
+import http_client
+
 # Default to the actual FastAPI route we discovered in webhook_server.py
 WEBHOOK_URL = os.environ.get("TV_WEBHOOK_URL", "http://127.0.0.1:8000/tv")
 TV_WEBHOOK_KEY = os.environ.get("TV_WEBHOOK_KEY", "")
 
 def post(payload: dict) -> dict:
-    body = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        WEBHOOK_URL,
-        data=body,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    with urllib.request.urlopen(req, timeout=20) as r:
-        return json.loads(r.read().decode("utf-8"))
+    return http_client.post_json(WEBHOOK_URL, payload, timeout=20)
 
 def main():
     if not TV_WEBHOOK_KEY:
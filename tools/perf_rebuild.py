@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Rebuild the derived tables of perf.db from the trades table.
+
+The perf service keeps them up to date on every OPEN/CLOSE; run this after
+editing trades by hand, restoring a backup, or if /perf/summary looks off.
+Safe while the service runs (one transaction).
+
+  PERF_DB_PATH=/opt/trading/perf/perf.db python3 tools/perf_rebuild.py
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "perf"))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rebuild perf.db derived tables from trades")
+    ap.add_argument("--db", help="perf.db path (default: PERF_DB_PATH or perf/perf.db)")
+    args = ap.parse_args()
+    if args.db:
+        os.environ["PERF_DB_PATH"] = args.db
+
+    import perf_app
+
+    perf_app.init_db()
+    out = {"db": perf_app.DB_PATH}
+    t0 = time.perf_counter()
+    with perf_app.tx() as con:
+        out.update(perf_app.rebuild_derived(con))
+    out["ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    print(json.dumps(out, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Replay historical webhook events (state/events.jsonl + sealed segments) for load tests.
+
+Re-emits events against /tv (or /tv/batch) or /perf/event, keeping the original
+inter-arrival gaps divided by --speed (or as fast as possible with --speed max),
+with at most --concurrency requests in flight. Keys and timestamps are rewritten,
+and each replayed alert gets a fresh alert_id so the webhook idempotency cache
+does not swallow it (--keep-ids to replay the originals as retries).
+
+Examples:
+  python3 tools/replay_events.py --speed 60 --limit 500
+  python3 tools/replay_events.py --speed max --concurrency 32 --batch 20
+  python3 tools/replay_events.py --target perf --url http://127.0.0.1:8010/perf/event --speed max
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import pathlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "shared"))
+
+import http_client
+from event_log import EventLog
+from adapters.webhook_to_perf import webhook_event_to_perf_event
+
+TV_FIELDS = ("engine", "signal", "symbol", "tf", "price", "tp", "sl", "reason")
+
+
+def parse_ts(evt: Dict[str, Any]) -> Optional[float]:
+    raw = evt.get("_ts") or evt.get("ts")
+    if not raw:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(raw).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def load_events(args) -> List[Dict[str, Any]]:
+    if args.file:
+        src = (json.loads(ln) for ln in pathlib.Path(args.file).open("rb") if ln.strip())
+    else:
+        src = EventLog(pathlib.Path(args.state_dir)).iter_oldest_first()
+    out: List[Dict[str, Any]] = []
+    for i, evt in enumerate(src):
+        if i < args.start:
+            continue
+        if args.engine and evt.get("engine") not in args.engine:
+            continue
+        out.append(evt)
+        if args.limit and len(out) >= args.limit:
+            break
+    return out
+
+
+def tv_payload(evt: Dict[str, Any], key: str, run_id: str, i: int, keep_ids: bool, ts: str) -> Dict[str, Any]:
+    p = {k: evt[k] for k in TV_FIELDS if evt.get(k) not in (None, "")}
+    p["key"] = key
+    p["ts"] = ts
+    if not keep_ids:
+        p["alert_id"] = f"replay-{run_id}-{i}"
+    elif evt.get("alert_id"):
+        p["alert_id"] = evt["alert_id"]
+    return p
+
+
+def perf_payload(evt: Dict[str, Any], ts: str) -> Optional[Dict[str, Any]]:
+    p = webhook_event_to_perf_event({**evt, "_ts": ts, "ts": ts})
+    if not p or p.get("ignored"):
+        return None
+    return p
+
+
+def pct(xs: List[float], p: float) -> Optional[float]:
+    if not xs:
+        return None
+    return round(xs[min(len(xs) - 1, int(p * len(xs)))] * 1000.0, 3)
+
+
+async def replay(args) -> Dict[str, Any]:
+    events = load_events(args)
+    if not events:
+        return {"ok": False, "error": "no events"}
+
+    speed = 0.0 if str(args.speed).lower() in ("max", "0", "inf") else float(args.speed)
+    run_id = uuid.uuid4().hex[:8]
+    key = args.key if args.key is not None else os.environ.get("TV_WEBHOOK_KEY", "")
+
+    # schedule: original offset from the first event, divided by speed
+    t_first: Optional[float] = None
+    span = 0.0
+    plan: List[Tuple[float, Dict[str, Any]]] = []
+    for evt in events:
+        ts = parse_ts(evt)
+        if ts is not None:
+            t_first = ts if t_first is None else t_first
+            span = max(span, ts - t_first)
+        off = (ts - t_first) if ts is not None else (plan[-1][0] * (speed or 1) if plan else 0.0)
+        plan.append((max(0.0, off) / speed if speed > 0 else 0.0, evt))
+
+    # one request per event, or groups of --batch consecutive events to /tv/batch
+    batch = max(1, args.batch) if args.target == "tv" else 1
+    url = args.url
+    if batch > 1 and not url.rstrip("/").endswith("/batch"):
+        url = url.rstrip("/") + "/batch"
+    requests: List[Tuple[float, List[Tuple[float, int, Dict[str, Any]]]]] = []
+    for j in range(0, len(plan), batch):
+        chunk = [(due, j + k, e) for k, (due, e) in enumerate(plan[j:j + batch])]
+        requests.append((chunk[0][0], chunk))
+
+    stats: Dict[str, Any] = {"requests": 0, "events": 0, "skipped": 0, "status": {}, "item_status": {}, "errors": 0, "last_error": None}
+    lat: List[float] = []
+    lag: List[float] = []
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+    t0 = time.perf_counter()
+    wall0 = time.time()
+
+    def stamp(due: float, evt: Dict[str, Any]) -> str:
+        if args.keep_ts:
+            return evt.get("_ts") or evt.get("ts") or ""
+        return datetime.fromtimestamp(wall0 + due, timezone.utc).isoformat()
+
+    def build(chunk: List[Tuple[float, int, Dict[str, Any]]]) -> Optional[Any]:
+        if args.target == "perf":
+            due, _, evt = chunk[0]
+            return perf_payload(evt, stamp(due, evt))
+        items = [tv_payload(e, key, run_id, i, args.keep_ids, stamp(d, e)) for d, i, e in chunk]
+        return {"key": key, "items": items} if batch > 1 else items[0]
+
+    async def send(url: str, payload: Any, n: int, due: float) -> None:
+        async with sem:
+            start = time.perf_counter()
+            lag.append(max(0.0, start - t0 - due))
+            if args.dry_run:
+                print(json.dumps(payload, ensure_ascii=False))
+                status = 0
+            else:
+                try:
+                    r = await http_client.arequest("POST", url, json=payload, timeout=args.timeout)
+                    status = r.status_code
+                    if batch > 1 and status == 200:
+                        # /tv/batch: per-item outcome
+                        for it in r.json().get("results") or []:
+                            st = "dup" if it.get("duplicate") else (200 if it.get("ok") else it.get("status"))
+                            stats["item_status"][st] = stats["item_status"].get(st, 0) + 1
+                except Exception as e:
+                    stats["errors"] += 1
+                    stats["last_error"] = repr(e)
+                    return
+            lat.append(time.perf_counter() - start)
+            stats["status"][status] = stats["status"].get(status, 0) + 1
+            stats["events"] += n
+
+    tasks = []
+    for due, chunk in requests:
+        wait = t0 + due - time.perf_counter()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        payload = build(chunk)
+        if payload is None:
+            stats["skipped"] += len(chunk)
+            continue
+        stats["requests"] += 1
+        tasks.append(asyncio.create_task(send(url, payload, len(chunk), due)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - t0
+    await http_client.aclose()
+
+    lat.sort()
+    lag.sort()
+    return {
+        "ok": True,
+        "target": args.target,
+        "url": url,
+        "speed": "max" if speed == 0 else speed,
+        "concurrency": args.concurrency,
+        "batch": batch,
+        "source_events": len(events),
+        "source_span_s": round(span, 3),
+        "elapsed_s": round(elapsed, 3),
+        "events_per_s": round(stats["events"] / elapsed, 1) if elapsed > 0 else None,
+        "requests_per_s": round(len(lat) / elapsed, 1) if elapsed > 0 else None,
+        "latency_ms": {"p50": pct(lat, 0.5), "p90": pct(lat, 0.9), "p99": pct(lat, 0.99), "max": round(lat[-1] * 1000.0, 3) if lat else None},
+        "schedule_lag_ms": {"p50": pct(lag, 0.5), "p99": pct(lag, 0.99), "max": round(lag[-1] * 1000.0, 3) if lag else None},
+        **stats,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay webhook events against /tv or /perf/event")
+    ap.add_argument("--state-dir", default=os.environ.get("STATE_DIR", "/opt/trading/state"))
+    ap.add_argument("--file", help="read this .jsonl instead of the segmented event log")
+    ap.add_argument("--target", choices=("tv", "perf"), default="tv")
+    ap.add_argument("--url", help="default: TV_WEBHOOK_URL (tv) or PERF_URL (perf)")
+    ap.add_argument("--speed", default="1", help="1 = real time, 60 = 60x faster, max = no gaps")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--batch", type=int, default=1, help="tv only: >1 sends groups of N to /tv/batch")
+    ap.add_argument("--start", type=int, default=0, help="skip the first N events of the log")
+    ap.add_argument("--limit", type=int, default=0)
+    ap.add_argument("--engine", action="append", help="only these engines (repeatable)")
+    ap.add_argument("--key", help="webhook key to put in payloads (default: TV_WEBHOOK_KEY)")
+    ap.add_argument("--keep-ids", action="store_true", help="do not give replayed alerts a fresh alert_id")
+    ap.add_argument("--keep-ts", action="store_true", help="keep original timestamps instead of replay time")
+    ap.add_argument("--timeout", type=float, default=15.0)
+    ap.add_argument("--dry-run", action="store_true", help="print payloads, send nothing")
+    args = ap.parse_args()
+    if not args.url:
+        args.url = (os.environ.get("TV_WEBHOOK_URL", "http://127.0.0.1:8000/tv") if args.target == "tv"
+                    else os.environ.get("PERF_URL", "http://127.0.0.1:8010/perf/event"))
+
+    res = asyncio.run(replay(args))
+    print(json.dumps(res, indent=2, ensure_ascii=False))
+    if not res.get("ok"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
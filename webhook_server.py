@@ -1,38 +1,43 @@
 import os
+import sys
 import json
 import math
 import time
 import html
 import pathlib
-import urllib.request
-import urllib.parse
-import requests
 import hmac
+import logging
+import contextlib
+import hashlib
+import gzip
+import shutil
+import sqlite3
+import asyncio
+import threading
+import queue
+import concurrent.futures
+from collections import OrderedDict, deque
 
 PERF_URL = os.getenv("PERF_URL", "http://127.0.0.1:8010/perf/event")
 
-def perf_open(engine: str, symbol: str, side: str, entry: float, stop: float, qty: float, risk_usd: float, meta: dict | None = None):
-    payload = {
-        "type": "OPEN",
-        "engine": engine,
-        "symbol": symbol,
-        "side": side,
-        "entry": float(entry),
-        "stop": float(stop),
-        "qty": float(qty),
-        "risk_usd": float(risk_usd),
-        "meta": meta or {}
-    }
-    try:
-        requests.post(PERF_URL, json=payload, timeout=2)
-    except Exception:
-        # perf est optionnel: ne jamais casser le webhook
-        pass
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, Response
+
+try:
+    import numpy as np  # optional: vectorized risk_quote_batch
+except ImportError:
+    np = None
+
+from event_log import EventLog
+from adapters.webhook_to_perf import build_trade_id
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent / "shared"))
+from prom import Registry, PromMiddleware, CONTENT_TYPE as PROM_CONTENT_TYPE
+from telegram_notify import notifier_from_env
+import http_client
 
 try:
     from dotenv import load_dotenv
@@ -42,14 +47,17 @@ except Exception:
 
 
 APP_TITLE = "TV Webhook Server"
-BASE_DIR = pathlib.Path("/opt/trading")
+BASE_DIR = pathlib.Path(os.getenv("TRADING_BASE_DIR", "/opt/trading"))  # other root: benchmarks, staging
 STATE_DIR = BASE_DIR / "state"
 STATE_DIR.mkdir(parents=True, exist_ok=True)
 
 JOURNAL_PATH = BASE_DIR / "journal.md"
-EVENTS_JSONL = STATE_DIR / "events.jsonl"
-ROUTER_STATE = STATE_DIR / "router_state.json"
+EVENTS_JSONL = STATE_DIR / "events.jsonl"  # active segment, see EVENT_LOG
+ROUTER_STATE = STATE_DIR / "router_state.json"  # legacy, migrated into ROUTER_DB
+ROUTER_DB = STATE_DIR / "router.db"
 RISK_CONFIG = STATE_DIR / "risk_config.json"
+PERF_OUTBOX_DB = STATE_DIR / "perf_outbox.db"
+IDEMPOTENCY_JSONL = STATE_DIR / "idempotency.jsonl"
 
 TV_WEBHOOK_KEY = os.getenv("TV_WEBHOOK_KEY", "").strip()
 OPS_ADMIN_KEY = os.getenv("OPS_ADMIN_KEY", "").strip()
@@ -67,6 +75,33 @@ ALL_ENGINES = {"COINM_SHORT", "USDTM_LONG", "GOLD_CFD_LONG", "TV_TEST", "NGROK_T
 
 app = FastAPI(title=APP_TITLE)
 
+# -------------------- Prometheus --------------------
+# Everything /metrics exposes is kept in memory (counters updated on the hot
+# path, gauges read from in-process structures); a scrape never hits the disk.
+PROM = Registry("webhook_")
+app.add_middleware(PromMiddleware, registry=PROM)
+PROM_SIGNALS = PROM.counter("signals_total", "Signals by route and result (accepted|rejected|duplicate), reason = HTTP status", ("route", "result", "reason"))
+PROM_ADMISSION = PROM.counter("admission_rejected_total", "429s from admission control by limiter (engine|symbol|ip|inflight)", ("limiter",))
+PROM.gauge("tv_inflight", "/tv + /tv/batch requests in flight").set_function(lambda: ADMISSION.inflight)
+PROM_OUTBOX = PROM.counter("outbox_deliveries_total", "Perf outbox delivery outcomes", ("result",))
+PROM_OUTBOX_DEPTH = PROM.gauge("outbox_depth", "Rows waiting in the perf outbox")
+PROM_OUTBOX_DEAD = PROM.gauge("outbox_dead_letter", "Rows in the perf outbox dead-letter table")
+PROM.gauge("writer_queue_depth", "Pending batches for the group-commit writer").set_function(lambda: EVENT_WRITER.depth())
+PROM.counter("writer_batches_total", "Batches written by the group-commit writer").set_function(lambda: EVENT_WRITER.stats["batches"])
+PROM.gauge("events_ring_size", "Events held in the in-memory ring").set_function(lambda: EVENTS_RING.size())
+PROM.gauge("idempotency_entries", "Keys in the idempotency cache").set_function(lambda: IDEMPOTENCY.size())
+PROM.gauge("telegram_queue_depth", "Messages waiting in the Telegram notifier").set_function(lambda: TELEGRAM.depth())
+PROM.counter("telegram_total", "Telegram notifier counters (queued, sent, failed, retries...)", ("kind",)).set_function(
+    lambda: {k: v for k, v in TELEGRAM.stats.items() if isinstance(v, (int, float))}
+)
+PROM.gauge("http_client", "Outbound HTTP per host (shared/http_client.py)", ("host", "kind")).set_function(
+    lambda: {(h, k): v for h, st in http_client.host_stats().items() for k, v in st.items()}
+)
+PROM.gauge("sse_subscribers", "Connected /api/stream clients").set_function(lambda: STREAM.subscribers)
+PROM.gauge("active_engine", "1 for the engine holding the aggressive lock", ("engine",)).set_function(
+    lambda: {e: 1 for e in [ROUTER.state().get("active_engine")] if e}
+)
+
 
 # -------------------- Utils --------------------
 def utc_now() -> datetime:
@@ -89,53 +124,165 @@ def read_json_file(path: pathlib.Path, default: Any) -> Any:
     except Exception:
         return default
 
-def write_json_file(path: pathlib.Path, obj: Any) -> None:
-    path.write_text(json.dumps(obj, ensure_ascii=False), encoding="utf-8")
-
-def append_jsonl(path: pathlib.Path, obj: Dict[str, Any]) -> None:
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+# Engine lock (active_engine) lives in a one-row SQLite table (WAL): every
+# change is a single conditional UPDATE, i.e. an atomic compare-and-set even
+# across processes. Each process caches the row and revalidates it with
+# PRAGMA data_version, which only moves when another connection committed.
+# router_state.json is imported once, then renamed.
+# Only the lock is shared: the idempotency cache, event ring / metrics,
+# dashboard version, admission buckets and the outbox drainer are per process,
+# so the service still runs as a single uvicorn worker.
+class RouterStore:
+    def __init__(self, path: pathlib.Path, legacy_json: pathlib.Path):
+        self.path = path
+        self.legacy_json = legacy_json
+        self._lock = threading.Lock()
+        self._con: Optional[sqlite3.Connection] = None
+        self._dv: Optional[int] = None
+        self._st: Optional[Dict[str, Any]] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._con is None:
+            con = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA busy_timeout=5000")
+            con.execute("""
+            CREATE TABLE IF NOT EXISTS router_state (
+              id INTEGER PRIMARY KEY CHECK (id = 1),
+              active_engine TEXT,
+              updated_at TEXT,
+              rev INTEGER NOT NULL DEFAULT 0
+            )""")
+            self._migrate(con)
+            self._con = con
+        return self._con
+
+    def _migrate(self, con: sqlite3.Connection) -> None:
+        raw = read_json_file(self.legacy_json, None)
+        raw = raw if isinstance(raw, dict) else {}
+        cur = con.execute(
+            "INSERT OR IGNORE INTO router_state(id, active_engine, updated_at) VALUES(1, ?, ?)",
+            (raw.get("active_engine") or None, raw.get("updated_at")),
+        )
+        if cur.rowcount and self.legacy_json.exists():
+            # the JSON is no longer read: keep it for reference, out of the way
+            os.replace(self.legacy_json, self.legacy_json.with_name(self.legacy_json.name + ".migrated"))
+
+    def _read_locked(self) -> Tuple[Dict[str, Any], bool]:
+        """-> (state, changed by another process since the last read)"""
+        con = self._db()
+        dv = con.execute("PRAGMA data_version").fetchone()[0]
+        if self._st is not None and dv == self._dv:
+            return self._st, False
+        eng, upd, rev = con.execute("SELECT active_engine, updated_at, rev FROM router_state WHERE id=1").fetchone()
+        prev = self._st
+        self._dv = dv
+        self._st = {"active_engine": eng or None, "updated_at": upd, "rev": rev}
+        return self._st, prev is not None and prev["rev"] != rev
+
+    def get(self) -> Tuple[Dict[str, Any], bool]:
+        with self._lock:
+            st, changed = self._read_locked()
+            return dict(st), changed
+
+    def state(self) -> Dict[str, Any]:
+        """Last state this process read or wrote (no query; may lag other processes)."""
+        return dict(self._st or {})
+
+    def cas(self, expected: Optional[str], new: Optional[str], unconditional: bool = False) -> Tuple[bool, bool, Dict[str, Any]]:
+        """Set active_engine to `new` if it is `expected` (or, unconditional, if it differs).
+        -> (swapped, written, state after the call)."""
+        with self._lock:
+            con = self._db()
+            now = iso_utc(utc_now())
+            if unconditional:
+                cur = con.execute(
+                    "UPDATE router_state SET active_engine=?, updated_at=?, rev=rev+1 WHERE id=1 AND active_engine IS NOT ?",
+                    (new, now, new),
+                )
+            elif expected == new:
+                cur = None
+            else:
+                cur = con.execute(
+                    "UPDATE router_state SET active_engine=?, updated_at=?, rev=rev+1 WHERE id=1 AND active_engine IS ?",
+                    (new, now, expected),
+                )
+            # own commits do not move data_version: force a re-read after a write
+            if cur is not None and cur.rowcount:
+                self._st = None
+            st, _ = self._read_locked()
+            written = bool(cur is not None and cur.rowcount)
+            swapped = written or unconditional or (expected == new and st["active_engine"] == expected)
+            return swapped, written, dict(st)
+
+ROUTER = RouterStore(ROUTER_DB, ROUTER_STATE)
+
+def _router_changed(st: Dict[str, Any]) -> None:
+    bump_version()
+    STREAM.publish("state", state_payload(st))
 
 def ensure_router_state() -> Dict[str, Any]:
-    st = read_json_file(ROUTER_STATE, {})
-    if not isinstance(st, dict):
-        st = {}
-    st.setdefault("active_engine", None)
-    st.setdefault("updated_at", None)
-    write_json_file(ROUTER_STATE, st)
+    st, changed = ROUTER.get()
+    if changed:
+        # lock moved in another worker: refresh this worker's dashboards
+        _router_changed(st)
     return st
 
 def set_router_state(active_engine: Optional[str]) -> Dict[str, Any]:
-    st = ensure_router_state()
-    st["active_engine"] = active_engine
-    st["updated_at"] = iso_utc(utc_now())
-    write_json_file(ROUTER_STATE, st)
+    _, written, st = ROUTER.cas(None, active_engine or None, unconditional=True)
+    if written:
+        _router_changed(st)
     return st
 
+def cas_router_state(expected: Optional[str], new: Optional[str]) -> Tuple[bool, Dict[str, Any]]:
+    """Compare-and-set active_engine: set to `new` only if it currently equals `expected`.
+    Atomic across worker processes. Returns (swapped, state after the call)."""
+    swapped, written, st = ROUTER.cas(expected or None, new or None)
+    if written:
+        _router_changed(st)
+    return swapped, st
+
+# Telegram goes through the shared notifier (shared/telegram_notify.py):
+# queued, coalesced, deduped and rate-limited in its own thread.
+TELEGRAM = notifier_from_env(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID)
+
 def telegram_send(text: str) -> bool:
     if not TELEGRAM_ENABLED:
         return False
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        return False
+    return TELEGRAM.notify(text)
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    data = urllib.parse.urlencode({
-        "chat_id": TELEGRAM_CHAT_ID,
-        "text": text,
-        "disable_web_page_preview": "true"
-    }).encode("utf-8")
 
-    try:
-        req = urllib.request.Request(url, data=data, method="POST")
-        with urllib.request.urlopen(req, timeout=8) as resp:
-            _ = resp.read()
-        return True
-    except Exception:
-        return False
+# -------------------- Version --------------------
+# Bumped on every accepted /tv event and every lock change; snapshot ETags derive from it.
+_version_lock = threading.Lock()
+_version = int(time.time() * 1000)  # start from wall clock so versions do not repeat across restarts
+
+def bump_version() -> int:
+    global _version
+    with _version_lock:
+        _version += 1
+        return _version
+
+def current_version() -> int:
+    return _version
 
 
 # -------------------- Risk --------------------
-def load_risk_config() -> Dict[str, Any]:
+# risk_config.json is parsed once and cached; each lookup only stat()s the file
+# and reloads when (inode, mtime, size) changed. Per-engine sizing params are
+# derived lazily and memoized in the snapshot, which is swapped in as a whole.
+_risk_lock = threading.Lock()
+_risk_snap: Dict[str, Any] = {"key": None, "cfg": None, "engines": {}}
+
+def _risk_stat_key() -> Optional[Tuple[int, int, int]]:
+    try:
+        st = RISK_CONFIG.stat()
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _read_risk_config() -> Dict[str, Any]:
     cfg = read_json_file(RISK_CONFIG, {})
     if not isinstance(cfg, dict):
         cfg = {}
@@ -143,6 +290,24 @@ def load_risk_config() -> Dict[str, Any]:
     cfg.setdefault("gold_cfd", {})
     return cfg
 
+def _risk_snapshot(force: bool = False) -> Dict[str, Any]:
+    global _risk_snap
+    key = _risk_stat_key()
+    snap = _risk_snap
+    if not force and snap["cfg"] is not None and snap["key"] == key:
+        return snap
+    with _risk_lock:
+        if not force and _risk_snap["cfg"] is not None and _risk_snap["key"] == key:
+            return _risk_snap
+        _risk_snap = {"key": key, "cfg": _read_risk_config(), "engines": {}}
+        return _risk_snap
+
+def load_risk_config() -> Dict[str, Any]:
+    return _risk_snapshot()["cfg"]
+
+def reload_risk_config() -> Dict[str, Any]:
+    return _risk_snapshot(force=True)["cfg"]
+
 def _get_equity_and_risk_pct(acct: dict) -> Tuple[float, float]:
     # equity can be "equity" or "equity_usd"
     equity = float(acct.get("equity_usd", acct.get("equity", 0)) or 0)
@@ -165,20 +330,51 @@ def _get_equity_and_risk_pct(acct: dict) -> Tuple[float, float]:
 
     return equity, risk_pct
 
+def risk_params(engine: str) -> Dict[str, Any]:
+    """Normalized sizing params for engine (equity, risk_pct, min_qty, qty_step, quote type)."""
+    snap = _risk_snapshot()
+    p = snap["engines"].get(engine)
+    if p is not None:
+        return p
+
+    cfg = snap["cfg"]
+    accounts = cfg.get("accounts", {}) or {}
+    acct = accounts.get(engine, {}) or {}
+    equity, risk_pct = _get_equity_and_risk_pct(acct)
+
+    if engine == "GOLD_CFD_LONG":
+        min_qty = safe_float(acct.get("min_units", acct.get("min_qty", 0.1))) or 0.1
+        qty_step = safe_float(acct.get("units_step", acct.get("qty_step", 0.1))) or 0.1
+        qtype = "GOLD_CFD_OZ" if (cfg.get("gold_cfd", {}) or {}).get("units_are_oz", True) else "GOLD_CFD"
+    else:
+        # COINM/USDTM: keep generic sizing (you can later plug real contract specs)
+        min_qty = safe_float(acct.get("min_qty", 0.001)) or 0.001
+        qty_step = safe_float(acct.get("qty_step", 0.001)) or 0.001
+        qtype = "LINEAR_FALLBACK"
+
+    p = {
+        "equity": equity,
+        "risk_pct": risk_pct,
+        "risk_usd": equity * risk_pct,
+        "min_qty": min_qty,
+        "qty_step": qty_step,
+        "type": qtype,
+    }
+    snap["engines"][engine] = p
+    return p
+
 def round_step(x: float, step: float) -> float:
     if step <= 0:
         return x
     return math.floor(x / step + 1e-12) * step
 
 def risk_quote(engine: str, price: float, sl: float, tp: float) -> Dict[str, Any]:
-    cfg = load_risk_config()
-    accounts = cfg.get("accounts", {}) or {}
-    acct = accounts.get(engine, {}) or {}
+    return _quote_one(risk_params(engine), price, sl)
 
-    equity, risk_pct = _get_equity_and_risk_pct(acct)
-    risk_usd = equity * risk_pct
+def _quote_one(p: Dict[str, Any], price: float, sl: float) -> Dict[str, Any]:
+    risk_usd = p["risk_usd"]
 
-    distance = abs(price - sl)
+    distance = abs(float(price) - float(sl))
     if distance <= 0 or risk_usd <= 0:
         return {
             "ok": True,
@@ -191,60 +387,372 @@ def risk_quote(engine: str, price: float, sl: float, tp: float) -> Dict[str, Any
 
     # Default linear: PnL per 1 qty per $ move = 1 (fallback)
     qty = risk_usd / distance
-
-    if engine == "GOLD_CFD_LONG":
-        min_units = safe_float(acct.get("min_units", acct.get("min_qty", 0.1))) or 0.1
-        units_step = safe_float(acct.get("units_step", acct.get("qty_step", 0.1))) or 0.1
-        qty = max(qty, min_units)
-        qty = round_step(qty, units_step)
-        qty = round(qty, 6)
-        risk_real = qty * distance
-        return {
-            "ok": True,
-            "type": "GOLD_CFD_OZ" if (cfg.get("gold_cfd", {}) or {}).get("units_are_oz", True) else "GOLD_CFD",
-            "risk_usd": round(risk_usd, 6),
-            "risk_real_usd": round(risk_real, 6),
-            "distance": round(distance, 6),
-            "qty": qty
-        }
-
-    # COINM/USDTM: keep generic sizing (you can later plug real contract specs)
-    min_qty = safe_float(acct.get("min_qty", 0.001)) or 0.001
-    qty_step = safe_float(acct.get("qty_step", 0.001)) or 0.001
-    qty = max(qty, min_qty)
-    qty = round_step(qty, qty_step)
+    qty = max(qty, p["min_qty"])
+    qty = round_step(qty, p["qty_step"])
     qty = round(qty, 6)
     risk_real = qty * distance
     return {
         "ok": True,
-        "type": "LINEAR_FALLBACK",
+        "type": p["type"],
         "risk_usd": round(risk_usd, 6),
         "risk_real_usd": round(risk_real, 6),
         "distance": round(distance, 6),
         "qty": qty
     }
 
+RISK_BATCH_MAX = int(os.getenv("RISK_BATCH_MAX", "100000"))
+QUOTE_COLUMNS = ("type", "risk_usd", "risk_real_usd", "distance", "qty")
+
+def risk_quote_batch(engines: List[str], prices: List[float], sls: List[float]) -> Dict[str, List[Any]]:
+    """risk_quote() over arrays, columnar result {column: [value per row]}.
+    Params are resolved once per engine; with numpy each engine's rows are sized
+    in one vectorized pass. Values and types match _quote_one() row for row:
+    prices are taken as floats, rows with no distance or no risk get int 0 for
+    qty / risk_real_usd, and the 6-decimal rounding uses Python round()
+    (np.round differs on some halves). tp plays no part in sizing, so it is not
+    taken here."""
+    n = len(engines)
+    if len(prices) != n or len(sls) != n:
+        raise ValueError("engine, price and sl must have the same length")
+    out: Dict[str, List[Any]] = {c: [None] * n for c in QUOTE_COLUMNS}
+    groups: Dict[str, List[int]] = {}
+    for i, e in enumerate(engines):
+        groups.setdefault(e, []).append(i)
+
+    for engine, idx in groups.items():
+        p = risk_params(engine)
+        if np is None:
+            for i in idx:
+                q = _quote_one(p, float(prices[i]), float(sls[i]))
+                for c in QUOTE_COLUMNS:
+                    out[c][i] = q[c]
+            continue
+
+        risk_usd = p["risk_usd"]
+        price = np.asarray([prices[i] for i in idx], dtype=np.float64)
+        sl = np.asarray([sls[i] for i in idx], dtype=np.float64)
+        distance = np.abs(price - sl)
+        bad = (distance <= 0) | (risk_usd <= 0)
+        # rows flagged bad are not used below, inf/nan there are expected
+        with np.errstate(divide="ignore", invalid="ignore"):
+            qty = np.maximum(risk_usd / distance, p["min_qty"])
+            step = p["qty_step"]
+            if step > 0:
+                qty = np.floor(qty / step + 1e-12) * step
+            qty = np.asarray([round(x, 6) for x in qty.tolist()], dtype=np.float64)
+            risk_real = (qty * distance).tolist()
+        r_usd = round(risk_usd, 6)
+        badl = bad.tolist()
+        cols = {
+            "type": ["LINEAR_FALLBACK" if b else p["type"] for b in badl],
+            "risk_usd": [r_usd] * len(idx),
+            "risk_real_usd": [0 if b else round(r, 6) for b, r in zip(badl, risk_real)],
+            "distance": [round(d, 6) for d in distance.tolist()],
+            "qty": [0 if b else q for b, q in zip(badl, qty.tolist())],
+        }
+        if len(groups) == 1:
+            return cols
+        for c, vals in cols.items():
+            col = out[c]
+            for i, v in zip(idx, vals):
+                col[i] = v
+    return out
+
+
+# -------------------- Perf outbox --------------------
+# /tv never calls perf inline: OPEN payloads are appended to a local SQLite queue
+# (state/perf_outbox.db) and a background task drains it with retry/backoff.
+# Rows that keep failing (or that perf rejects with a 4xx) go to dead_letter.
+PERF_TIMEOUT = float(os.getenv("PERF_TIMEOUT", "2"))
+OUTBOX_BATCH = int(os.getenv("PERF_OUTBOX_BATCH", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("PERF_OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("PERF_OUTBOX_BACKOFF_BASE", "1"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("PERF_OUTBOX_BACKOFF_MAX", "300"))
+OUTBOX_POLL_S = float(os.getenv("PERF_OUTBOX_POLL_S", "5"))
+OUTBOX_CLAIM_S = float(os.getenv("PERF_OUTBOX_CLAIM_S", "60"))  # a claimed row is due again after this (crashed drainer)
+
+# PERF_INPROCESS=1 (webhook + perf on the same host): the perf router is mounted
+# in this app (/perf/*, same perf.db) and the outbox hands events straight to
+# perf_app.ingest() instead of POSTing them to PERF_URL over loopback.
+PERF_INPROCESS = os.getenv("PERF_INPROCESS", "0").strip() in ("1", "true", "True", "yes", "YES")
+perf_local = None
+if PERF_INPROCESS:
+    sys.path.append(str(pathlib.Path(__file__).resolve().parent / "perf"))
+    import perf_app as perf_local
+    app.include_router(perf_local.router)
+
+_outbox_lock = threading.Lock()
+_outbox_con: Optional[sqlite3.Connection] = None
+_outbox_wake: Optional[asyncio.Event] = None
+_outbox_stats: Dict[str, Any] = {"sent": 0, "retried": 0, "dead": 0, "last_error": None, "last_sent_at": None}
+
+def _outbox_db() -> sqlite3.Connection:
+    global _outbox_con
+    if _outbox_con is None:
+        con = sqlite3.connect(str(PERF_OUTBOX_DB), timeout=30, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          created_at REAL NOT NULL,
+          next_at REAL NOT NULL,
+          attempts INTEGER NOT NULL DEFAULT 0,
+          payload TEXT NOT NULL,
+          last_error TEXT
+        )""")
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS dead_letter (
+          id INTEGER PRIMARY KEY,
+          created_at REAL NOT NULL,
+          dead_at REAL NOT NULL,
+          attempts INTEGER NOT NULL,
+          payload TEXT NOT NULL,
+          last_error TEXT
+        )""")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_outbox_next ON outbox(next_at)")
+        con.commit()
+        _outbox_con = con
+    return _outbox_con
+
+def outbox_enqueue(payloads: List[Dict[str, Any]]) -> None:
+    if not payloads:
+        return
+    now = time.time()
+    rows = [(now, now, json.dumps(p, ensure_ascii=False)) for p in payloads]
+    with _outbox_lock:
+        con = _outbox_db()
+        con.executemany("INSERT INTO outbox(created_at, next_at, payload) VALUES(?,?,?)", rows)
+        con.commit()
+    PROM_OUTBOX_DEPTH.inc(len(rows))
+    if _outbox_wake is not None:
+        _outbox_wake.set()
+
+def perf_open_payload(engine: str, symbol: str, side: str, entry: float, stop: float, qty: float, risk_usd: float, meta: dict | None = None) -> Dict[str, Any]:
+    # trade_id fixed at enqueue time: a redelivery (timeout after perf committed,
+    # crash between send and delete) hits perf's idempotent OPEN, not a new trade
+    return {
+        "type": "OPEN",
+        "trade_id": build_trade_id(engine, symbol, side, {"entry": entry, "stop": stop, "qty": qty, "meta": meta or {}}),
+        "engine": engine,
+        "symbol": symbol,
+        "side": side,
+        "entry": float(entry),
+        "stop": float(stop),
+        "qty": float(qty),
+        "risk_usd": float(risk_usd),
+        "meta": meta or {}
+    }
+
+def _outbox_backoff(attempts: int) -> float:
+    return min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+
+async def _outbox_send(payload: str) -> Tuple[bool, bool, Optional[str]]:
+    """-> (delivered, permanent_failure, error)"""
+    if perf_local is not None:
+        return await _outbox_send_local(payload)
+    try:
+        r = await http_client.arequest(
+            "POST", PERF_URL, content=payload, headers={"Content-Type": "application/json"}, timeout=PERF_TIMEOUT,
+        )
+    except Exception as e:
+        return False, False, repr(e)
+    if r.status_code < 300:
+        return True, False, None
+    # 4xx (except 408/429) will not get better on retry
+    permanent = 400 <= r.status_code < 500 and r.status_code not in (408, 429)
+    return False, permanent, f"HTTP {r.status_code}: {r.text[:200]}"
+
+async def _outbox_send_local(payload: str) -> Tuple[bool, bool, Optional[str]]:
+    try:
+        await asyncio.to_thread(perf_local.ingest, json.loads(payload))
+    except HTTPException as e:
+        permanent = 400 <= e.status_code < 500 and e.status_code not in (408, 429)
+        return False, permanent, f"HTTP {e.status_code}: {str(e.detail)[:200]}"
+    except Exception as e:
+        return False, False, repr(e)
+    return True, False, None
+
+def _outbox_with_trade_id(payload: str) -> Optional[str]:
+    """Rows queued before OPENs carried a trade_id: pin one (None if the row already has it)."""
+    p = json.loads(payload)
+    if p.get("type") != "OPEN" or p.get("trade_id"):
+        return None
+    p["trade_id"] = build_trade_id(p.get("engine") or "", p.get("symbol") or "", p.get("side") or "", p)
+    return json.dumps(p, ensure_ascii=False)
+
+async def outbox_drain_once() -> int:
+    # claim the due rows (next_at pushed past the send) so concurrent drainers skip them
+    now = time.time()
+    with _outbox_lock:
+        con = _outbox_db()
+        rows = con.execute(
+            """
+            UPDATE outbox SET next_at=?
+            WHERE id IN (SELECT id FROM outbox WHERE next_at <= ? ORDER BY id LIMIT ?)
+            RETURNING id, created_at, attempts, payload
+            """,
+            (now + OUTBOX_CLAIM_S, now, OUTBOX_BATCH),
+        ).fetchall()
+        pinned = []
+        for i, (rid, created_at, attempts, payload) in enumerate(rows):
+            fixed = _outbox_with_trade_id(payload)
+            if fixed is not None:
+                rows[i] = (rid, created_at, attempts, fixed)
+                pinned.append((fixed, rid))
+        con.executemany("UPDATE outbox SET payload=? WHERE id=?", pinned)
+        con.commit()
+    if not rows:
+        return 0
+    rows.sort()
+
+    results = await asyncio.gather(*(_outbox_send(r[3]) for r in rows))
+
+    now = time.time()
+    done, retry, dead = [], [], []
+    for (rid, created_at, attempts, payload), (ok, permanent, err) in zip(rows, results):
+        if ok:
+            done.append((rid,))
+        elif permanent or attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+            dead.append((rid, created_at, now, attempts + 1, payload, err))
+        else:
+            retry.append((now + _outbox_backoff(attempts + 1), err, rid))
+        if err:
+            _outbox_stats["last_error"] = err
+
+    with _outbox_lock:
+        con = _outbox_db()
+        con.executemany("DELETE FROM outbox WHERE id=?", done + [(d[0],) for d in dead])
+        con.executemany(
+            "INSERT OR REPLACE INTO dead_letter(id, created_at, dead_at, attempts, payload, last_error) VALUES(?,?,?,?,?,?)",
+            dead,
+        )
+        con.executemany("UPDATE outbox SET attempts=attempts+1, next_at=?, last_error=? WHERE id=?", retry)
+        con.commit()
+
+    _outbox_stats["sent"] += len(done)
+    _outbox_stats["retried"] += len(retry)
+    _outbox_stats["dead"] += len(dead)
+    PROM_OUTBOX.inc(len(done), result="sent")
+    PROM_OUTBOX.inc(len(retry), result="retried")
+    PROM_OUTBOX.inc(len(dead), result="dead")
+    PROM_OUTBOX_DEPTH.dec(len(done) + len(dead))
+    PROM_OUTBOX_DEAD.inc(len(dead))
+    if done:
+        _outbox_stats["last_sent_at"] = iso_utc(utc_now())
+    return len(done)
+
+async def outbox_worker() -> None:
+    global _outbox_wake
+    _outbox_wake = asyncio.Event()
+    # perf calls go through the shared keep-alive pool (shared/http_client.py)
+    while True:
+        try:
+            sent = await outbox_drain_once()
+        except Exception as e:
+            _outbox_stats["last_error"] = f"drain: {e}"
+            sent = 0
+        if sent:
+            continue
+        _outbox_wake.clear()
+        try:
+            await asyncio.wait_for(_outbox_wake.wait(), timeout=OUTBOX_POLL_S)
+        except asyncio.TimeoutError:
+            pass
+
+def outbox_status() -> Dict[str, Any]:
+    now = time.time()
+    with _outbox_lock:
+        con = _outbox_db()
+        depth, oldest, due = con.execute(
+            "SELECT COUNT(*), MIN(created_at), SUM(next_at <= ?) FROM outbox", (now,)
+        ).fetchone()
+        dead = con.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+    return {
+        "ok": True,
+        "depth": depth,
+        "due": due or 0,
+        "lag_sec": round(now - oldest, 3) if oldest else 0.0,
+        "dead_letter": dead,
+        **_outbox_stats,
+    }
+
+def outbox_requeue_dead() -> int:
+    now = time.time()
+    with _outbox_lock:
+        con = _outbox_db()
+        rows = con.execute("SELECT created_at, payload FROM dead_letter ORDER BY id").fetchall()
+        con.executemany(
+            "INSERT INTO outbox(created_at, next_at, payload) VALUES(?,?,?)",
+            [(c, now, p) for c, p in rows],
+        )
+        con.execute("DELETE FROM dead_letter")
+        con.commit()
+    PROM_OUTBOX_DEPTH.inc(len(rows))
+    PROM_OUTBOX_DEAD.set(0)
+    if _outbox_wake is not None:
+        _outbox_wake.set()
+    return len(rows)
+
 
 # -------------------- Events / Metrics --------------------
+# events.jsonl is the active segment of a segmented log (see event_log.py): readers
+# seek from EOF, events.idx gives line offsets, sealed segments live in state/events/.
+EVENT_LOG = EventLog(
+    STATE_DIR,
+    rotate=os.getenv("EVENTS_ROTATE", "daily").strip().lower(),
+    max_bytes=int(float(os.getenv("EVENTS_SEGMENT_MAX_MB", "0")) * 1024 * 1024),
+    compress=os.getenv("EVENTS_COMPRESS", "gz").strip().lower(),
+    retention_days=int(os.getenv("EVENTS_RETENTION_DAYS", "0")),
+    retention_bytes=int(float(os.getenv("EVENTS_RETENTION_MB", "0")) * 1024 * 1024),
+)
+
+def events_index_sync() -> int:
+    return EVENT_LOG.index_sync()
+
+# journal.md gets a markdown copy of every event but is also hand-written and tracked
+# in git, so it is only rotated when JOURNAL_ROTATE_MB > 0: moved to
+# state/journal/journal-<utc>.md, then gzipped in the background.
+JOURNAL_ROTATE_BYTES = int(float(os.getenv("JOURNAL_ROTATE_MB", "0")) * 1024 * 1024)
+JOURNAL_ARCHIVE_DIR = STATE_DIR / "journal"
+
+def journal_maybe_rotate() -> None:
+    if JOURNAL_ROTATE_BYTES <= 0:
+        return
+    try:
+        if JOURNAL_PATH.stat().st_size < JOURNAL_ROTATE_BYTES:
+            return
+        JOURNAL_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        os.replace(JOURNAL_PATH, JOURNAL_ARCHIVE_DIR / f"journal-{stamp}.md")
+    except OSError as e:
+        log.warning("journal rotation failed: %s", e)
+        return
+    threading.Thread(target=journal_compress_pending, name="journal-compress", daemon=True).start()
+
+def journal_compress_pending() -> None:
+    """gzip archived journals still in plain .md (also run at startup after a crash)."""
+    for src in sorted(JOURNAL_ARCHIVE_DIR.glob("journal-*.md")):
+        dst = src.with_name(src.name + ".gz")
+        tmp = src.with_name(f".{dst.name}.tmp")
+        try:
+            with src.open("rb") as fin, gzip.open(tmp, "wb") as fout:
+                shutil.copyfileobj(fin, fout, 1 << 20)
+            os.replace(tmp, dst)
+            src.unlink()
+        except OSError as e:
+            log.warning("journal compress failed for %s: %s", src.name, e)
+
+def read_events_from(start: int, limit: int = 50) -> List[Dict[str, Any]]:
+    """Events from global line `start` (0-based) onwards."""
+    return EVENT_LOG.read_from(start, limit=limit)
+
 def read_events(limit: int = 50) -> List[Dict[str, Any]]:
     if limit <= 0:
         return []
-    if not EVENTS_JSONL.exists():
-        return []
-    out: List[Dict[str, Any]] = []
-    try:
-        lines = EVENTS_JSONL.read_text(encoding="utf-8").splitlines()
-        for ln in lines[-limit:]:
-            ln = ln.strip()
-            if not ln:
-                continue
-            try:
-                out.append(json.loads(ln))
-            except Exception:
-                continue
-        return out
-    except Exception:
-        return []
+    if EVENTS_RING.loaded and limit <= EVENTS_RING.maxlen:
+        return EVENTS_RING.tail(limit)
+    return EVENT_LOG.tail(limit)
 
 def parse_ts(evt: Dict[str, Any]) -> Optional[datetime]:
     ts = evt.get("_ts")
@@ -255,80 +763,681 @@ def parse_ts(evt: Dict[str, Any]) -> Optional[datetime]:
     except Exception:
         return None
 
-def metrics(window_min: int = 60, limit: int = 50, inactivity_sec: int = INACTIVITY_SEC_DEFAULT) -> Dict[str, Any]:
-    evs = read_events(limit=limit)
-    now = utc_now()
 
-    buy = 0
-    sell = 0
-    last_ts: Optional[datetime] = None
+EVENTS_RING_SIZE = int(os.getenv("EVENTS_RING_SIZE", "5000"))
 
-    # Events per minute (last window_min)
-    cutoff = now - timedelta(minutes=max(1, window_min))
-    per_min: Dict[str, int] = {}
+class EventRing:
+    """Bounded in-memory tail of events.jsonl.
 
-    # Last per engine
-    last_per_engine: Dict[str, Dict[str, Any]] = {}
+    Aggregates are maintained at append time so metrics() costs
+    O(engines + minute buckets) for any limit <= maxlen:
+    - running BUY/SELL totals, snapshotted on each entry (difference = count over the last N),
+    - per-minute buckets [minute, first_seq, last_seq, count] in append order,
+    - last event per engine with its sequence number.
+    """
 
-    for e in evs:
-        sig = (e.get("signal") or "").upper()
+    def __init__(self, maxlen: int):
+        self.maxlen = max(1, int(maxlen))
+        self.loaded = False
+        self._lock = threading.Lock()
+        # (seq, evt, ts, minute_key, buy_before, sell_before)
+        self._evs: deque = deque()
+        self._seq = 0
+        self._buy = 0
+        self._sell = 0
+        self._last_ts: Optional[datetime] = None
+        self._minutes: deque = deque()
+        self._engines: Dict[str, Tuple[int, Dict[str, Any], Optional[datetime]]] = {}
+
+    def load(self, evs: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for e in evs:
+                self._append(e)
+            self.loaded = True
+
+    def append(self, evt: Dict[str, Any]) -> None:
+        with self._lock:
+            self._append(evt)
+
+    def size(self) -> int:
+        return len(self._evs)
+
+    def _append(self, evt: Dict[str, Any]) -> None:
+        ts = parse_ts(evt)
+        mk = ts.strftime("%Y-%m-%dT%H:%M") if ts else None
+        seq = self._seq
+        self._seq += 1
+        self._evs.append((seq, evt, ts, mk, self._buy, self._sell))
+
+        sig = (evt.get("signal") or "").upper()
         if sig == "BUY":
-            buy += 1
+            self._buy += 1
         elif sig == "SELL":
-            sell += 1
+            self._sell += 1
+
+        if ts:
+            if self._last_ts is None or ts > self._last_ts:
+                self._last_ts = ts
+            if self._minutes and self._minutes[-1][0] == mk:
+                self._minutes[-1][2] = seq
+                self._minutes[-1][3] += 1
+            else:
+                self._minutes.append([mk, seq, seq, 1])
+
+        eng = (evt.get("engine") or "").strip()
+        if eng:
+            prev = self._engines.get(eng)
+            if prev is None or (ts and (prev[2] is None or ts >= prev[2])):
+                self._engines[eng] = (seq, evt, ts)
+
+        while len(self._evs) > self.maxlen:
+            self._evs.popleft()
+        first_seq = self._evs[0][0]
+        while self._minutes and self._minutes[0][2] < first_seq:
+            self._minutes.popleft()
+
+    def tail(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            n = min(max(0, limit), len(self._evs))
+            return [self._evs[i][1] for i in range(len(self._evs) - n, len(self._evs))]
+
+    def metrics(self, window_min: int, limit: int, inactivity_sec: int) -> Dict[str, Any]:
+        now = utc_now()
+        # whole minutes: the bucket containing the cutoff is counted entirely
+        cutoff_k = (now - timedelta(minutes=max(1, window_min))).strftime("%Y-%m-%dT%H:%M")
+        per_min: Dict[str, int] = {}
+
+        with self._lock:
+            n = min(max(0, limit), len(self._evs))
+            if n:
+                head = self._evs[len(self._evs) - n]
+                s0 = head[0]
+                buy = self._buy - head[4]
+                sell = self._sell - head[5]
+            else:
+                s0 = self._seq
+                buy = sell = 0
+
+            for mk, first, last, cnt in reversed(self._minutes):
+                if last < s0:
+                    break
+                if mk < cutoff_k:
+                    continue
+                if first < s0:
+                    # bucket straddles the limit boundary: count only its tail
+                    base = len(self._evs) - n
+                    cnt = 0
+                    for i in range(base, len(self._evs)):
+                        if self._evs[i][0] > last:
+                            break
+                        if self._evs[i][3] == mk:
+                            cnt += 1
+                per_min[mk] = per_min.get(mk, 0) + cnt
+
+            last_ts = self._last_ts if n else None
+            last_rows = sorted(
+                ((eng, e, ts) for eng, (seq, e, ts) in self._engines.items() if seq >= s0),
+                key=lambda x: x[0],
+            )
+
+        last_age_sec = int((now - last_ts).total_seconds()) if last_ts else None
+
+        engines_rows = []
+        for eng, e, ts in last_rows:
+            age = int((now - ts).total_seconds()) if ts else None
+            status = "OK" if (age is not None and age <= inactivity_sec) else "STALE"
+            engines_rows.append({
+                "engine": eng,
+                "status": status,
+                "signal": e.get("signal"),
+                "symbol": e.get("symbol"),
+                "tf": e.get("tf"),
+                "price": e.get("price"),
+                "age_sec": age,
+                "reason": e.get("reason"),
+            })
 
-        ts = parse_ts(e)
-        if ts and (last_ts is None or ts > last_ts):
-            last_ts = ts
+        return {
+            "ok": True,
+            "limit": limit,
+            "window_min": window_min,
+            "total": n,
+            "buy": buy,
+            "sell": sell,
+            "last_event_age_sec": last_age_sec,
+            "events_per_min": dict(sorted(per_min.items())),
+            "last_per_engine": engines_rows,
+        }
 
-        if ts and ts >= cutoff:
-            k = ts.strftime("%Y-%m-%dT%H:%M")
-            per_min[k] = per_min.get(k, 0) + 1
+EVENTS_RING = EventRing(EVENTS_RING_SIZE)
 
-        eng = (e.get("engine") or "").strip()
-        if eng:
-            prev = last_per_engine.get(eng)
-            if not prev:
-                last_per_engine[eng] = e
+def metrics(window_min: int = 60, limit: int = 50, inactivity_sec: int = INACTIVITY_SEC_DEFAULT) -> Dict[str, Any]:
+    if EVENTS_RING.loaded and limit <= EVENTS_RING.maxlen:
+        out = EVENTS_RING.metrics(window_min, limit, inactivity_sec)
+    else:
+        # limit beyond the ring (or ring not loaded yet): one-off ring over the file tail
+        ring = EventRing(max(1, limit))
+        ring.load(read_events(limit=limit))
+        out = ring.metrics(window_min, limit, inactivity_sec)
+    out["admission"] = ADMISSION.snapshot()
+    return out
+
+
+# -------------------- Idempotency --------------------
+# TradingView / the runner retry on timeouts. A retried alert must not be sized,
+# journaled and sent to perf twice: /tv keys each payload (client id, else a
+# canonical hash incl. bar time or the sender's ts) and answers duplicates from
+# memory. A payload with none of these is never deduplicated: two identical
+# signals would otherwise be indistinguishable from a retry.
+# Entries live in a bounded LRU with TTL, persisted to state/idempotency.jsonl
+# through the group writer so they survive restarts.
+IDEMPOTENCY_TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", "900"))
+IDEMPOTENCY_MAX = int(os.getenv("IDEMPOTENCY_MAX", "10000"))
+
+def idempotency_key(payload: Dict[str, Any], headers: Any = None) -> Optional[str]:
+    cid = (headers.get("idempotency-key") if headers is not None else None) or payload.get("idempotency_key") or payload.get("alert_id") or payload.get("id")
+    if cid:
+        return "id:" + str(cid).strip()
+    when = payload.get("bar_time") or payload.get("time") or payload.get("ts")
+    if not when:
+        return None
+    canon = [
+        (payload.get("engine") or "").strip(),
+        (payload.get("symbol") or "").strip(),
+        (payload.get("signal") or "").strip().upper(),
+        str(payload.get("tf") or "").strip(),
+        safe_float(payload.get("price")),
+        safe_float(payload.get("sl")),
+        str(when),
+    ]
+    s = json.dumps(canon, separators=(",", ":"), ensure_ascii=False)
+    return "h:" + hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+class IdempotencyCache:
+    def __init__(self, path: pathlib.Path, max_items: int, ttl_s: float):
+        self.path = path
+        self.max_items = max(1, max_items)
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lines = 0
+        # key -> future of the request currently processing it (concurrent retries wait on it)
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+
+    def size(self) -> int:
+        return len(self._items)
+
+    def load(self) -> None:
+        now = time.time()
+        items: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                for ln in f:
+                    try:
+                        d = json.loads(ln)
+                    except Exception:
+                        continue
+                    if float(d.get("exp", 0)) > now:
+                        items.pop(d["k"], None)
+                        items[d["k"]] = (float(d["exp"]), d.get("r") or {})
+        except OSError:
+            pass
+        while len(items) > self.max_items:
+            items.popitem(last=False)
+        with self._lock:
+            self._items = items
+        self._compact()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is None:
+                return None
+            if hit[0] <= time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return hit[1]
+
+    def records(self, entries: List[Tuple[str, Dict[str, Any]]]) -> List["WriteItem"]:
+        """Write items persisting these responses (to go in the same batch as the events)."""
+        exp = time.time() + self.ttl_s
+        with self._lock:
+            self._lines += len(entries)
+        return [(self.path, {"k": k, "exp": exp, "r": r}, jsonl_line) for k, r in entries]
+
+    def put(self, entries: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Store responses in memory, once their write batch is on disk."""
+        exp = time.time() + self.ttl_s
+        with self._lock:
+            for k, r in entries:
+                self._items.pop(k, None)
+                self._items[k] = (exp, r)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def maybe_compact(self) -> None:
+        # runs in the writer thread (before_write hook), so no append can interleave
+        if self._lines > 2 * self.max_items:
+            self._compact()
+
+    def _compact(self) -> None:
+        now = time.time()
+        with self._lock:
+            live = [(k, e, r) for k, (e, r) in self._items.items() if e > now]
+            self._lines = len(live)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            f.write("".join(jsonl_line({"k": k, "exp": e, "r": r}) for k, e, r in live))
+        os.replace(tmp, self.path)
+
+IDEMPOTENCY = IdempotencyCache(IDEMPOTENCY_JSONL, IDEMPOTENCY_MAX, IDEMPOTENCY_TTL_S)
+
+
+# -------------------- Writer (group commit) --------------------
+# All appends to events.jsonl / journal.md go through one background thread.
+# Pending records are rendered and written with one write() per file per batch,
+# then made durable according to EVENTS_DURABILITY:
+#   none  -> /tv does not wait for the write
+#   flush -> /tv waits until the batch is handed to the OS (previous behaviour)
+#   fsync -> /tv waits until the batch is fsync'ed
+EVENTS_DURABILITY = os.getenv("EVENTS_DURABILITY", "flush").strip().lower()
+if EVENTS_DURABILITY not in ("none", "flush", "fsync"):
+    EVENTS_DURABILITY = "flush"
+EVENTS_FLUSH_MS = float(os.getenv("EVENTS_FLUSH_MS", "5"))
+
+WriteItem = Tuple[pathlib.Path, Any, Callable[[Any], str]]
+
+class GroupWriter:
+    def __init__(
+        self,
+        interval_s: float,
+        durability: str,
+        before_write: Optional[Dict[pathlib.Path, Callable[[], Any]]] = None,
+        after_write: Optional[Dict[pathlib.Path, Callable[[], Any]]] = None,
+    ):
+        self.interval_s = max(0.0, interval_s)
+        self.durability = durability
+        self.before_write = before_write or {}
+        self.after_write = after_write or {}
+        self.stats: Dict[str, Any] = {"batches": 0, "records": 0, "last_batch": 0, "errors": 0}
+        self._q: "queue.Queue[Optional[Tuple[List[WriteItem], concurrent.futures.Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, items: List[WriteItem]) -> concurrent.futures.Future:
+        """Queue (path, record, render) items; the future resolves once they are written."""
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        self._ensure_started()
+        self._q.put((items, fut))
+        return fut
+
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="group-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._q.put(None)
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            first = self._q.get()
+            if first is None:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.interval_s
+            while True:
+                try:
+                    timeout = deadline - time.monotonic()
+                    nxt = self._q.get(timeout=timeout) if timeout > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: List[Tuple[List[WriteItem], concurrent.futures.Future]]) -> None:
+        chunks: Dict[pathlib.Path, List[str]] = {}
+        err: Optional[BaseException] = None
+        try:
+            for items, _ in batch:
+                for path, rec, render in items:
+                    chunks.setdefault(path, []).append(render(rec))
+            for path, parts in chunks.items():
+                hook = self.before_write.get(path)
+                if hook:
+                    hook()
+                with path.open("a", encoding="utf-8") as f:
+                    f.write("".join(parts))
+                    if self.durability == "fsync":
+                        f.flush()
+                        os.fsync(f.fileno())
+                hook = self.after_write.get(path)
+                if hook:
+                    hook()
+        except BaseException as e:
+            err = e
+            self.stats["errors"] += 1
+
+        n = sum(len(items) for items, _ in batch)
+        self.stats["batches"] += 1
+        self.stats["records"] += n
+        self.stats["last_batch"] = n
+        for _, fut in batch:
+            if err is None:
+                fut.set_result(n)
             else:
-                pts = parse_ts(prev)
-                if ts and pts and ts > pts:
-                    last_per_engine[eng] = e
-                elif ts and not pts:
-                    last_per_engine[eng] = e
-
-    last_age_sec = None
-    if last_ts:
-        last_age_sec = int((now - last_ts).total_seconds())
-
-    # Build engine status list
-    engines_rows = []
-    for eng, e in sorted(last_per_engine.items(), key=lambda x: x[0]):
-        ts = parse_ts(e)
-        age = int((now - ts).total_seconds()) if ts else None
-        status = "OK" if (age is not None and age <= inactivity_sec) else "STALE"
-        engines_rows.append({
-            "engine": eng,
-            "status": status,
-            "signal": e.get("signal"),
-            "symbol": e.get("symbol"),
-            "tf": e.get("tf"),
-            "price": e.get("price"),
-            "age_sec": age,
-            "reason": e.get("reason"),
-        })
+                fut.set_exception(err)
+
+EVENT_WRITER = GroupWriter(
+    EVENTS_FLUSH_MS / 1000.0,
+    EVENTS_DURABILITY,
+    before_write={
+        EVENTS_JSONL: EVENT_LOG.maybe_rotate,
+        JOURNAL_PATH: journal_maybe_rotate,
+        IDEMPOTENCY_JSONL: IDEMPOTENCY.maybe_compact,
+    },
+    after_write={EVENTS_JSONL: events_index_sync},
+)
+
+async def write_events(evts: List[Dict[str, Any]], extra: Optional[List[WriteItem]] = None) -> None:
+    """Append evts to events.jsonl + journal.md (+ extra items, same batch);
+    waits according to EVENTS_DURABILITY."""
+    items: List[WriteItem] = [(EVENTS_JSONL, e, jsonl_line) for e in evts]
+    items += [(JOURNAL_PATH, e, journal_entry_text) for e in evts]
+    items += extra or []
+    fut = EVENT_WRITER.submit(items)
+    if EVENT_WRITER.durability != "none":
+        await asyncio.wrap_future(fut)
+
+
+# -------------------- Timings --------------------
+# Per-stage latency of the /tv hot path (parse, key, lock, risk, perf, write,
+# telegram, total), per engine and overall ("*"). Each (stage, engine) has a
+# fixed-size rolling histogram: TIMING_SLOTS slots of TIMING_SLOT_S seconds,
+# log-spaced buckets from 0.05 ms to ~30 s. Memory does not grow with traffic:
+# engines outside ALL_ENGINES / risk_config accounts are recorded as "other",
+# and at most TIMING_MAX_ENGINES engine labels are kept.
+TIMING_MAX_ENGINES = int(os.getenv("TIMING_MAX_ENGINES", "32"))
+TIMING_SLOT_S = int(os.getenv("TIMING_SLOT_S", "10"))
+TIMING_SLOTS = int(os.getenv("TIMING_SLOTS", "90"))  # 15 min with 10 s slots
+TIMING_SLOW_MS = float(os.getenv("TIMING_SLOW_MS", "0"))  # >0: log requests slower than this
+_TIMING_BOUNDS = [0.05 * 1.25 ** i for i in range(60)]  # ms, bucket upper bounds
+
+log = logging.getLogger("tv_webhook")
+
+class RollingHist:
+    def __init__(self, slots: int, slot_s: int):
+        self.slot_s = max(1, slot_s)
+        self.slot_ids = [-1] * slots
+        self.counts = [[0] * (len(_TIMING_BOUNDS) + 1) for _ in range(slots)]
+        self.maxes = [0.0] * slots
+
+    def observe(self, ms: float, now: float) -> None:
+        sid = int(now) // self.slot_s
+        i = sid % len(self.slot_ids)
+        if self.slot_ids[i] != sid:
+            self.slot_ids[i] = sid
+            self.counts[i] = [0] * (len(_TIMING_BOUNDS) + 1)
+            self.maxes[i] = 0.0
+        lo, hi = 0, len(_TIMING_BOUNDS)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _TIMING_BOUNDS[mid] < ms:
+                lo = mid + 1
+            else:
+                hi = mid
+        self.counts[i][lo] += 1
+        if ms > self.maxes[i]:
+            self.maxes[i] = ms
+
+    def summary(self, window_s: int, now: float) -> Dict[str, Any]:
+        sid_now = int(now) // self.slot_s
+        min_sid = sid_now - max(1, window_s // self.slot_s) + 1
+        merged = [0] * (len(_TIMING_BOUNDS) + 1)
+        mx = 0.0
+        for i, sid in enumerate(self.slot_ids):
+            if min_sid <= sid <= sid_now:
+                for b, c in enumerate(self.counts[i]):
+                    merged[b] += c
+                mx = max(mx, self.maxes[i])
+        n = sum(merged)
+
+        def pct(p: float) -> Optional[float]:
+            if n == 0:
+                return None
+            rank = p * n
+            acc = 0
+            for b, c in enumerate(merged):
+                acc += c
+                if acc >= rank and c:
+                    # bucket upper bound, capped by the observed max
+                    return round(min(_TIMING_BOUNDS[b] if b < len(_TIMING_BOUNDS) else mx, mx), 3)
+            return round(mx, 3)
+
+        return {"n": n, "p50": pct(0.5), "p90": pct(0.9), "p99": pct(0.99), "max": round(mx, 3) if n else None}
+
+class Timings:
+    def __init__(self, slots: int, slot_s: int):
+        self.slots = slots
+        self.slot_s = slot_s
+        self._lock = threading.Lock()
+        self._h: Dict[Tuple[str, str], RollingHist] = {}
+        self._engines: set = set()
+
+    def engine_label(self, engine: Optional[str]) -> Optional[str]:
+        """Bounded label for a payload engine ("other" if unknown or over the cap)."""
+        if not engine:
+            return None
+        if engine not in ALL_ENGINES and engine not in (load_risk_config().get("accounts") or {}):
+            return "other"
+        with self._lock:
+            if engine not in self._engines:
+                if len(self._engines) >= TIMING_MAX_ENGINES:
+                    return "other"
+                self._engines.add(engine)
+        return engine
+
+    def observe(self, stage: str, ms: float, engine: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            for key in ((stage, "*"), (stage, engine)) if engine else ((stage, "*"),):
+                h = self._h.get(key)
+                if h is None:
+                    h = self._h[key] = RollingHist(self.slots, self.slot_s)
+                h.observe(ms, now)
+
+    def snapshot(self, window_s: int) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        out: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for (stage, eng), h in sorted(self._h.items()):
+                out.setdefault(stage, {})[eng] = h.summary(window_s, now)
+        return out
 
-    return {
-        "ok": True,
-        "limit": limit,
-        "window_min": window_min,
-        "total": len(evs),
-        "buy": buy,
-        "sell": sell,
-        "last_event_age_sec": last_age_sec,
-        "events_per_min": per_min,
-        "last_per_engine": engines_rows,
-    }
+TIMINGS = Timings(TIMING_SLOTS, TIMING_SLOT_S)
+
+class ReqTimer:
+    """Collects stage durations for one request, then feeds TIMINGS."""
+
+    def __init__(self, route: str, prefix: str = ""):
+        self.route = route
+        self.prefix = prefix
+        self.engine: Optional[str] = None
+        self.t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - t) * 1000.0
+
+    def finish(self, status: int = 200) -> None:
+        total = (time.perf_counter() - self.t0) * 1000.0
+        label = TIMINGS.engine_label(self.engine)
+        for name, ms in self.stages.items():
+            TIMINGS.observe(self.prefix + name, ms, label)
+        TIMINGS.observe(self.prefix + "total", total, label)
+        if TIMING_SLOW_MS > 0 and total >= TIMING_SLOW_MS:
+            log.warning(json.dumps({
+                "slow_request": self.route,
+                "engine": self.engine,
+                "status": status,
+                "total_ms": round(total, 3),
+                "stages_ms": {k: round(v, 3) for k, v in self.stages.items()},
+            }))
+
+_NULL_TIMER_STAGE = contextlib.nullcontext()
+
+def _stage(timer: Optional[ReqTimer], name: str):
+    return timer.stage(name) if timer is not None else _NULL_TIMER_STAGE
+
+
+# -------------------- Admission control --------------------
+# Token buckets per engine / symbol / source IP ("rate:burst", rate in tokens/s,
+# empty or 0 = off), checked once the key is valid, plus a cap on /tv + /tv/batch
+# requests in flight. Excess load gets 429 + Retry-After instead of queueing.
+# Bursts sized for a bar close over a few hundred symbols from one sender.
+# /tv/batch has its own buckets (TV_BATCH_RATE_*, sized for backfills): the
+# request takes len(items) tokens from the IP bucket, then each item one token
+# from its engine and engine:symbol buckets (per-item 429 in results).
+TV_RATE_ENGINE = os.getenv("TV_RATE_ENGINE", "10:200")
+TV_RATE_SYMBOL = os.getenv("TV_RATE_SYMBOL", "2:10")
+TV_RATE_IP = os.getenv("TV_RATE_IP", "50:500")
+TV_BATCH_RATE_ENGINE = os.getenv("TV_BATCH_RATE_ENGINE", "20:1000")
+TV_BATCH_RATE_SYMBOL = os.getenv("TV_BATCH_RATE_SYMBOL", "5:500")
+TV_BATCH_RATE_IP = os.getenv("TV_BATCH_RATE_IP", "50:1000")
+TV_MAX_INFLIGHT = int(os.getenv("TV_MAX_INFLIGHT", "64"))
+TV_RATE_MAX_KEYS = int(os.getenv("TV_RATE_MAX_KEYS", "10000"))
+
+def _parse_rate(spec: str) -> Tuple[float, float]:
+    try:
+        rate, _, burst = (spec or "").partition(":")
+        r = float(rate or 0)
+        return r, float(burst) if burst else max(1.0, r)
+    except ValueError:
+        return 0.0, 0.0
+
+class TokenBuckets:
+    def __init__(self, spec: str, max_keys: int):
+        self.rate, self.burst = _parse_rate(spec)
+        self.max_keys = max(1, max_keys)
+        self._b: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, at)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def wait_s(self, key: str, n: float, now: float) -> float:
+        """Seconds until n tokens are available for key (0 = now)."""
+        tokens, at = self._b.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - at) * self.rate)
+        if tokens >= n:
+            return 0.0
+        if n > self.burst:
+            return math.inf
+        return (n - tokens) / self.rate
+
+    def take(self, key: str, n: float, now: float) -> None:
+        tokens, at = self._b.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - at) * self.rate)
+        self._b[key] = (tokens - n, now)
+        while len(self._b) > self.max_keys:
+            self._b.popitem(last=False)
+
+class Admission:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = {
+            "engine": TokenBuckets(TV_RATE_ENGINE, TV_RATE_MAX_KEYS),
+            "symbol": TokenBuckets(TV_RATE_SYMBOL, TV_RATE_MAX_KEYS),
+            "ip": TokenBuckets(TV_RATE_IP, TV_RATE_MAX_KEYS),
+        }
+        self.batch_buckets = {
+            "engine": TokenBuckets(TV_BATCH_RATE_ENGINE, TV_RATE_MAX_KEYS),
+            "symbol": TokenBuckets(TV_BATCH_RATE_SYMBOL, TV_RATE_MAX_KEYS),
+            "ip": TokenBuckets(TV_BATCH_RATE_IP, TV_RATE_MAX_KEYS),
+        }
+        self.inflight = 0
+        self.rejected: Dict[str, int] = {"engine": 0, "symbol": 0, "ip": 0, "inflight": 0}
+        self.last_rejected_at: Optional[str] = None
+
+    def _reject(self, reason: str, retry_after: float) -> HTTPException:
+        self.rejected[reason] += 1
+        PROM_ADMISSION.inc(limiter=reason)
+        self.last_rejected_at = iso_utc(utc_now())
+        bump_version()  # dashboard shows the counters
+        ra = 60 if math.isinf(retry_after) else max(1, math.ceil(retry_after))
+        return HTTPException(status_code=429, detail=f"Rate limited ({reason})", headers={"Retry-After": str(ra)})
+
+    def check(self, engine: str, symbol: str, client_ip: Optional[str]) -> None:
+        """Take one token from each enabled bucket, or raise 429 without taking any."""
+        self._take(self.buckets, {"engine": engine, "symbol": f"{engine}:{symbol}", "ip": client_ip or "-"})
+
+    def check_batch(self, client_ip: Optional[str], n: int) -> None:
+        """/tv/batch request: n tokens (one per item) from the batch IP bucket."""
+        self._take(self.batch_buckets, {"ip": client_ip or "-"}, float(max(1, n)))
+
+    def check_batch_item(self, engine: str, symbol: str) -> None:
+        """/tv/batch item: one token from the batch engine and engine:symbol buckets."""
+        self._take(self.batch_buckets, {"engine": engine, "symbol": f"{engine}:{symbol}"})
+
+    def _take(self, buckets: Dict[str, TokenBuckets], keys: Dict[str, str], n: float = 1.0) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for name, key in keys.items():
+                b = buckets[name]
+                if b.enabled:
+                    w = b.wait_s(key, n, now)
+                    if w > 0:
+                        raise self._reject(name, w)
+            for name, key in keys.items():
+                b = buckets[name]
+                if b.enabled:
+                    b.take(key, n, now)
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Global in-flight cap for /tv and /tv/batch."""
+        with self._lock:
+            if TV_MAX_INFLIGHT > 0 and self.inflight >= TV_MAX_INFLIGHT:
+                raise self._reject("inflight", 1.0)
+            self.inflight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "rejected": dict(self.rejected),
+            "rejected_total": sum(self.rejected.values()),
+            "last_rejected_at": self.last_rejected_at,
+            "inflight": self.inflight,
+            "max_inflight": TV_MAX_INFLIGHT,
+        }
+
+ADMISSION = Admission()
 
 
 # -------------------- Webhook --------------------
@@ -357,7 +1466,7 @@ def enforce_lock(engine: str) -> None:
     if engine in AGGRESSIVE_ENGINES and active in AGGRESSIVE_ENGINES:
         raise HTTPException(status_code=409, detail=f"Engine locked: active_engine={active}")
 
-def write_journal_entry(evt: Dict[str, Any]) -> None:
+def journal_entry_text(evt: Dict[str, Any]) -> str:
     ts_local = datetime.now().strftime("%Y-%m-%d %H:%M")
     engine = evt.get("engine", "")
     signal = evt.get("signal", "")
@@ -385,20 +1494,15 @@ def write_journal_entry(evt: Dict[str, Any]) -> None:
     entry.append("```json\n")
     entry.append(json.dumps(evt, ensure_ascii=False, indent=2))
     entry.append("\n```\n")
+    return "".join(entry)
 
-    with JOURNAL_PATH.open("a", encoding="utf-8") as f:
-        f.write("".join(entry))
+def jsonl_line(evt: Dict[str, Any]) -> str:
+    return json.dumps(evt, ensure_ascii=False) + "\n"
 
 
-@app.post("/tv")
-async def tv_webhook(req: Request):
-    payload = await req.json()
-
-    if not isinstance(payload, dict):
-        raise HTTPException(status_code=400, detail="JSON must be object")
-
-    require_key(payload, req.client.host if req.client else None)
-
+def accept_signal(payload: Dict[str, Any], client_ip: Optional[str], timer: Optional[ReqTimer] = None) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], str]:
+    """Validate one /tv payload (key already checked), apply the engine lock and size it.
+    Returns (event, perf OPEN payload or None, telegram text); raises HTTPException on reject."""
     engine = (payload.get("engine") or "").strip()
     signal = (payload.get("signal") or "").strip().upper()
     symbol = (payload.get("symbol") or "").strip()
@@ -415,16 +1519,21 @@ async def tv_webhook(req: Request):
         pass
     if signal not in ("BUY", "SELL"):
         raise HTTPException(status_code=400, detail="signal must be BUY or SELL")
-
-    enforce_lock(engine)
-
-    # If engine is aggressive, set lock to it when first used
-    if engine in AGGRESSIVE_ENGINES:
-        st = ensure_router_state()
-        if not st.get("active_engine"):
-            set_router_state(engine)
+    if timer is not None and timer.engine is None:
+        timer.engine = engine
+
+    with _stage(timer, "lock"):
+        enforce_lock(engine)
+
+        # If engine is aggressive, set lock to it when first used
+        if engine in AGGRESSIVE_ENGINES:
+            swapped, _ = cas_router_state(None, engine)
+            if not swapped:
+                # another request took the lock since enforce_lock(): re-check against it
+                enforce_lock(engine)
     # --- RISK SIZING (quote) ---
-    q = risk_quote(engine, price=price, sl=sl, tp=tp) if (price and sl) else None
+    with _stage(timer, "risk"):
+        q = risk_quote(engine, price=price, sl=sl, tp=tp) if (price and sl) else None
     if not q:
         raise HTTPException(status_code=400, detail="Missing/invalid price or sl for risk sizing")
 
@@ -437,18 +1546,17 @@ async def tv_webhook(req: Request):
 
     # --- PERF: OPEN trade ledger (non-bloquant) ---
     # --- ignore TEST engines for perf ledger ---
-    if engine == "TV_TEST" or engine.startswith("TEST_") or engine.startswith("_TEST_"):
-        pass
-    else:
-        perf_open(
-                engine=engine,
-        symbol=symbol,
-        side=side,
-        entry=price,
-        stop=sl,
-        qty=q["qty"],
-        risk_usd=risk_for_perf,
-        meta={"tf": tf, "tp": tp, "reason": reason, "src": "/tv"}
+    perf = None
+    if not (engine == "TV_TEST" or engine.startswith("TEST_") or engine.startswith("_TEST_")):
+        perf = perf_open_payload(
+            engine=engine,
+            symbol=symbol,
+            side=side,
+            entry=price,
+            stop=sl,
+            qty=q["qty"],
+            risk_usd=risk_for_perf,
+            meta={"tf": tf, "tp": tp, "reason": reason, "src": "/tv"},
         )
 
     evt = {
@@ -462,32 +1570,341 @@ async def tv_webhook(req: Request):
         "sl": sl,
         "reason": reason,
         "_ts": iso_utc(utc_now()),
-        "_ip": req.client.host if req.client else None,
+        "_ip": client_ip,
         "qty": q["qty"],
         "risk_usd": q.get("risk_usd", None),
         "risk_real_usd": q.get("risk_real_usd", None),
-}
+    }
 
-    append_jsonl(EVENTS_JSONL, evt)
-    write_journal_entry(evt)
+    # Telegram text (simple, readable), with the same quote as the one used for perf
+    qty_txt = f"\nqty: {q['qty']} | risk_usd: {q.get('risk_usd')}"
+    msg = f"{signal} {symbol} {tf}\nengine: {engine}\nprice: {price} | tp: {tp} | sl: {sl}\nreason: {reason}{qty_txt}"
+    return evt, perf, msg
+
+async def commit_accepted(
+    accepted: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]], str]],
+    idem: Optional[List[Tuple[str, Dict[str, Any]]]] = None,
+    timer: Optional[ReqTimer] = None,
+) -> None:
+    """Persist accepted signals: one events/journal batch, one outbox insert, one notification.
+    idem: (idempotency key, response) pairs recorded in the same write batch.
+    Nothing is queued for perf or shown before that batch is on disk: if it fails the
+    client gets a 500 and its retry is processed from scratch, not as a second OPEN."""
+    if not accepted:
+        return
+    evts = [e for e, _, _ in accepted]
+    with _stage(timer, "write"):
+        await write_events(evts, extra=IDEMPOTENCY.records(idem) if idem else None)
+    if idem:
+        IDEMPOTENCY.put(idem)
+
+    perf = [p for _, p, _ in accepted if p]
+    if perf:
+        # perf est optionnel: ne jamais casser le webhook
+        with _stage(timer, "perf"):
+            try:
+                outbox_enqueue(perf)
+            except Exception as e:
+                _outbox_stats["last_error"] = f"enqueue: {e}"
+
+    for e in evts:
+        EVENTS_RING.append(e)
+    bump_version()
+    for e in evts:
+        STREAM.publish("evt", e)
 
-    # Telegram notify (simple, readable)
     if TELEGRAM_ENABLED:
-        # include sizing quote if possible
-        q = risk_quote(engine, price=price, sl=sl, tp=tp) if (price and sl) else None
-        qty_txt = ""
-        if q and q.get("qty"):
-            qty_txt = f"\nqty: {q['qty']} | risk_usd: {q.get('risk_usd')}"
-        msg = f"{signal} {symbol} {tf}\nengine: {engine}\nprice: {price} | tp: {tp} | sl: {sl}\nreason: {reason}{qty_txt}"
-        telegram_send(msg)
+        # queued only; the notifier turns bursts into digests
+        with _stage(timer, "telegram"):
+            for _, _, m in accepted:
+                telegram_send(m)
+
+@app.post("/tv")
+async def tv_webhook(req: Request):
+    timer = ReqTimer("/tv")
+    status = 200
+    try:
+        with ADMISSION.slot():
+            return await _tv_webhook(req, timer)
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    except Exception:
+        status = 500
+        raise
+    finally:
+        if status != 200:
+            PROM_SIGNALS.inc(route="/tv", result="rejected", reason=str(status))
+        timer.finish(status)
+
+async def _tv_webhook(req: Request, timer: ReqTimer):
+    with timer.stage("parse"):
+        payload = await req.json()
+
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="JSON must be object")
+
+    client_ip = req.client.host if req.client else None
+    with timer.stage("key"):
+        require_key(payload, client_ip)
+
+        ikey = idempotency_key(payload, req.headers)
+        hit = IDEMPOTENCY.get(ikey) if ikey else None
+    if hit is not None:
+        PROM_SIGNALS.inc(route="/tv", result="duplicate", reason="200")
+        return hit
+    inflight = IDEMPOTENCY.pending.get(ikey) if ikey else None
+    if inflight is not None:
+        # same alert already being processed by a concurrent retry: answer like it
+        PROM_SIGNALS.inc(route="/tv", result="duplicate", reason="200")
+        return await asyncio.shield(inflight)
+
+    # retries of an alert already seen are answered above without using tokens
+    with timer.stage("admit"):
+        ADMISSION.check(str(payload.get("engine") or "").strip(), str(payload.get("symbol") or "").strip(), client_ip)
+
+    fut = asyncio.get_running_loop().create_future()
+    if ikey:
+        IDEMPOTENCY.pending[ikey] = fut
+    try:
+        resp = {"ok": True}
+        accepted = accept_signal(payload, client_ip, timer)
+        await commit_accepted([accepted], idem=[(ikey, resp)] if ikey else None, timer=timer)
+        PROM_SIGNALS.inc(route="/tv", result="accepted", reason="200")
+        fut.set_result(resp)
+        return resp
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()  # retrieved: no "never retrieved" warning without waiters
+        raise
+    finally:
+        IDEMPOTENCY.pending.pop(ikey, None)
+
+TV_BATCH_MAX = int(os.getenv("TV_BATCH_MAX", "500"))
+
+@app.post("/tv/batch")
+async def tv_batch(req: Request):
+    """Body: {"key": ..., "items": [payload, ...]} or [payload, ...] (all with the same key).
+    Same validation as /tv per item; the key is checked once and everything accepted is
+    written in one batch. Returns one result per item, in order."""
+    timer = ReqTimer("/tv/batch", prefix="batch_")
+    status = 200
+    try:
+        with ADMISSION.slot():
+            return await _tv_batch(req, timer)
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    except Exception:
+        status = 500
+        raise
+    finally:
+        if status != 200:
+            PROM_SIGNALS.inc(route="/tv/batch", result="rejected", reason=str(status))
+        timer.finish(status)
+
+async def _tv_batch(req: Request, timer: ReqTimer):
+    # stages are recorded as "batch_*", overall only (items mix engines)
+    with timer.stage("parse"):
+        body = await req.json()
+    client_ip = req.client.host if req.client else None
+
+    if isinstance(body, dict):
+        items = body.get("items")
+        key_payload = body
+    elif isinstance(body, list):
+        items = body
+        keys = {str(it.get("key") or "").strip() for it in items if isinstance(it, dict)}
+        if len(keys) > 1:
+            raise HTTPException(status_code=403, detail="Mixed keys in batch")
+        key_payload = {"key": keys.pop() if keys else ""}
+    else:
+        raise HTTPException(status_code=400, detail="JSON must be object or array")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="items must be an array")
+    if len(items) > TV_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {TV_BATCH_MAX})")
+
+    require_key(key_payload, client_ip)
+    ADMISSION.check_batch(client_ip, len(items))
+
+    results: List[Dict[str, Any]] = []
+    accepted = []
+    idem: List[Tuple[str, Dict[str, Any]]] = []
+    seen: Dict[str, Dict[str, Any]] = {}
+    with timer.stage("accept"):
+        for i, it in enumerate(items):
+            if not isinstance(it, dict):
+                results.append({"i": i, "ok": False, "status": 400, "detail": "JSON must be object"})
+                continue
+            ikey = idempotency_key(it)
+            prev = (seen.get(ikey) or IDEMPOTENCY.get(ikey)) if ikey else None
+            if prev is not None:
+                results.append({**prev, "i": i, "duplicate": True})
+                continue
+            try:
+                ADMISSION.check_batch_item(str(it.get("engine") or "").strip(), str(it.get("symbol") or "").strip())
+                a = accept_signal(it, client_ip)
+            except HTTPException as e:
+                results.append({"i": i, "ok": False, "status": e.status_code, "detail": e.detail})
+                continue
+            accepted.append(a)
+            res = {"ok": True, "qty": a[0]["qty"]}
+            if ikey:
+                seen[ikey] = res
+                idem.append((ikey, res))
+            results.append({"i": i, **res})
+
+    await commit_accepted(accepted, idem=idem, timer=timer)
+    for r in results:
+        if r.get("duplicate"):
+            PROM_SIGNALS.inc(route="/tv/batch", result="duplicate", reason="200")
+        elif r["ok"]:
+            PROM_SIGNALS.inc(route="/tv/batch", result="accepted", reason="200")
+        else:
+            PROM_SIGNALS.inc(route="/tv/batch", result="rejected", reason=str(r["status"]))
+    return {"ok": True, "accepted": len(accepted), "rejected": len(items) - len(accepted), "results": results}
+
+
+# -------------------- Stream (SSE) --------------------
+# /api/stream pushes lock changes, new events and refreshed metrics to /dash.
+# Producers (/tv, lock changes) call STREAM.publish() from any thread; each
+# subscriber has a bounded queue, a client that falls behind gets a fresh snapshot.
+SSE_HEARTBEAT_S = float(os.getenv("SSE_HEARTBEAT_S", "10"))
+SSE_QUEUE_MAX = int(os.getenv("SSE_QUEUE_MAX", "256"))
+
+class StreamHub:
+    def __init__(self):
+        self._subs: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def subscribe(self) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(SSE_QUEUE_MAX)
+        self._subs.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        self._subs.discard(q)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def publish(self, kind: str, data: Any) -> None:
+        loop = self._loop
+        if loop is None or not self._subs or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fanout(kind, data)
+        else:
+            loop.call_soon_threadsafe(self._fanout, kind, data)
+
+    def _fanout(self, kind: str, data: Any) -> None:
+        for q in list(self._subs):
+            try:
+                q.put_nowait((kind, data))
+            except asyncio.QueueFull:
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(("resync", None))
+
+STREAM = StreamHub()
+
+_metrics_memo: Dict[Tuple[int, int, int, int, int], Dict[str, Any]] = {}
+
+def metrics_shared(window_min: int, limit: int, inactivity_sec: int) -> Dict[str, Any]:
+    # same params + same ring position + same second -> computed once for all subscribers
+    key = (EVENTS_RING._seq, int(time.time()), limit, window_min, inactivity_sec)
+    m = _metrics_memo.get(key)
+    if m is None:
+        if len(_metrics_memo) > 64:
+            _metrics_memo.clear()
+        m = _metrics_memo[key] = metrics(window_min=window_min, limit=limit, inactivity_sec=inactivity_sec)
+    return m
+
+def _sse_frame(kind: str, obj: Any) -> str:
+    return f"event: {kind}\ndata: {json.dumps(obj, ensure_ascii=False)}\n\n"
+
+async def _sse_stream(req: Request, q: asyncio.Queue, limit: int, window_min: int, inactivity_sec: int):
+    def snapshot() -> Dict[str, Any]:
+        return {
+            "state": state_payload(ensure_router_state()),
+            "events": read_events(limit=limit),
+            "metrics": metrics_shared(window_min, limit, inactivity_sec),
+        }
 
-    return {"ok": True}
+    try:
+        yield "retry: 3000\n\n" + _sse_frame("snapshot", snapshot())
+        while True:
+            try:
+                item = await asyncio.wait_for(q.get(), timeout=SSE_HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                if await req.is_disconnected():
+                    break
+                # keeps ages/staleness current while nothing happens
+                ensure_router_state()
+                yield _sse_frame("metrics", metrics_shared(window_min, limit, inactivity_sec))
+                continue
+
+            # coalesce a burst into one write + one metrics frame
+            items = [item]
+            while not q.empty():
+                items.append(q.get_nowait())
+            out: List[str] = []
+            new_events = False
+            for kind, data in items:
+                if kind == "resync":
+                    out = [_sse_frame("snapshot", snapshot())]
+                    new_events = False
+                elif kind == "evt":
+                    out.append(_sse_frame("evt", data))
+                    new_events = True
+                elif kind == "state":
+                    out.append(_sse_frame("state", data))
+            if new_events:
+                out.append(_sse_frame("metrics", metrics_shared(window_min, limit, inactivity_sec)))
+            yield "".join(out)
+    finally:
+        STREAM.unsubscribe(q)
+
+
+_bg_tasks: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def startup():
+    STREAM.bind(asyncio.get_running_loop())
+    # refill the in-memory ring from the tail of events.jsonl
+    EVENTS_RING.load(EVENT_LOG.tail(EVENTS_RING.maxlen))
+    IDEMPOTENCY.load()
+    ob = outbox_status()
+    PROM_OUTBOX_DEPTH.set(ob["depth"])
+    PROM_OUTBOX_DEAD.set(ob["dead_letter"])
+    # segments sealed but not yet compressed when the previous process stopped
+    EVENT_LOG.compress_async()
+    if JOURNAL_ARCHIVE_DIR.exists():
+        threading.Thread(target=journal_compress_pending, name="journal-compress", daemon=True).start()
+    _bg_tasks.append(asyncio.create_task(outbox_worker()))
+
+@app.on_event("shutdown")
+async def shutdown():
+    for t in _bg_tasks:
+        t.cancel()
+    await asyncio.gather(*_bg_tasks, return_exceptions=True)
+    _bg_tasks.clear()
+    await asyncio.to_thread(EVENT_WRITER.stop)
+    await asyncio.to_thread(TELEGRAM.stop)
+    await http_client.aclose()
 
 
 # -------------------- API --------------------
-@app.get("/api/state")
-def api_state():
-    st = ensure_router_state()
+def state_payload(st: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "ok": True,
         "active_engine": st.get("active_engine"),
@@ -495,11 +1912,77 @@ def api_state():
         "ts": iso_utc(utc_now()),
     }
 
+@app.get("/api/state")
+def api_state():
+    return state_payload(ensure_router_state())
+
+# The snapshot carries ages (age_sec, last_age_sec, OK/STALE, the minute window)
+# that move with the clock, not with the version. Rather than bumping the version
+# every second, the ETag includes a DASHBOARD_ETAG_TTL_S time bucket and is weak:
+# within one bucket the body is served from cache, ages up to TTL seconds old.
+DASHBOARD_ETAG_TTL_S = int(os.getenv("DASHBOARD_ETAG_TTL_S", "30"))
+_dash_cache: Dict[str, bytes] = {}
+
+def _dash_etag(v: int, limit: int, window_min: int, inactivity_sec: int) -> str:
+    return f'W/"v{v}-{limit}-{window_min}-{inactivity_sec}-{int(time.time()) // max(1, DASHBOARD_ETAG_TTL_S)}"'
+
+def dashboard_snapshot(limit: int, window_min: int, inactivity_sec: int) -> Tuple[str, bytes]:
+    """(etag, json body) of state + events + metrics taken at one version
+    (and one DASHBOARD_ETAG_TTL_S time bucket, see above)."""
+    ensure_router_state()  # bumps the version if another worker moved the lock
+    for _ in range(3):
+        v = current_version()
+        etag = _dash_etag(v, limit, window_min, inactivity_sec)
+        body = _dash_cache.get(etag)
+        if body is not None:
+            return etag, body
+        snap = {
+            "ok": True,
+            "version": v,
+            "state": state_payload(ensure_router_state()),
+            "events": read_events(limit=limit),
+            "metrics": metrics(window_min=window_min, limit=limit, inactivity_sec=inactivity_sec),
+        }
+        if current_version() == v:
+            break
+        # an event/lock change landed mid-read: take the snapshot again
+    body = json.dumps(snap, ensure_ascii=False).encode("utf-8")
+    if len(_dash_cache) > 32:
+        _dash_cache.clear()
+    _dash_cache[etag] = body
+    return etag, body
+
+@app.get("/api/dashboard")
+def api_dashboard(req: Request, limit: int = 50, window_min: int = 60, inactivity_sec: int = INACTIVITY_SEC_DEFAULT):
+    headers = {"Cache-Control": "no-cache"}
+    inm = req.headers.get("if-none-match")
+    if inm:
+        etag = _dash_etag(current_version(), limit, window_min, inactivity_sec)
+        # weak comparison (RFC 9110): W/ prefixes are ignored on both sides
+        if etag[2:] in [t.strip().removeprefix("W/") for t in inm.split(",")]:
+            return Response(status_code=304, headers={**headers, "ETag": etag})
+    etag, body = dashboard_snapshot(limit, window_min, inactivity_sec)
+    return Response(content=body, media_type="application/json", headers={**headers, "ETag": etag})
+
+@app.get("/api/stream")
+async def api_stream(req: Request, limit: int = 50, window_min: int = 60, inactivity_sec: int = INACTIVITY_SEC_DEFAULT):
+    q = STREAM.subscribe()
+    return StreamingResponse(
+        _sse_stream(req, q, limit, window_min, inactivity_sec),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/api/events")
-def api_events(limit: int = 50):
-    evs = read_events(limit=limit)
+def api_events(limit: int = 50, start: Optional[int] = None):
+    # start: 0-based global line number of the event log (forward paging)
+    evs = read_events(limit=limit) if start is None else read_events_from(start, limit=limit)
     return {"ok": True, "count": len(evs), "events": evs}
 
+@app.get("/api/events/segments")
+def api_event_segments():
+    return {"ok": True, **EVENT_LOG.status()}
+
 @app.get("/api/metrics")
 def api_metrics(limit: int = 50, window_min: int = 60, inactivity_sec: int = INACTIVITY_SEC_DEFAULT):
     return metrics(window_min=window_min, limit=limit, inactivity_sec=inactivity_sec)
@@ -509,8 +1992,29 @@ def api_risk_quote(engine: str, price: float, sl: float, tp: float):
     q = risk_quote(engine=engine, price=price, sl=sl, tp=tp)
     return {"ok": True, "quote": q}
 
-@app.post("/api/reset_lock")
-async def api_reset_lock(req: Request):
+@app.post("/api/risk/quote_batch")
+async def api_risk_quote_batch(req: Request):
+    """Body (columnar): {"engine": "E" | [...], "price": [...], "sl": [...]}
+    -> {"quote": {"type": [...], "risk_usd": [...], "risk_real_usd": [...], "distance": [...], "qty": [...]}}"""
+    body = await req.json()
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="JSON must be object")
+    prices, sls = body.get("price"), body.get("sl")
+    if not isinstance(prices, list) or not isinstance(sls, list):
+        raise HTTPException(status_code=400, detail="price and sl must be arrays")
+    if len(prices) > RISK_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {RISK_BATCH_MAX})")
+    engine = body.get("engine")
+    engines = [str(engine or "").strip()] * len(prices) if not isinstance(engine, list) else [str(e or "").strip() for e in engine]
+    try:
+        q = await asyncio.to_thread(
+            risk_quote_batch, engines, [float(x) for x in prices], [float(x) for x in sls],
+        )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, "n": len(prices), "vectorized": np is not None, "quote": q}
+
+async def require_ops_key(req: Request) -> Dict[str, Any]:
     body = await req.json()
     if not isinstance(body, dict):
         raise HTTPException(status_code=400, detail="JSON must be object")
@@ -519,9 +2023,41 @@ async def api_reset_lock(req: Request):
         raise HTTPException(status_code=500, detail="OPS_ADMIN_KEY not set")
     if not hmac.compare_digest(k, OPS_ADMIN_KEY):
         raise HTTPException(status_code=403, detail="Forbidden")
+    return body
+
+@app.post("/api/risk/reload")
+async def api_risk_reload(req: Request):
+    await require_ops_key(req)
+    cfg = reload_risk_config()
+    return {"ok": True, "engines": sorted((cfg.get("accounts") or {}).keys())}
+
+@app.post("/api/reset_lock")
+async def api_reset_lock(req: Request):
+    await require_ops_key(req)
     st = set_router_state(None)
     return {"ok": True, "state": st}
 
+@app.get("/metrics")
+def prom_metrics():
+    body = PROM.render()
+    if perf_local is not None:
+        body += perf_local.PROM.render()
+    return Response(body, media_type=PROM_CONTENT_TYPE)
+
+@app.get("/api/debug/timings")
+def api_debug_timings(window_s: int = 300):
+    window_s = max(TIMING_SLOT_S, min(window_s, TIMING_SLOT_S * TIMING_SLOTS))
+    return {"ok": True, "window_s": window_s, "unit": "ms", "stages": TIMINGS.snapshot(window_s)}
+
+@app.get("/api/outbox")
+def api_outbox():
+    return outbox_status()
+
+@app.post("/api/outbox/requeue_dead")
+async def api_outbox_requeue_dead(req: Request):
+    await require_ops_key(req)
+    return {"ok": True, "requeued": outbox_requeue_dead()}
+
 
 # -------------------- Dashboard (Trading Ops) --------------------
 DASH_HTML = r"""
@@ -565,10 +2101,10 @@ DASH_HTML = r"""
 <div class="wrap">
   <h1>TV Webhook — Trading Ops</h1>
   <div class="sub">
-    <span class="pill">Auto refresh ~2s</span>
+    <span class="pill">Live: <span id="mode">-</span></span>
     <span class="pill">Data: last <span id="limit">50</span> events</span>
     <span class="pill">Inactivity alert: <span id="inact">1h</span></span>
-    <span class="pill">Endpoints: <span class="mono">/api/state</span> <span class="mono">/api/events</span> <span class="mono">/api/metrics</span></span>
+    <span class="pill">Endpoints: <span class="mono">/api/stream</span> (fallback <span class="mono">/api/dashboard</span>)</span>
   </div>
 
   <div class="grid">
@@ -589,6 +2125,7 @@ DASH_HTML = r"""
         <div class="k"><div class="t">BUY</div><div class="v" id="k_buy">-</div></div>
         <div class="k"><div class="t">SELL</div><div class="v" id="k_sell">-</div></div>
         <div class="k"><div class="t">Last event age</div><div class="v" id="k_age">-</div></div>
+        <div class="k"><div class="t">Rejected 429</div><div class="v" id="k_rej">-</div></div>
       </div>
 
       <div style="margin-top:14px;" class="muted">Events per minute (last 60 min)</div>
@@ -655,77 +2192,130 @@ function esc(x){
     .replaceAll("'","&#39;");
 }
 
-async function refresh(){
-  try{
-    const [st, evs, met] = await Promise.all([
-      fetchJson("/api/state"),
-      fetchJson(`/api/events?limit=${LIMIT}`),
-      fetchJson(`/api/metrics?limit=${LIMIT}&window_min=${WINDOW_MIN}&inactivity_sec=${INACT_SEC}`)
-    ]);
-
-    document.getElementById("active_engine").textContent = st.active_engine || "-";
-    document.getElementById("updated_at").textContent = st.updated_at || "-";
-
-    document.getElementById("k_total").textContent = met.total;
-    document.getElementById("k_buy").textContent = met.buy;
-    document.getElementById("k_sell").textContent = met.sell;
-    document.getElementById("k_age").textContent = ageFmt(met.last_event_age_sec);
-
-    // per minute compact
-    const keys = Object.keys(met.events_per_min || {}).sort();
-    let per = keys.slice(-30).map(k => `${k}: ${met.events_per_min[k]}`).join("\n");
-    document.getElementById("perMin").textContent = per || "-";
-
-    // engine table
-    const tbody = document.querySelector("#engTable tbody");
-    tbody.innerHTML = "";
-    (met.last_per_engine || []).forEach(r => {
-      const tr = document.createElement("tr");
-      const status = r.status || "STALE";
-      const stBadge = status === "OK" ? "ok" : "stale";
-      const sig = (r.signal||"").toUpperCase();
-      const sigBadge = sig === "BUY" ? "buy" : (sig === "SELL" ? "sell" : "stale");
-      tr.innerHTML = `
-        <td class="mono">${esc(r.engine)}</td>
-        <td><span class="badge ${stBadge}">${esc(status)}</span></td>
-        <td><span class="badge ${sigBadge}">${esc(sig)}</span></td>
-        <td class="mono">${esc(r.symbol)}</td>
-        <td class="mono">${esc(r.tf)}</td>
-        <td class="mono">${esc(r.price)}</td>
-        <td class="mono">${ageFmt(r.age_sec)}</td>
-        <td class="mono">${esc(r.reason)}</td>
-      `;
-      tbody.appendChild(tr);
-    });
+function renderState(st){
+  document.getElementById("active_engine").textContent = st.active_engine || "-";
+  document.getElementById("updated_at").textContent = st.updated_at || "-";
+}
 
-    // events table
-    const evBody = document.querySelector("#evTable tbody");
-    evBody.innerHTML = "";
-    (evs.events || []).slice().reverse().forEach(e => {
-      const tr = document.createElement("tr");
-      const sig = (e.signal||"").toUpperCase();
-      const sigBadge = sig === "BUY" ? "buy" : (sig === "SELL" ? "sell" : "stale");
-      tr.innerHTML = `
-        <td class="mono">${esc(e._ts)}</td>
-        <td class="mono">${esc(e.engine)}</td>
-        <td><span class="badge ${sigBadge}">${esc(sig)}</span></td>
-        <td class="mono">${esc(e.symbol)}</td>
-        <td class="mono">${esc(e.tf)}</td>
-        <td class="mono">${esc(e.price)}</td>
-        <td class="mono">${esc(e.tp)}</td>
-        <td class="mono">${esc(e.sl)}</td>
-        <td class="mono">${esc(e.reason)}</td>
-        <td class="mono">${esc(e._ip)}</td>
-      `;
-      evBody.appendChild(tr);
-    });
+function renderMetrics(met){
+  document.getElementById("k_total").textContent = met.total;
+  document.getElementById("k_buy").textContent = met.buy;
+  document.getElementById("k_sell").textContent = met.sell;
+  document.getElementById("k_age").textContent = ageFmt(met.last_event_age_sec);
+  const adm = met.admission || {};
+  const rej = document.getElementById("k_rej");
+  rej.textContent = adm.rejected_total ?? "-";
+  rej.title = Object.entries(adm.rejected || {}).map(([k, v]) => `${k}: ${v}`).join("\n")
+    + `\ninflight: ${adm.inflight}/${adm.max_inflight}`
+    + (adm.last_rejected_at ? `\nlast: ${adm.last_rejected_at}` : "");
+
+  // per minute compact
+  const keys = Object.keys(met.events_per_min || {}).sort();
+  let per = keys.slice(-30).map(k => `${k}: ${met.events_per_min[k]}`).join("\n");
+  document.getElementById("perMin").textContent = per || "-";
+
+  // engine table
+  const tbody = document.querySelector("#engTable tbody");
+  tbody.innerHTML = "";
+  (met.last_per_engine || []).forEach(r => {
+    const tr = document.createElement("tr");
+    const status = r.status || "STALE";
+    const stBadge = status === "OK" ? "ok" : "stale";
+    const sig = (r.signal||"").toUpperCase();
+    const sigBadge = sig === "BUY" ? "buy" : (sig === "SELL" ? "sell" : "stale");
+    tr.innerHTML = `
+      <td class="mono">${esc(r.engine)}</td>
+      <td><span class="badge ${stBadge}">${esc(status)}</span></td>
+      <td><span class="badge ${sigBadge}">${esc(sig)}</span></td>
+      <td class="mono">${esc(r.symbol)}</td>
+      <td class="mono">${esc(r.tf)}</td>
+      <td class="mono">${esc(r.price)}</td>
+      <td class="mono">${ageFmt(r.age_sec)}</td>
+      <td class="mono">${esc(r.reason)}</td>
+    `;
+    tbody.appendChild(tr);
+  });
+  document.getElementById("refTs").textContent = new Date().toISOString();
+}
+
+// events kept client-side (oldest first) so the stream only sends new ones
+let EVENTS = [];
+
+function renderEvents(){
+  const evBody = document.querySelector("#evTable tbody");
+  evBody.innerHTML = "";
+  EVENTS.slice().reverse().forEach(e => {
+    const tr = document.createElement("tr");
+    const sig = (e.signal||"").toUpperCase();
+    const sigBadge = sig === "BUY" ? "buy" : (sig === "SELL" ? "sell" : "stale");
+    tr.innerHTML = `
+      <td class="mono">${esc(e._ts)}</td>
+      <td class="mono">${esc(e.engine)}</td>
+      <td><span class="badge ${sigBadge}">${esc(sig)}</span></td>
+      <td class="mono">${esc(e.symbol)}</td>
+      <td class="mono">${esc(e.tf)}</td>
+      <td class="mono">${esc(e.price)}</td>
+      <td class="mono">${esc(e.tp)}</td>
+      <td class="mono">${esc(e.sl)}</td>
+      <td class="mono">${esc(e.reason)}</td>
+      <td class="mono">${esc(e._ip)}</td>
+    `;
+    evBody.appendChild(tr);
+  });
+}
 
-    document.getElementById("refTs").textContent = new Date().toISOString();
+let dashEtag = null;
+async function refresh(){
+  try{
+    const headers = dashEtag ? {"If-None-Match": dashEtag} : {};
+    const r = await fetch(`/api/dashboard?limit=${LIMIT}&window_min=${WINDOW_MIN}&inactivity_sec=${INACT_SEC}`, {cache:"no-store", headers});
+    if(r.status === 304) return;
+    const d = await r.json();
+    dashEtag = r.headers.get("ETag");
+    renderState(d.state);
+    renderMetrics(d.metrics);
+    EVENTS = d.events || [];
+    renderEvents();
   } catch (e){
     // ignore
   }
 }
 
+// Live updates via SSE; polling every 2s only while the stream is down
+let pollTimer = null;
+function startPolling(){
+  if(pollTimer) return;
+  document.getElementById("mode").textContent = "polling 2s";
+  refresh();
+  pollTimer = setInterval(refresh, 2000);
+}
+function stopPolling(){
+  if(pollTimer){ clearInterval(pollTimer); pollTimer = null; }
+  document.getElementById("mode").textContent = "stream";
+}
+
+function startStream(){
+  if(!window.EventSource){ startPolling(); return; }
+  const es = new EventSource(`/api/stream?limit=${LIMIT}&window_min=${WINDOW_MIN}&inactivity_sec=${INACT_SEC}`);
+  es.addEventListener("snapshot", m => {
+    const d = JSON.parse(m.data);
+    stopPolling();
+    renderState(d.state);
+    renderMetrics(d.metrics);
+    EVENTS = d.events || [];
+    renderEvents();
+  });
+  es.addEventListener("state", m => renderState(JSON.parse(m.data)));
+  es.addEventListener("metrics", m => renderMetrics(JSON.parse(m.data)));
+  es.addEventListener("evt", m => {
+    EVENTS.push(JSON.parse(m.data));
+    if(EVENTS.length > LIMIT) EVENTS = EVENTS.slice(-LIMIT);
+    renderEvents();
+  });
+  // EventSource reconnects by itself; poll meanwhile
+  es.onerror = () => startPolling();
+}
+
 document.getElementById("resetBtn").addEventListener("click", async () => {
   const k = document.getElementById("opsKey").value.trim();
   if(!k) return;
@@ -737,11 +2327,10 @@ document.getElementById("resetBtn").addEventListener("click", async () => {
     });
     await r.json();
   } catch(e){}
-  refresh();
+  if(pollTimer) refresh();
 });
 
-refresh();
-setInterval(refresh, 2000);
+startStream();
 </script>
 </body>
 </html>